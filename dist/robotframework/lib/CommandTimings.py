@@ -0,0 +1,96 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Robot library reporting the command round trip timings of cmd_timing.
+
+The Record Command Timings keyword (api_shell.keywords.txt) takes the timings
+of every test and, if enabled, records the total round trip times as
+properties. At the end of the run all timings including their phases are
+written to cmd_timings.json in the output directory, unless no commands were
+sent.
+"""
+import json
+import os
+
+from robot.libraries.BuiltIn import BuiltIn
+from robot.version import get_version
+
+from bench_stats import BenchStats
+from cmd_timing import PHASES, TIMINGS, CommandDurations
+
+SUMMARY_FILE = 'cmd_timings.json'
+
+# Statistics of the total round trip time recorded as property
+PROPERTY_STATS = ('mean', 'p50', 'p99', 'max')
+
+
+class CommandTimings:
+    """Records the phase durations of DUT and PHiLIP commands."""
+
+    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+    ROBOT_LIBRARY_VERSION = get_version()
+    ROBOT_LISTENER_API_VERSION = 3
+
+    def __init__(self):
+        self.ROBOT_LIBRARY_LISTENER = self
+        self._run = CommandDurations()
+        self._outdir = BuiltIn().get_variable_value('${OUTPUT DIR}', os.getcwd())
+
+    def take_command_timings(self):
+        """Return the timings of all commands since the last call.
+
+        The phases are only kept for the summary of the run, see
+        write_command_timings().
+
+        :return: Dict of property names cmd-timing-<interface>-<command> and
+                 JSON encoded count and PROPERTY_STATS of the total round trip
+                 times in seconds
+        """
+        timings = TIMINGS.take()
+        self._run.merge(timings)
+        properties = {}
+        for (interface, cmd), samples in timings.items():
+            stats = BenchStats.from_values(samples['total']).to_dict()
+            summary = {'count': stats['samples']}
+            summary.update((name, stats[name]) for name in PROPERTY_STATS)
+            properties['cmd-timing-{}-{}'.format(interface, cmd.replace(' ', '-'))] = json.dumps(summary)
+        return properties
+
+    def write_command_timings(self, path=None):
+        """Write the timings of all commands of the run as JSON.
+
+        Besides the statistics of every command the summary contains the
+        time spent in each phase per interface, sorted by total time.
+
+        :param path:    Output file, defaults to cmd_timings.json in the
+                        output directory
+        """
+        self._run.merge(TIMINGS.take())
+        if path is None:
+            path = os.path.join(self._outdir, SUMMARY_FILE)
+
+        commands = self._run.to_dict()
+        interfaces = {}
+        for interface, cmds in commands.items():
+            totals = interfaces.setdefault(interface, dict.fromkeys(('count', 'time') + PHASES, 0))
+            for summary in cmds.values():
+                totals['count'] += summary['count']
+                totals['time'] += summary['time']
+                for phase in PHASES:
+                    stats = summary['phases'][phase]
+                    totals[phase] += stats['mean'] * stats['samples']
+        interfaces = dict(sorted(interfaces.items(), key=lambda item: -item[1]['time']))
+
+        with open(path, 'w') as summary_file:
+            json.dump({'interfaces': interfaces, 'commands': commands}, summary_file)
+        return path
+
+    # Listener interface
+    def _close(self):
+        # Called once at the end of the run for a global library
+        if self._run.items() or TIMINGS.items():
+            self.write_command_timings()
+
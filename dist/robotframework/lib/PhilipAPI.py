@@ -1,60 +1,282 @@
+import threading
+from ast import literal_eval
+
 import serial
 
 from philip_pal import Phil
 from robot.version import get_version
 
+import cmd_timing
+from trace_stream import TraceStream
+
 
-class PhilipAPI(Phil):
+class PhilipAPI(cmd_timing.TimedCommands, Phil):
     """Robot framework wrapper for PHiLIP"""
     ROBOT_LIBRARY_SCOPE = 'TEST SUITE'
     ROBOT_LIBRARY_VERSION = get_version()
 
     def __init__(self, port, baudrate):
+        # serializes commands of keywords and the trace stream reader thread,
+        # Phil.__init__() already sends commands
+        self._cmd_lock = threading.RLock()
         super().__init__(port, baudrate)
+        self._trace_stream = None
+
+    def send_and_parse_cmd(self, send_cmd, to_byte_array=False, timeout=None):
+        with self._cmd_lock, self._timed_cmd(cmd_timing.cmd_name(send_cmd)):
+            return super().send_and_parse_cmd(send_cmd, to_byte_array, timeout)
+
+    def read_reg(self, cmd_name, offset=0, size=None, to_byte_array=False, timeout=None):
+        # timed as a whole, read_bits() sends several commands
+        with self._cmd_lock, self._timed_cmd('read_reg {}'.format(cmd_name)):
+            return super().read_reg(cmd_name, offset, size, to_byte_array, timeout)
+
+    def write_reg(self, cmd_name, data, offset=0, timeout=None):
+        with self._cmd_lock, self._timed_cmd('write_reg {}'.format(cmd_name)):
+            return super().write_reg(cmd_name, data, offset, timeout)
 
     def setup_uart(self, mode=0, baudrate=115200,
                    databits=serial.EIGHTBITS, parity=serial.PARITY_NONE,
                    stopbits=serial.STOPBITS_ONE, rts=True):
         """Setup tester's UART."""
-        ret = list()
+        regs = dict()
         mode = int(mode)
         assert mode >= 0 and mode < 3, "Invalid mode setting for the if_type"
-        ret.append(self.write_reg('uart.mode.if_type', mode))
-        ret.append(self.write_reg('uart.baud', int(baudrate)))
+        regs['uart.mode.if_type'] = mode
+        regs['uart.baud'] = int(baudrate)
 
         # setup UART control register
         if databits == serial.SEVENBITS:
-            ret.append(self.write_reg('uart.mode.data_bits', 1))
+            regs['uart.mode.data_bits'] = 1
 
         if parity == serial.PARITY_EVEN:
-            ret.append(self.write_reg('uart.mode.parity', 1))
+            regs['uart.mode.parity'] = 1
         elif parity == serial.PARITY_ODD:
-            ret.append(self.write_reg('uart.mode.parity', 2))
+            regs['uart.mode.parity'] = 2
 
         if stopbits == serial.STOPBITS_TWO:
-            ret.append(self.write_reg('uart.mode.stop_bits', 1))
+            regs['uart.mode.stop_bits'] = 1
         # invert RTS level as it is a low active signal
         if not rts:
-            ret.append(self.write_reg('uart.mode.rts', 1))
+            regs['uart.mode.rts'] = 1
 
-        ret.append(self.write_reg('uart.mode.init', 0))
+        regs['uart.mode.init'] = 0
 
         # apply changes
-        ret.append(self.execute_changes())
-        return ret
+        return self.write_regs_and_execute(regs)
 
     def get_counters(self):
         """Get rx/tx counters."""
-        ret = list()
-        ret.append(self.read_reg('uart.rx_count'))
-        ret.append(self.read_reg('uart.tx_count'))
-        return ret
+        return self._split_regs(self.read_regs('uart.rx_count',
+                                               'uart.tx_count'), 2)
 
     def get_error_flags(self):
         """Get error flags."""
-        ret = list()
-        ret.append(self.read_reg('uart.status.pe'))
-        ret.append(self.read_reg('uart.status.fe'))
-        ret.append(self.read_reg('uart.status.nf'))
-        ret.append(self.read_reg('uart.status.ore'))
+        return self._split_regs(self.read_regs('uart.status.pe',
+                                               'uart.status.fe',
+                                               'uart.status.nf',
+                                               'uart.status.ore'), 4)
+
+    # Batched register access
+    #
+    # Registers are resolved to byte ranges of the memory map. Reads of
+    # nearby registers are merged into a single read_bytes command, writes
+    # to adjacent registers (including several bitfields of the same
+    # register) into a single write_bytes command. Bitfields are updated by
+    # read-modify-write of the bytes containing them, all reads needed for
+    # that are batched as well.
+    MAX_READ_BYTES = 4 * (32 + 16)
+    MAX_WRITE_BYTES = 32
+
+    def read_regs(self, *names):
+        """Read several registers with as few commands as possible.
+
+        :param names:   Names of the registers to read, array registers are
+                        read completely
+
+        :return: Response with data being a dict of register name to value
+        """
+        fields = [self._reg_field(name) for name in names]
+        response = self._read_ranges([(f['start'], f['end']) for f in fields])
+        if response['result'] == self.RESULT_SUCCESS:
+            mem = response.pop('mem')
+            response['data'] = {f['name']: self._decode_field(f, mem)
+                                for f in fields}
+        return response
+
+    def write_regs(self, regs=None, **kwregs):
+        """Write several registers with as few commands as possible.
+
+        Registers are written in memory map order, not in argument order.
+
+        :param regs:    Dict of register names to values
+        :param kwregs:  Additional register names and values, as in
+                        ``Write Regs  uart.baud=9600  uart.mode.init=0``
+        """
+        regs = dict(regs or {}, **kwregs)
+        fields = [(self._reg_field(name), literal_eval(str(data)))
+                  for name, data in regs.items()]
+
+        # read back the bytes of bitfields that are only partially written
+        response = self._read_ranges([(f['start'], f['end'])
+                                      for f, _ in fields if f['bits']])
+        if response['result'] != self.RESULT_SUCCESS:
+            return response
+        mem = response.pop('mem')
+        cmds = response['cmd']
+
+        dirty = set()
+        for field, data in fields:
+            self._encode_field(field, data, mem)
+            dirty.update(range(field['start'], field['end']))
+
+        for start, end in self._merge_ranges([(i, i + 1) for i in dirty],
+                                             self.MAX_WRITE_BYTES, gap=0):
+            cmd_info = self.write_bytes(start, [mem[i] for i in range(start, end)])
+            cmds.append(cmd_info['cmd'])
+            if cmd_info['result'] != self.RESULT_SUCCESS:
+                cmd_info['cmd'] = cmds
+                return cmd_info
+
+        return {"cmd": cmds, "result": self.RESULT_SUCCESS}
+
+    def write_regs_and_execute(self, regs=None, **kwregs):
+        """Write several registers and execute changes.
+
+        See write_regs(). Returns the responses of both steps as list.
+        """
+        ret = [self.write_regs(regs, **kwregs)]
+        if ret[0]['result'] == self.RESULT_SUCCESS:
+            ret.append(self.execute_changes())
         return ret
+
+    def _reg_field(self, name):
+        cmd = self.mem_map[name]
+        start = int(cmd['offset'])
+        if cmd['total_size'] != '':
+            size = int(cmd['total_size'])
+        else:
+            size = int(cmd['type_size'])
+        field = {'name': name, 'start': start, 'end': start + size,
+                 'type': cmd['type'], 'type_size': int(cmd['type_size']),
+                 'array': cmd['total_size'] != '', 'bits': None}
+        if cmd['bits'] != '':
+            bit_offset = int(cmd['bit_offset'])
+            bits = int(cmd['bits'])
+            field['bit_offset'] = bit_offset
+            field['bits'] = bits
+            field['end'] = start + int((bits - 1 + bit_offset) / 8 + 1)
+        return field
+
+    @staticmethod
+    def _merge_ranges(ranges, max_size, gap):
+        """Merges sorted byte ranges closer than gap into ranges <= max_size.
+
+        Ranges longer than max_size, e.g. of array registers like trace.tick,
+        are split like Phil.read_trace() does to not overflow PHiLIP's buffer.
+        """
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start - merged[-1][1] <= gap \
+                    and max(end, merged[-1][1]) - merged[-1][0] <= max_size:
+                merged[-1][1] = max(end, merged[-1][1])
+            else:
+                merged.append([start, end])
+        return [[offset, min(offset + max_size, end)]
+                for start, end in merged
+                for offset in range(start, end, max_size)]
+
+    def _read_ranges(self, ranges):
+        """Reads byte ranges, returns a response with mem mapping addresses
+        to byte values."""
+        mem = {}
+        cmds = []
+        for start, end in self._merge_ranges(ranges, self.MAX_READ_BYTES,
+                                             gap=self.MAX_READ_BYTES):
+            cmd_info = self.read_bytes(start, end - start, True)
+            cmds.append(cmd_info['cmd'])
+            if cmd_info['result'] != self.RESULT_SUCCESS:
+                cmd_info['cmd'] = cmds
+                return cmd_info
+            data = cmd_info['data']
+            if not isinstance(data, list):
+                data = [data]
+            mem.update(zip(range(start, end), data))
+        return {"cmd": cmds, "result": self.RESULT_SUCCESS, "mem": mem}
+
+    def _decode_field(self, field, mem):
+        data = [mem[i] for i in range(field['start'], field['end'])]
+        if field['array']:
+            return self._parse_array(data, field['type_size'], field['type'])
+        num = int.from_bytes(bytes(data), byteorder='little')
+        if field['bits']:
+            return (num >> field['bit_offset']) & ((1 << field['bits']) - 1)
+        return self._c_cast(num, field['type'])
+
+    @staticmethod
+    def _encode_field(field, data, mem):
+        start, end = field['start'], field['end']
+        if field['bits']:
+            num = int.from_bytes(bytes(mem[i] for i in range(start, end)),
+                                 byteorder='little')
+            mask = ((1 << field['bits']) - 1) << field['bit_offset']
+            num = (num & ~mask) | ((int(data) << field['bit_offset']) & mask)
+            values = [num]
+            size = end - start
+        elif isinstance(data, list):
+            values = data
+            size = field['type_size']
+        else:
+            values = [data]
+            size = end - start
+        addr = start
+        for value in values:
+            for byte in range(size):
+                mem[addr] = (int(value) >> (byte * 8)) & 0xFF
+                addr += 1
+
+    def _split_regs(self, response, count):
+        """Splits a read_regs() response into one response per register."""
+        if response['result'] != self.RESULT_SUCCESS:
+            return [response] * count
+        return [{"cmd": response['cmd'], "result": response['result'],
+                 "data": data} for data in response['data'].values()]
+
+    def start_trace_stream(self, interval=None):
+        """Start draining the trace buffer into a growing host side buffer.
+
+        Events recorded from now on are collected until stop_trace_stream()
+        is called, lifting the size limit of the PHiLIP trace buffer.
+
+        :param interval:    Drain every interval seconds from a background
+                            thread. If None, drain_trace() has to be called
+                            before the trace buffer overflows.
+        """
+        self.discard_trace_stream()
+        self._trace_stream = TraceStream(self, interval)
+        self._trace_stream.start()
+        return {"cmd": "start_trace_stream({})".format(interval),
+                "result": self.RESULT_SUCCESS}
+
+    def drain_trace(self):
+        """Drain new events of a running trace stream."""
+        assert self._trace_stream is not None, "No trace stream running"
+        return {"cmd": "drain_trace()", "result": self.RESULT_SUCCESS,
+                "data": self._trace_stream.drain()}
+
+    def discard_trace_stream(self):
+        """Stop a trace stream, if any, without returning or checking its events."""
+        stream, self._trace_stream = self._trace_stream, None
+        if stream is not None:
+            stream.close()
+        return {"cmd": "discard_trace_stream()", "result": self.RESULT_SUCCESS}
+
+    def stop_trace_stream(self):
+        """Stop a running trace stream and return all collected events.
+
+        Unlike read_trace() the data is a TRACE_DTYPE array in recording order.
+        """
+        assert self._trace_stream is not None, "No trace stream running"
+        stream, self._trace_stream = self._trace_stream, None
+        return {"cmd": "stop_trace_stream()", "result": self.RESULT_SUCCESS,
+                "data": stream.stop()}
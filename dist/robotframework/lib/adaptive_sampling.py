@@ -0,0 +1,133 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Adaptive repeat counts for benchmarks.
+
+An AdaptiveSampler collects the samples of all repeats of a benchmark and
+decides when enough were collected: as soon as the confidence interval of the
+selected statistic is narrower than the target, or when the time budget or
+the maximum number of repeats is exhausted.
+
+The interval of the mean uses the normal approximation, the interval of a
+percentile the distribution-free order statistic bounds. Both assume that
+the repeats together contain at least a few dozen samples.
+"""
+import math
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+
+class AdaptiveSampler:
+    """Decides how often a benchmark has to be repeated.
+
+    :param target:      Maximum half width of the confidence interval relative
+                        to the estimate, e.g. 0.01 for +-1 %
+    :param statistic:   'mean' or a percentile like 'p50' or 'p99'
+    :param confidence:  Confidence level of the interval
+    :param budget:      Time budget in seconds, None for no limit
+    :param min_repeats: Minimum number of repeats
+    :param max_repeats: Maximum number of repeats, None for no limit
+    """
+
+    def __init__(self, target=0.01, statistic='mean', confidence=0.95,
+                 budget=None, min_repeats=2, max_repeats=None):
+        self.target = float(target)
+        self.statistic = str(statistic).strip().lower()
+        self.confidence = float(confidence)
+        self.budget = None if budget in (None, '', 'None') else float(budget)
+        self.min_repeats = int(min_repeats)
+        self.max_repeats = None if max_repeats in (None, '', 'None') else int(max_repeats)
+
+        if self.statistic != 'mean' and not self.statistic.startswith('p'):
+            raise ValueError("statistic must be 'mean' or a percentile like 'p99'")
+
+        self.repeats = 0
+        self._samples = []
+        self._start = time.monotonic()
+
+    @property
+    def samples(self):
+        """All samples collected so far as float64 array."""
+        if not self._samples:
+            return np.zeros(0)
+        return np.concatenate(self._samples)
+
+    @property
+    def elapsed(self):
+        """Time in seconds since sampling started."""
+        return time.monotonic() - self._start
+
+    def add(self, values):
+        """Adds the samples of one benchmark repeat."""
+        self._samples.append(np.asarray(values, dtype=np.float64).ravel())
+        self.repeats += 1
+
+    def interval(self):
+        """Returns the estimate of the statistic and its confidence interval.
+
+        :return: Tuple (estimate, low, high), NaN if there are too few samples
+        """
+        data = self.samples
+        if len(data) < 2:
+            return (math.nan, math.nan, math.nan)
+
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        if self.statistic == 'mean':
+            estimate = float(data.mean())
+            half_width = z * float(data.std(ddof=1)) / math.sqrt(len(data))
+            return (estimate, estimate - half_width, estimate + half_width)
+
+        quantile = float(self.statistic[1:]) / 100
+        data = np.sort(data)
+        n = len(data)
+        spread = z * math.sqrt(n * quantile * (1 - quantile))
+        low = max(int(math.floor(n * quantile - spread)), 0)
+        high = min(int(math.ceil(n * quantile + spread)), n - 1)
+        return (float(np.quantile(data, quantile)), float(data[low]), float(data[high]))
+
+    def relative_half_width(self):
+        """Half width of the confidence interval relative to the estimate."""
+        estimate, low, high = self.interval()
+        if math.isnan(estimate):
+            return math.inf
+        if estimate == 0:
+            return 0.0 if high == low else math.inf
+        return (high - low) / 2 / abs(estimate)
+
+    def reason(self):
+        """Returns why sampling should stop, None to continue."""
+        if self.repeats < self.min_repeats:
+            return None
+        if self.relative_half_width() <= self.target:
+            return 'converged'
+        if self.max_repeats is not None and self.repeats >= self.max_repeats:
+            return 'max_repeats'
+        if self.budget is not None and self.elapsed >= self.budget:
+            return 'budget'
+        return None
+
+    def done(self):
+        """Returns True if no more repeats are needed."""
+        return self.reason() is not None
+
+    def result(self):
+        """Returns the achieved confidence interval as dict."""
+        estimate, low, high = self.interval()
+        return {
+            'statistic': self.statistic,
+            'confidence': self.confidence,
+            'estimate': estimate,
+            'ci_low': low,
+            'ci_high': high,
+            'rel_half_width': self.relative_half_width(),
+            'target': self.target,
+            'repeats': self.repeats,
+            'samples': len(self.samples),
+            'elapsed': self.elapsed,
+            'reason': self.reason() or 'aborted',
+        }
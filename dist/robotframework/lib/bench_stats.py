@@ -0,0 +1,224 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Mergeable statistics of benchmark samples.
+
+BenchStats keeps the count, mean and variance of all samples (Welford) and a
+QuantileSketch, a histogram with logarithmically sized buckets that returns
+percentiles with a bounded relative error (see DDSketch). Both can be merged,
+so the statistics of several repeats, shards or boards are combined without
+keeping the raw samples.
+
+BenchStats.to_dict() returns the summary recorded as benchmark property,
+including the serialized state to restore it with BenchStats.from_dict().
+Its content only consists of numbers, strings, lists and dicts, so the
+recorded property can still be parsed as JSON by the plotters.
+"""
+import math
+
+import numpy as np
+
+
+PERCENTILES = (50, 90, 99, 99.9)
+HISTOGRAM_BINS = 20
+# Samples outside [p25 - k * IQR, p75 + k * IQR] are counted as outliers
+OUTLIER_IQR_FACTOR = 1.5
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative accuracy alpha.
+
+    Values are counted in buckets [gamma^(i-1), gamma^i) with
+    gamma = (1 + alpha) / (1 - alpha), negative values in mirrored buckets.
+    Every quantile is returned with a relative error of at most alpha.
+    """
+
+    def __init__(self, alpha=0.01):
+        self.alpha = float(alpha)
+        self._gamma_ln = math.log((1 + self.alpha) / (1 - self.alpha))
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+
+    @property
+    def count(self):
+        """Number of values added to the sketch."""
+        return self.zero + sum(self.positive.values()) + sum(self.negative.values())
+
+    def add(self, values):
+        """Adds an array of values."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.zero += int(np.count_nonzero(values == 0))
+        for store, part in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            if len(part) == 0:
+                continue
+            index, counts = np.unique(np.ceil(np.log(part) / self._gamma_ln).astype(np.int64), return_counts=True)
+            for i, count in zip(index.tolist(), counts.tolist()):
+                store[i] = store.get(i, 0) + count
+
+    def merge(self, other):
+        """Adds all values of another sketch with the same accuracy."""
+        if other.alpha != self.alpha:
+            raise ValueError("Can not merge sketches with different accuracy")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for i, count in other_store.items():
+                store[i] = store.get(i, 0) + count
+        self.zero += other.zero
+
+    def buckets(self):
+        """Returns the representative values and counts of all buckets in ascending order."""
+        gamma = math.exp(self._gamma_ln)
+        values = [-2 * gamma ** i / (gamma + 1) for i in sorted(self.negative, reverse=True)]
+        counts = [self.negative[i] for i in sorted(self.negative, reverse=True)]
+        if self.zero:
+            values.append(0.0)
+            counts.append(self.zero)
+        values += [2 * gamma ** i / (gamma + 1) for i in sorted(self.positive)]
+        counts += [self.positive[i] for i in sorted(self.positive)]
+        return np.asarray(values, dtype=np.float64), np.asarray(counts, dtype=np.int64)
+
+    def quantile(self, q):
+        """Returns the estimated q-quantile, q in [0, 1]."""
+        values, counts = self.buckets()
+        if len(values) == 0:
+            return math.nan
+        rank = q * (counts.sum() - 1)
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side='right')])
+
+    def to_dict(self):
+        """Returns the state of the sketch, buckets as [index, count] pairs."""
+        return {
+            'alpha': self.alpha,
+            'zero': self.zero,
+            'positive': [[i, c] for i, c in sorted(self.positive.items())],
+            'negative': [[i, c] for i, c in sorted(self.negative.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Restores a sketch from to_dict()."""
+        sketch = cls(state['alpha'])
+        sketch.zero = int(state['zero'])
+        sketch.positive = {int(i): int(c) for i, c in state['positive']}
+        sketch.negative = {int(i): int(c) for i, c in state['negative']}
+        return sketch
+
+
+class BenchStats:
+    """Mergeable summary statistics of benchmark samples."""
+
+    def __init__(self, alpha=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(alpha)
+
+    @classmethod
+    def from_values(cls, values, alpha=0.01):
+        """Returns the statistics of an array of samples."""
+        stats = cls(alpha)
+        stats.add(values)
+        return stats
+
+    def add(self, values):
+        """Adds an array of samples."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        other = BenchStats(self.sketch.alpha)
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        other.sketch.add(values)
+        self.merge(other)
+
+    def merge(self, other):
+        """Adds all samples of other, see Chan et al. for the variance."""
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def stdev(self):
+        """Sample standard deviation."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def percentile(self, p):
+        """Returns the estimated p-th percentile, clamped to min and max."""
+        if self.count == 0:
+            return math.nan
+        return min(max(self.sketch.quantile(p / 100), self.min), self.max)
+
+    def histogram(self, bins=HISTOGRAM_BINS):
+        """Returns equally sized bins between min and max as dict of edges and counts."""
+        if self.count == 0:
+            return {'edges': [], 'counts': []}
+        values, counts = self.sketch.buckets()
+        hist, edges = np.histogram(np.clip(values, self.min, self.max), bins=bins,
+                                   range=(self.min, self.max), weights=counts)
+        return {'edges': edges.tolist(), 'counts': hist.astype(np.int64).tolist()}
+
+    def outliers(self, factor=OUTLIER_IQR_FACTOR):
+        """Returns the estimated number of samples outside the Tukey fences."""
+        if self.count == 0:
+            return 0
+        p25, p75 = self.percentile(25), self.percentile(75)
+        low, high = p25 - factor * (p75 - p25), p75 + factor * (p75 - p25)
+        values, counts = self.sketch.buckets()
+        return int(counts[(values < low) | (values > high)].sum())
+
+    def to_dict(self):
+        """Returns the summary statistics and the state needed to merge them."""
+        summary = {
+            'min': self.min,
+            'max': self.max,
+            'avg': self.mean,
+            'mean': self.mean,
+            'stdev': self.stdev,
+        }
+        for p in PERCENTILES:
+            summary['p{:g}'.format(p)] = self.percentile(p)
+        summary.update({
+            'histogram': self.histogram(),
+            'outliers': self.outliers(),
+            'samples': self.count,
+            'm2': self.m2,
+            'sketch': self.sketch.to_dict(),
+        })
+        return summary
+
+    @classmethod
+    def from_dict(cls, summary):
+        """Restores statistics from to_dict()."""
+        stats = cls(summary['sketch']['alpha'])
+        stats.count = int(summary['samples'])
+        stats.mean = float(summary['mean'])
+        stats.m2 = float(summary['m2'])
+        stats.min = float(summary['min'])
+        stats.max = float(summary['max'])
+        stats.sketch = QuantileSketch.from_dict(summary['sketch'])
+        return stats
+
+
+def merge_stats(summaries):
+    """Merges recorded statistics dicts, returns a BenchStats instance."""
+    merged = None
+    for summary in summaries:
+        stats = BenchStats.from_dict(summary)
+        merged = stats if merged is None else merged.merge(stats)
+    return merged if merged is not None else BenchStats()
@@ -0,0 +1,198 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Round trip timing of the serial commands of DUT and PHiLIP interfaces.
+
+Every command is split into four phases:
+
+    write   Writing the command to the serial port
+    wait    Waiting for the first byte of the reply, i.e. the transfer of the
+            command and its execution on the device
+    read    Reading the reply lines
+    parse   Everything else on the host, mostly parsing the reply
+
+To separate wait and read, the readline() and write() methods of the serial
+port of an interface are wrapped while a command is timed. The durations of
+all commands are collected per interface and command name in the process wide
+TIMINGS and summarized as mergeable BenchStats, see the CommandTimings
+library.
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from bench_stats import BenchStats
+
+
+PHASES = ('write', 'wait', 'read', 'parse')
+
+
+class CommandDurations:
+    """Phase durations of commands, keyed by interface and command name.
+
+    The durations are kept as lists, appending is cheap compared to a
+    command round trip. Statistics are calculated by stats() and to_dict().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def add(self, interface, cmd, phases):
+        """Adds the phase durations of a command.
+
+        :param phases:  Dict of the durations of PHASES and the total in seconds
+        """
+        with self._lock:
+            samples = self._samples.setdefault((interface, cmd), {
+                phase: [] for phase in PHASES + ('total',)})
+            for phase, duration in phases.items():
+                samples[phase].append(duration)
+
+    def merge(self, other):
+        """Adds all durations of another CommandDurations instance."""
+        for key, samples in other.items():
+            with self._lock:
+                own = self._samples.setdefault(key, {phase: [] for phase in samples})
+                for phase, durations in samples.items():
+                    own[phase].extend(durations)
+        return self
+
+    def items(self):
+        """Returns a sorted list of ((interface, cmd), {phase: [durations]})."""
+        with self._lock:
+            return sorted((key, {phase: list(durations) for phase, durations in samples.items()})
+                          for key, samples in self._samples.items())
+
+    def take(self):
+        """Removes all durations and returns them as new CommandDurations."""
+        taken = CommandDurations()
+        with self._lock:
+            taken._samples, self._samples = self._samples, {}
+        return taken
+
+    def stats(self):
+        """Returns a list of ((interface, cmd), {phase: BenchStats})."""
+        return [(key, {phase: BenchStats.from_values(durations) for phase, durations in samples.items()})
+                for key, samples in self.items()]
+
+    def to_dict(self):
+        """Returns {interface: {cmd: summary}}, see summarize()."""
+        timings = {}
+        for (interface, cmd), stats in self.stats():
+            timings.setdefault(interface, {})[cmd] = summarize(stats)
+        return timings
+
+
+def summarize(stats):
+    """Returns the count, the total time and the statistics of all phases.
+
+    :param stats:   Dict of BenchStats of PHASES and the total
+    """
+    return {
+        'count': stats['total'].count,
+        'time': stats['total'].mean * stats['total'].count,
+        'phases': {phase: phase_stats.to_dict() for phase, phase_stats in stats.items()},
+    }
+
+
+# Timings of all commands of this process
+TIMINGS = CommandDurations()
+
+
+def cmd_name(cmd):
+    """Returns the name of a shell command without its arguments."""
+    return str(cmd).split(' ', 1)[0]
+
+
+class TimedCommands:
+    """Mixin timing the serial commands of an interface.
+
+    Subclasses wrap every command in _timed_cmd(). Nested commands, e.g. the
+    reads of PhilipAPI.read_reg() within write_reg(), count to the outermost.
+    Commands of other threads, e.g. a PHiLIP trace stream, are timed
+    separately.
+    """
+
+    def _timed_cmd(self, name):
+        """Context timing a command.
+
+        :param name:    Name the timing is recorded under, see cmd_name()
+        """
+        if self._cmd_timer().phases is not None:
+            return nullcontext()
+        return self._time_cmd(name)
+
+    def _cmd_timer(self):
+        """Returns the timing state of the current thread."""
+        timer = self.__dict__.setdefault('_cmd_timer_local', threading.local())
+        if not hasattr(timer, 'phases'):
+            timer.phases = None
+            timer.first_byte = False
+        return timer
+
+    @contextmanager
+    def _time_cmd(self, name):
+        self._wrap_port(self._timed_port())
+        timer = self._cmd_timer()
+        timer.phases = phases = dict.fromkeys(PHASES[:-1], 0.0)
+        timer.first_byte = False
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases['total'] = time.perf_counter() - start
+            phases['parse'] = max(phases['total'] - sum(phases[phase] for phase in PHASES[:-1]), 0.0)
+            timer.phases = None
+            TIMINGS.add(type(self).__name__, name, phases)
+
+    def _timed_port(self):
+        """Returns the pyserial port of the interface, None if there is none."""
+        # pylint: disable=W0212
+        driver = getattr(getattr(self, 'dev', None), '_driver', None)
+        return getattr(driver, '_dev', None)
+
+    def _wrap_port(self, port):
+        # The driver opens a new port after a timeout, wrap it again
+        if port is None or getattr(port, '_cmd_timing', None) is self:
+            return
+        write, readline, read = port.write, port.readline, port.read
+
+        def timed_write(data):
+            phases = self._cmd_timer().phases
+            if phases is None:
+                return write(data)
+            start = time.perf_counter()
+            try:
+                return write(data)
+            finally:
+                phases['write'] += time.perf_counter() - start
+
+        def timed_readline(*args, **kwargs):
+            timer = self._cmd_timer()
+            if timer.phases is None:
+                return readline(*args, **kwargs)
+            start = time.perf_counter()
+            if timer.first_byte:
+                try:
+                    return readline(*args, **kwargs)
+                finally:
+                    timer.phases['read'] += time.perf_counter() - start
+            first = read(1)
+            received = time.perf_counter()
+            timer.phases['wait'] += received - start
+            if not first or first == b'\n':
+                return first
+            timer.first_byte = True
+            try:
+                return first + readline(*args, **kwargs)
+            finally:
+                timer.phases['read'] += time.perf_counter() - received
+
+        port.write = timed_write
+        port.readline = timed_readline
+        port._cmd_timing = self
+
@@ -0,0 +1,140 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Pipelined execution of shell commands for DutShell based interfaces.
+
+DutShell.send_cmd() writes a command and blocks until its reply was parsed,
+so every call pays the full serial round trip. PipelinedDutShell writes the
+next commands while the DUT still executes the current one and parses the
+replies in order as they arrive.
+
+Commands written ahead wait in the stdin buffer of the DUT. The number of
+bytes in flight is limited by PIPELINE_MAX_BYTES to not overflow it. Note
+that receiving them triggers UART interrupts on the DUT while it executes the
+current command.
+"""
+import json
+import logging
+from collections import deque
+
+from riot_pal.dut_shell import JSONParser, RESULT_SUCCESS, RESULT_TIMEOUT
+
+from cmd_timing import cmd_name
+from dut_sync import SyncDutShell
+
+
+class PipelinedDutShell(SyncDutShell):
+    """DutShell that can send a batch of commands pipelined."""
+
+    # Size of the DUT stdin buffer (STDIO_UART_RX_BUFSIZE)
+    PIPELINE_MAX_BYTES = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._captured_cmds = None
+
+    def send_cmd(self, cmd_to_send, *args, **kwargs):
+        if self._captured_cmds is not None:
+            self._captured_cmds.append(cmd_to_send)
+            return {'cmd': cmd_to_send, 'result': RESULT_SUCCESS}
+        return super().send_cmd(cmd_to_send, *args, **kwargs)
+
+    def send_cmds(self, cmds, max_bytes=None):
+        """Send shell commands pipelined and return their replies in order.
+
+        Falls back to sending the commands one by one if the parser or
+        driver does not support pipelining. After a timeout the remaining
+        commands are not sent and reported as timed out.
+
+        :param cmds:        List of shell command strings
+        :param max_bytes:   Maximum number of command bytes in flight, the
+                            first command is always sent
+
+        :return: List of parsed replies, see DutShell.send_cmd()
+        """
+        # SerialDriver.write() resets the input buffer before every write,
+        # which would drop replies of commands in flight. Write to the
+        # underlying serial port instead.
+        # pylint: disable=W0212
+        port = getattr(self.dev._driver, '_dev', None)
+        if not isinstance(self.parser, JSONParser) or port is None:
+            return [self.send_cmd(cmd) for cmd in cmds]
+
+        max_bytes = int(max_bytes or self.PIPELINE_MAX_BYTES)
+        pending = deque((cmd + '\n').encode('utf-8') for cmd in cmds)
+        in_flight = deque()
+        replies = []
+
+        port.reset_input_buffer()
+        while pending or in_flight:
+            cmd = (in_flight or pending)[0].decode('utf-8').rstrip('\n')
+            # The commands written ahead count to the write phase of cmd
+            with self._timed_cmd(cmd_name(cmd)):
+                while pending and (not in_flight or sum(map(len, in_flight)) + len(pending[0]) <= max_bytes):
+                    data = pending.popleft()
+                    logging.debug("Sending: %s", data.decode('utf-8').rstrip('\n'))
+                    port.write(data)
+                    in_flight.append(data)
+
+                in_flight.popleft()
+                reply = self._read_reply(cmd)
+            replies.append(reply)
+
+            if reply['result'] == RESULT_TIMEOUT:
+                # The driver reconnected, replies of other commands are lost
+                for data in list(in_flight) + list(pending):
+                    replies.append({'cmd': data.decode('utf-8').rstrip('\n'), 'result': RESULT_TIMEOUT})
+                break
+
+        return replies
+
+    def pipeline_calls(self, calls, max_bytes=None):
+        """Execute interface calls pipelined.
+
+        Each call must send exactly one shell command and return its reply
+        unchanged, as e.g. ``bench_parallel_callbacks`` does.
+
+        :param calls:       List of calls, each a list of the keyword or
+                            method name followed by its arguments
+        :param max_bytes:   See send_cmds()
+
+        :return: Dict with the replies as data and the first non successful
+                 result, or Success if all calls succeeded
+        """
+        cmds = []
+        for call in calls:
+            name, args = call[0], call[1:]
+            method = getattr(self, name.split('.')[-1].strip().lower().replace(' ', '_'))
+
+            self._captured_cmds = captured = []
+            try:
+                method(*args)
+            finally:
+                self._captured_cmds = None
+            if len(captured) != 1:
+                raise ValueError("{} sends {} commands and can not be pipelined".format(name, len(captured)))
+            cmds.extend(captured)
+
+        replies = self.send_cmds(cmds, max_bytes)
+        result = next((reply['result'] for reply in replies if reply['result'] != RESULT_SUCCESS), RESULT_SUCCESS)
+        return {'cmd': cmds, 'result': result, 'data': replies}
+
+    def _read_reply(self, cmd, end_key='result'):
+        """Parses the reply of a command like JSONParser without writing."""
+        cmd_info = {'cmd': cmd}
+        while end_key not in cmd_info:
+            line = ""
+            try:
+                # pylint: disable=W0212
+                line = self.dev._readline()
+                cmd_info.update(json.loads(line))
+            except json.decoder.JSONDecodeError:
+                if 'msg' not in cmd_info:
+                    cmd_info['msg'] = []
+                cmd_info['msg'].append(line)
+            except TimeoutError:
+                cmd_info['result'] = RESULT_TIMEOUT
+        return cmd_info
@@ -0,0 +1,144 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Shell synchronization and per-command timeouts for DutShell based interfaces.
+
+After a reset the DUT needs some time until its shell accepts commands.
+Instead of sending a command and waiting out the full command timeout until
+the DUT answers, SyncDutShell.wait_for_shell() polls the serial port in short
+intervals, reprobes as soon as the boot banner or the shell prompt shows up
+and returns right after the first reply.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from riot_pal import DutShell
+from riot_pal.dut_shell import JSONParser, RESULT_TIMEOUT
+
+from cmd_timing import TimedCommands, cmd_name
+
+
+class SyncDutShell(TimedCommands, DutShell):
+    """DutShell that can wait for the shell and supports command timeouts."""
+
+    # Lines printed by RIOT on boot, replies to earlier probes are lost
+    BOOT_MARKERS = ('This is RIOT!',)
+    # Shell prompt, printed without a trailing newline
+    PROMPT = b'> '
+
+    # Interval in seconds to resend the probe if the DUT stays silent
+    PROBE_INTERVAL = 0.25
+    # Read timeout in seconds while waiting for the shell
+    POLL_INTERVAL = 0.01
+    # Default wait time in command timeouts, see API Call Repeat on Timeout
+    SYNC_TIMEOUTS = 16
+
+    def send_cmd(self, cmd_to_send, *args, timeout=None, **kwargs):
+        """Send a shell command and parse its reply.
+
+        :param timeout: Time in seconds to wait for the reply, defaults to
+                        the timeout of the interface
+        """
+        with self._cmd_timeout(timeout), self._timed_cmd(cmd_name(cmd_to_send)):
+            return super().send_cmd(cmd_to_send, *args, **kwargs)
+
+    @contextmanager
+    def _cmd_timeout(self, timeout):
+        """Context changing the serial read timeout, None keeps it as is."""
+        port = self._port()
+        if timeout is None or port is None:
+            yield
+            return
+
+        old_timeout = port.timeout
+        port.timeout = float(timeout)
+        try:
+            yield
+        finally:
+            # The driver reconnects after a timeout, restore the new port too
+            port = self._port()
+            if port is not None:
+                port.timeout = old_timeout
+
+    def wait_for_shell(self, timeout=None, cmd='get_metadata'):
+        """Wait until the DUT shell replies to a command.
+
+        :param timeout: Maximum time in seconds to wait, defaults to
+                        SYNC_TIMEOUTS command timeouts
+        :param cmd:     Command used to probe the shell
+
+        :return: Parsed reply to the probe, see DutShell.send_cmd()
+        """
+        port = self._port()
+        if timeout is None:
+            timeout = self.SYNC_TIMEOUTS * (port.timeout if port else 1)
+        deadline = time.monotonic() + float(timeout)
+
+        if not isinstance(self.parser, JSONParser) or port is None:
+            reply = {'cmd': cmd, 'result': RESULT_TIMEOUT}
+            while reply['result'] == RESULT_TIMEOUT and time.monotonic() < deadline:
+                reply = self.send_cmd(cmd, timeout=self.PROBE_INTERVAL)
+            return reply
+
+        with self._cmd_timeout(self.POLL_INTERVAL):
+            return self._poll_shell(self._port(), cmd, deadline)
+
+    def _poll_shell(self, port, cmd, deadline):
+        reply = {'cmd': cmd}
+        pending = b''
+        probes = 0
+        next_probe = time.monotonic()
+
+        port.reset_input_buffer()
+        while time.monotonic() < deadline:
+            if time.monotonic() >= next_probe:
+                logging.debug("Sending: %s", cmd)
+                port.write((cmd + '\n').encode('utf-8'))
+                probes += 1
+                next_probe = time.monotonic() + self.PROBE_INTERVAL
+
+            pending += port.read(port.in_waiting or 1)
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                line = line.decode('utf-8', errors='ignore')
+                logging.debug("Response: %s", line)
+                if any(marker in line for marker in self.BOOT_MARKERS):
+                    reply, probes, next_probe = {'cmd': cmd}, 0, time.monotonic()
+                    continue
+                try:
+                    reply.update(json.loads(line))
+                except (ValueError, TypeError):
+                    reply.setdefault('msg', []).append(line + '\n')
+                    continue
+                if 'result' in reply:
+                    self._drain_replies(port, probes - 1)
+                    return reply
+
+            if pending.endswith(self.PROMPT):
+                # The shell is ready, probes sent before may have been lost
+                pending = b''
+                next_probe = min(next_probe, time.monotonic())
+
+        reply['result'] = RESULT_TIMEOUT
+        return reply
+
+    def _drain_replies(self, port, count):
+        """Discard the replies to count more probes still in flight."""
+        silent_until = time.monotonic() + self.PROBE_INTERVAL
+        pending = b''
+        while count > 0 and time.monotonic() < silent_until:
+            data = port.read(port.in_waiting or 1)
+            if data:
+                silent_until = time.monotonic() + self.PROBE_INTERVAL
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            count -= sum(1 for line in lines if b'"result"' in line)
+
+    def _port(self):
+        # pylint: disable=W0212
+        return getattr(self.dev._driver, '_dev', None)
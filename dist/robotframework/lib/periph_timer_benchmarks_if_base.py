@@ -7,17 +7,29 @@
 This module handles parsing of information from periph_utimer_benchmarks suite.
 """
 import logging
+import os
 import numpy as np
 
-from riot_pal import DutShell
+from adaptive_sampling import AdaptiveSampler
+from bench_stats import BenchStats
+from dut_pipeline import PipelinedDutShell
 from robot.libraries.BuiltIn import BuiltIn
 
+from trace_encoding import TRACE_SOURCES, TRACE_EVENTS, TRACE_DTYPE, TRACE_ENCODINGS
+from trace_encoding import encode_trace, trace_to_array
 
-class PeriphUTimerBenchmarksIfBase(DutShell):
+
+class PeriphUTimerBenchmarksIfBase(PipelinedDutShell):
     """Common interface to the a node with a periph timer benchmarking firmware."""
 
     FW_ID = None
 
+    _SOURCE_CODES = {name: code for code, name in enumerate(TRACE_SOURCES)}
+    _EVENT_CODES = {name: code for code, name in enumerate(TRACE_EVENTS)}
+
+    # Active AdaptiveSampler, fed by all processed benchmark results
+    _sampler = None
+
     # Benchmark calls
     def bench_gpio_latency(self, timeout_us=1):
         """Execute GPIO latency benchmark."""
@@ -27,14 +39,14 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from GPIO latency benchmark."""
         timeout_s = timeout_us * 1e-6
         # Extract diffs between edges and remove intermediate wait period from results
-        edge_diffs_with_delay = [x['diff'] for x in trace if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING" and
-            1e-9 < x['diff'] < (1e-5 + timeout_s)
-        ]
+        edge_diffs_with_delay = self._select_edge_diffs(
+            trace,
+            min_diff=1e-9,
+            max_diff=1e-5 + timeout_s
+        )
 
         edge_delay = timeout_s
-        edge_diffs = [x - edge_delay for x in edge_diffs_with_delay]
+        edge_diffs = edge_diffs_with_delay - edge_delay
 
         return self._calc_statistical_properties(edge_diffs)
 
@@ -58,14 +70,10 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from timer read benchmark."""
 
         # Select benchmark samples from trace
-        edges = trace[2:]
+        edges = self._trace_to_array(trace)[2:]
 
         # Extract timer read durations (time between rising and falling edge)
-        read_durations = [x['diff'] for x in edges if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING" and
-            x['diff'] < 1e-3
-        ]
+        read_durations = self._select_edge_diffs(edges, max_diff=1e-3)
 
         return self._calc_statistical_properties(read_durations)
 
@@ -89,14 +97,10 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from timer write benchmark."""
 
         # Select benchmark samples from trace
-        edges = trace[2:]
+        edges = self._trace_to_array(trace)[2:]
 
         # Extract timer write durations (time between rising and falling edge)
-        write_durations = [x['diff'] for x in edges if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING" and
-            x['diff'] < 1e-3
-        ]
+        write_durations = self._select_edge_diffs(edges, max_diff=1e-3)
 
         return self._calc_statistical_properties(write_durations)
 
@@ -120,14 +124,10 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from timer set benchmark."""
 
         # Select benchmark samples from trace
-        edges = trace[2:]
+        edges = self._trace_to_array(trace)[2:]
 
         # Extract timer set durations (time between rising and falling edge)
-        set_durations = [x['diff'] for x in edges if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING" and
-            x['diff'] < 1e-3
-        ]
+        set_durations = self._select_edge_diffs(edges, max_diff=1e-3)
 
         return self._calc_statistical_properties(set_durations)
 
@@ -151,14 +151,10 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from timer clear benchmark."""
 
         # Select benchmark samples from trace
-        edges = trace[2:]
+        edges = self._trace_to_array(trace)[2:]
 
         # Extract timer clear durations (time between rising and falling edge)
-        clear_durations = [x['diff'] for x in edges if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING" and
-            x['diff'] < 1e-3
-        ]
+        clear_durations = self._select_edge_diffs(edges, max_diff=1e-3)
 
         return self._calc_statistical_properties(clear_durations)
 
@@ -174,10 +170,7 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from absolute timeout benchmark."""
 
         # Extract recorded timeout durations (time between rising and falling edge)
-        timeout_durations = [x['diff'] for x in trace if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING"
-        ]
+        timeout_durations = self._select_edge_diffs(trace)
 
         return self._calc_statistical_properties(timeout_durations)
 
@@ -194,10 +187,7 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from periodic timeout benchmark."""
 
         # Extract recorded timeout durations (time between rising and falling edge)
-        timeout_durations = [x['diff'] for x in trace if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING"
-        ]
+        timeout_durations = self._select_edge_diffs(trace)
 
         return self._calc_statistical_properties(timeout_durations)
 
@@ -214,10 +204,7 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
         """Postprocess trace data from parallel callbacks benchmark."""
 
         # Extract recorded timeout durations (time between rising and falling edge)
-        timeout_durations = [x['diff'] for x in trace if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING"
-        ]
+        timeout_durations = self._select_edge_diffs(trace)
 
         return self._calc_statistical_properties(timeout_durations)
 
@@ -243,11 +230,7 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
 
         :return:    True if spin timeout was within acceptable range
         """
-        durations_ms = [x['diff']*1e3 for x in trace if
-            x['source'] == "DUT_IC" and
-            x['event'] == "FALLING" and
-            x['diff'] < 2  # seconds
-        ]
+        durations_ms = self._select_edge_diffs(trace, max_diff=2) * 1e3  # seconds
 
         if len(durations_ms) == 0:
             if abort_on_error:
@@ -275,6 +258,47 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
 
         return True
 
+    def start_adaptive_sampling(self, target=0.01, statistic='mean', confidence=0.95,
+                                budget=None, min_repeats=2, max_repeats=None):
+        """Start collecting the samples of all processed benchmark results.
+
+        See AdaptiveSampler for a description of the parameters.
+        """
+        self._sampler = AdaptiveSampler(target, statistic, confidence, budget, min_repeats, max_repeats)
+
+    def adaptive_sampling_done(self):
+        """Returns True if the benchmark does not need to be repeated again."""
+        if self._sampler is None:
+            raise RuntimeError("Adaptive sampling was not started")
+        return self._sampler.done()
+
+    def stop_adaptive_sampling(self):
+        """Stop adaptive sampling and return the achieved confidence interval."""
+        if self._sampler is None:
+            raise RuntimeError("Adaptive sampling was not started")
+        result, self._sampler = self._sampler.result(), None
+        return result
+
+    def encode_trace(self, trace):
+        """Encode a PHiLIP trace for recording it as property.
+
+        The encoding is selected by the BENCH_TRACE_ENCODING environment
+        variable: 'repr' (default) returns the trace unchanged, 'base64' and
+        'npy' return a compact string decodable by trace_encoding.decode_trace.
+        Sidecar files of the 'npy' encoding are written below ${OUTPUT DIR}.
+
+        :param trace:   PHiLIP trace data
+        """
+        encoding = os.environ.get('BENCH_TRACE_ENCODING', 'repr').strip() or 'repr'
+        if encoding not in TRACE_ENCODINGS:
+            raise ValueError("BENCH_TRACE_ENCODING must be one of {}".format(TRACE_ENCODINGS))
+
+        basedir = None
+        if encoding == 'npy':
+            basedir = BuiltIn().get_variable_value('${OUTPUT DIR}')
+
+        return encode_trace(trace, encoding, basedir)
+
     def get_command_list(self):
         """List of all commands."""
         return [
@@ -284,15 +308,56 @@ class PeriphUTimerBenchmarksIfBase(DutShell):
 
     # Helper functions
     @staticmethod
-    def _calc_statistical_properties(data):
-        return {
-            'min': np.min(data),
-            'max': np.max(data),
-            'avg': np.average(data),
-            'mean': np.mean(data),
-            'values': data,
-            'samples': len(data)
-        }
+    def _trace_to_array(trace):
+        """Converts a PHiLIP trace (list of event dicts) into a TRACE_DTYPE array.
+
+        Traces that already are structured arrays are returned unchanged.
+        """
+        return trace_to_array(trace)
+
+    @classmethod
+    def _select_edges(cls, trace, source="DUT_IC", event="FALLING", min_diff=None, max_diff=None):
+        """Returns a mask selecting matching trace events.
+
+        :param trace:       PHiLIP trace as list of dicts or TRACE_DTYPE array
+        :param source:      Event source to select
+        :param event:       Event type to select
+        :param min_diff:    If given, only select events with diff > min_diff
+        :param max_diff:    If given, only select events with diff < max_diff
+        """
+        arr = cls._trace_to_array(trace)
+        mask = (arr['source'] == cls._SOURCE_CODES[source]) & (arr['event'] == cls._EVENT_CODES[event])
+        if min_diff is not None:
+            mask &= arr['diff'] > min_diff
+        if max_diff is not None:
+            mask &= arr['diff'] < max_diff
+        return mask
+
+    @classmethod
+    def _select_edge_diffs(cls, trace, source="DUT_IC", event="FALLING", min_diff=None, max_diff=None):
+        """Returns the diffs of all matching trace events as float64 array.
+
+        See _select_edges() for a description of the parameters.
+        """
+        arr = cls._trace_to_array(trace)
+        return arr['diff'][cls._select_edges(arr, source, event, min_diff, max_diff)]
+
+    def _calc_statistical_properties(self, data):
+        """Returns the statistics of benchmark samples, see BenchStats.to_dict().
+
+        The raw samples are included as 'values' unless the
+        BENCH_RECORD_VALUES environment variable is set to 0.
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if data.size == 0:
+            raise ValueError("No benchmark samples found in trace")
+        if self._sampler is not None:
+            self._sampler.add(data)
+
+        stats = BenchStats.from_values(data).to_dict()
+        if os.environ.get('BENCH_RECORD_VALUES', '1').strip() != '0':
+            stats['values'] = data.tolist()
+        return stats
 
     @staticmethod
     def concat_traces(head, tail):
@@ -0,0 +1,155 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Compact encoding of PHiLIP traces for recorded properties.
+
+By default traces are recorded as the Python repr of the list of event dicts
+returned by PHiLIP. Encoded traces are plain strings starting with a prefix
+that identifies the encoding:
+
+- "trace:b64:<data>": zlib compressed, base64 encoded binary trace. Sources
+  and events are stored as int8 codes, timestamps as deltas of their float64
+  bit patterns, so decoding restores them bit-exact. Diffs are recomputed the
+  same way PHiLIP computes them.
+- "trace:npy:<file>": TRACE_DTYPE array stored in a sidecar .npy file, path
+  relative to the directory containing the result file. Loaded memory mapped.
+"""
+import base64
+import hashlib
+import os
+import zlib
+from ast import literal_eval
+
+import numpy as np
+
+
+# Columnar representation of a PHiLIP trace. Sources and events are stored as
+# small integer codes (index into TRACE_SOURCES / TRACE_EVENTS, -1 if unknown).
+TRACE_SOURCES = ('DEBUG0', 'DEBUG1', 'DEBUG2', 'DUT_IC')
+TRACE_EVENTS = ('FALLING', 'RISING')
+TRACE_DTYPE = np.dtype([
+    ('source', np.int8),
+    ('event', np.int8),
+    ('time', np.float64),
+    ('diff', np.float64),
+])
+
+TRACE_ENCODINGS = ('repr', 'base64', 'npy')
+TRACE_PREFIX_BASE64 = 'trace:b64:'
+TRACE_PREFIX_NPY = 'trace:npy:'
+
+_SOURCE_CODES = {name: code for code, name in enumerate(TRACE_SOURCES)}
+_EVENT_CODES = {name: code for code, name in enumerate(TRACE_EVENTS)}
+
+
+def trace_to_array(trace):
+    """Converts a PHiLIP trace (list of event dicts) into a TRACE_DTYPE array.
+
+    Traces that already are structured arrays are returned unchanged.
+    """
+    if isinstance(trace, np.ndarray):
+        return trace
+
+    arr = np.empty(len(trace), dtype=TRACE_DTYPE)
+    arr['source'] = [_SOURCE_CODES.get(x['source'], -1) for x in trace]
+    arr['event'] = [_EVENT_CODES.get(x['event'], -1) for x in trace]
+    arr['time'] = [x['time'] for x in trace]
+    arr['diff'] = [x['diff'] for x in trace]
+    return arr
+
+
+def array_to_trace(arr):
+    """Converts a TRACE_DTYPE array back into a PHiLIP trace (list of dicts)."""
+    return [{
+        'source': TRACE_SOURCES[source] if 0 <= source < len(TRACE_SOURCES) else int(source),
+        'event': TRACE_EVENTS[event] if 0 <= event < len(TRACE_EVENTS) else int(event),
+        'time': float(time),
+        'diff': float(diff),
+    } for source, event, time, diff in arr.tolist()]
+
+
+def trace_diffs(times):
+    """Computes the event diffs of a time sorted trace the same way PHiLIP does.
+
+    There is no diff for the first event or after a zero timestamp.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    diffs = np.zeros(len(times), dtype=np.float64)
+    if len(times) > 1:
+        prev = times[:-1]
+        diffs[1:] = np.where(prev != 0, times[1:] - prev, 0)
+    return diffs
+
+
+def is_encoded_trace(value):
+    """Checks whether a recorded property value is an encoded trace."""
+    return (isinstance(value, str) and
+            value.startswith((TRACE_PREFIX_BASE64, TRACE_PREFIX_NPY)))
+
+
+def encode_trace(trace, encoding='base64', basedir=None, sidecar_dir='traces'):
+    """Encodes a PHiLIP trace for recording it as property.
+
+    :param trace:       PHiLIP trace as list of dicts or TRACE_DTYPE array
+    :param encoding:    One of TRACE_ENCODINGS. 'repr' returns trace unchanged
+    :param basedir:     Directory containing the result files, required for 'npy'
+    :param sidecar_dir: Directory to write .npy files to, relative to basedir
+
+    :return: Encoded trace string, or the trace as list of dicts for 'repr'
+    """
+    if encoding == 'repr':
+        if isinstance(trace, np.ndarray):
+            return array_to_trace(trace)
+        return trace
+
+    arr = trace_to_array(trace)
+    if encoding == 'base64':
+        times = np.ascontiguousarray(arr['time']).view(np.int64)
+        payload = b''.join((
+            arr['source'].astype(np.int8).tobytes(),
+            arr['event'].astype(np.int8).tobytes(),
+            np.diff(times, prepend=np.int64(0)).tobytes(),
+        ))
+        return TRACE_PREFIX_BASE64 + base64.b64encode(zlib.compress(payload)).decode('ascii')
+
+    if encoding == 'npy':
+        if basedir is None:
+            raise ValueError("basedir is required for npy trace encoding")
+        data = np.ascontiguousarray(arr, dtype=TRACE_DTYPE)
+        name = os.path.join(sidecar_dir, "{}.npy".format(hashlib.sha1(data.tobytes()).hexdigest()))
+        os.makedirs(os.path.join(basedir, sidecar_dir), exist_ok=True)
+        np.save(os.path.join(basedir, name), data)
+        return TRACE_PREFIX_NPY + name
+
+    raise ValueError("encoding must be one of {}".format(TRACE_ENCODINGS))
+
+
+def decode_trace(value, basedir=None):
+    """Decodes a recorded trace property into a TRACE_DTYPE array.
+
+    :param value:   Encoded trace, or the repr of a list of event dicts
+    :param basedir: Directory sidecar file names are relative to
+
+    :return: TRACE_DTYPE array, read-only memory map for sidecar files
+    """
+    if value.startswith(TRACE_PREFIX_BASE64):
+        payload = zlib.decompress(base64.b64decode(value[len(TRACE_PREFIX_BASE64):]))
+        count = len(payload) // 10
+
+        arr = np.empty(count, dtype=TRACE_DTYPE)
+        arr['source'] = np.frombuffer(payload, np.int8, count, 0)
+        arr['event'] = np.frombuffer(payload, np.int8, count, count)
+        arr['time'] = np.cumsum(np.frombuffer(payload, np.int64, count, 2 * count)).view(np.float64)
+        arr['diff'] = trace_diffs(arr['time'])
+        return arr
+
+    if value.startswith(TRACE_PREFIX_NPY):
+        path = value[len(TRACE_PREFIX_NPY):]
+        if basedir is not None:
+            path = os.path.join(basedir, path)
+        return np.load(path, mmap_mode='r')
+
+    return trace_to_array(literal_eval(value))
@@ -0,0 +1,167 @@
+# Copyright (C) 2021 Niels Gandraß <niels@gandrass.de>
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+"""@package PyToAPI
+Incremental draining of the PHiLIP trace buffer.
+
+PHiLIP records events into a ring buffer of a few dozen entries, which limits
+the number of edges a single benchmark can produce before reading the trace.
+A TraceStream keeps track of the ring buffer write index and copies all new
+events into a growing TraceBuffer, either when drain() is called (e.g. at
+chunk boundaries of a benchmark loop) or periodically from a background
+reader thread. Overwritten events are detected and reported as overrun.
+"""
+import threading
+
+import numpy as np
+
+from trace_encoding import TRACE_DTYPE, trace_diffs
+
+
+class TraceOverrunError(RuntimeError):
+    """PHiLIP overwrote trace events before they were drained."""
+
+
+class TraceBuffer:
+    """Growable columnar buffer of trace events in TRACE_DTYPE layout."""
+
+    def __init__(self, capacity=1024):
+        self._data = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, sources, events, times):
+        """Appends events given as source codes, event codes and times."""
+        count = len(times)
+        if self._size + count > len(self._data):
+            grown = np.zeros(max(2 * len(self._data), self._size + count), dtype=TRACE_DTYPE)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+
+        chunk = self._data[self._size:self._size + count]
+        chunk['source'] = sources
+        chunk['event'] = events
+        chunk['time'] = times
+        self._size += count
+
+    def to_array(self):
+        """Returns a copy of all events with the diffs computed like PHiLIP."""
+        arr = self._data[:self._size].copy()
+        arr['diff'] = trace_diffs(arr['time'])
+        return arr
+
+
+class TraceStream:
+    """Drains new events from the PHiLIP trace ring buffer into a TraceBuffer.
+
+    :param philip:      Connected philip_pal.Phil instance
+    :param interval:    If given, drain from a background thread every
+                        interval seconds. Otherwise drain() must be called
+                        often enough to not let PHiLIP overwrite events.
+    """
+
+    # Maximum number of trace entries read per command, see Phil.read_trace()
+    CHUNK_SIZE = 32 + 16
+
+    def __init__(self, philip, interval=None):
+        self.philip = philip
+        self.interval = None if interval is None else float(interval)
+        self.buffer = TraceBuffer()
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._error = None
+
+        self._sys_clock = philip.read_reg('sys.sys_clk')['data']
+        self._size = int(philip.mem_map['trace.tick']['array_size'])
+
+        # The last drained slot is read again with every drain. If its content
+        # changed, PHiLIP wrapped around and overwrote undrained events.
+        self._next = self._read_index()
+        self._guard = self._read_slots((self._next - 1) % self._size, 1)[0]
+
+    def start(self):
+        """Starts the background reader thread if an interval is configured."""
+        if self.interval is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="philip-trace-stream", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background reader, drains remaining events and returns them.
+
+        :return: TRACE_DTYPE array of all events recorded since the stream was created
+        """
+        self.close()
+        self.drain()
+        return self.buffer.to_array()
+
+    def close(self):
+        """Stops the background reader without draining, discarding all events.
+
+        Unlike stop() this does not raise a pending error, e.g. an overrun of a
+        stream a failed benchmark left running.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def drain(self):
+        """Copies all events recorded since the last drain into the buffer.
+
+        :return: Number of new events
+        """
+        if self._error is not None:
+            raise self._error
+
+        with self._lock:
+            index = self._read_index()
+            count = (index - self._next) % self._size
+
+            guard_slot = (self._next - 1) % self._size
+            slots = self._read_slots(guard_slot, count + 1)
+            if slots[0] != self._guard:
+                raise TraceOverrunError("PHiLIP trace buffer overrun, drain the trace more often")
+
+            self._guard = slots[-1]
+            self._next = index
+
+            new = [slot for slot in slots[1:] if slot[1] != 0]
+            if new:
+                self.buffer.extend(
+                    [source - 1 if 1 <= source <= 4 else -1 for _, source, _, _ in new],
+                    [value if value in (0, 1) else -1 for _, _, _, value in new],
+                    [round(float(tick << tick_div) / self._sys_clock, 9) for tick_div, _, tick, _ in new],
+                )
+            return len(new)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as exc:  # Reported by the next drain() or stop()
+                self._error = exc
+                return
+
+    def _read_index(self):
+        return int(self.philip.read_reg('trace.index')['data']) % self._size
+
+    def _read_slots(self, start, count):
+        """Reads count ring buffer slots as (tick_div, source, tick, value) tuples."""
+        slots = []
+        while count > 0:
+            size = min(count, self.CHUNK_SIZE, self._size - start)
+            slots.extend(zip(
+                self.philip.read_reg('trace.tick_div', start, size)['data'],
+                self.philip.read_reg('trace.source', start, size)['data'],
+                self.philip.read_reg('trace.tick', start, size)['data'],
+                self.philip.read_reg('trace.value', start, size)['data'],
+            ))
+            start = (start + size) % self._size
+            count -= size
+        return slots
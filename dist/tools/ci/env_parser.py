@@ -7,16 +7,16 @@ The data can be presented in a console for developers or xml format to feed
 into test artifacts.
 """
 import argparse
+import hashlib
+import json
 import logging
 import os
+import shutil
 import subprocess
 import re
 import xml.etree.ElementTree as ET
-try:
-    import git
-except ImportError:
-    git = None
-import pkg_resources
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
 
 
 LOG_HANDLER = logging.StreamHandler()
@@ -24,6 +24,25 @@ LOG_HANDLER.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
 
 LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
 
+# Binaries whose mtimes invalidate the toolchain versions cache
+TOOLCHAIN_BINARIES = ('gcc', 'clang', 'arm-none-eabi-gcc', 'avr-gcc',
+                      'msp430-gcc', 'mips-mti-elf-gcc',
+                      'riscv-none-embed-gcc', 'riscv64-unknown-elf-gcc',
+                      'xtensa-esp32-elf-gcc', 'xtensa-lx106-elf-gcc',
+                      'gdb', 'arm-none-eabi-gdb', 'cmake', 'make',
+                      'openocd', 'JLinkExe', 'edbg', 'avrdude', 'bossac',
+                      'cppcheck', 'doxygen', 'flake8', 'uncrustify', 'git',
+                      'coccinelle', 'spatch')
+
+
+def _import_git():
+    """Imports GitPython on first use, returns None if it is missing."""
+    try:
+        import git
+    except ImportError:
+        return None
+    return git
+
 
 def python_modules_to_dict(flatten=False):
     py_modules = ['riot_pal', 'philip_pal', 'robotframework', 'pyserial',
@@ -31,8 +50,8 @@ def python_modules_to_dict(flatten=False):
     py_versions = {}
     for pm in py_modules:
         try:
-            py_versions[pm] = pkg_resources.get_distribution(pm).version
-        except pkg_resources.DistributionNotFound as exc:
+            py_versions[pm] = metadata.version(pm)
+        except metadata.PackageNotFoundError as exc:
             logging.debug("%r", exc)
             py_versions[pm] = 'missing'
     ret = {}
@@ -64,11 +83,56 @@ def env_to_dict(flatten=False):
     return ret
 
 
-def toolchain_versions_to_dict(print_toolchain_versions_path, flatten=False):
+def _toolchain_cache_key(print_toolchain_versions_path):
+    """Hashes PATH and the mtimes of the script and all toolchain binaries."""
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    key = {
+        'path': os.environ.get('PATH', ''),
+        'script': [print_toolchain_versions_path,
+                   mtime(print_toolchain_versions_path)],
+        'tools': {tool: mtime(shutil.which(tool))
+                  for tool in TOOLCHAIN_BINARIES},
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _read_toolchain_versions(print_toolchain_versions_path, cache_file=None):
+    """Runs print_toolchain_versions.sh, or reads its output from the cache."""
+    key = None
+    if cache_file is not None:
+        key = _toolchain_cache_key(print_toolchain_versions_path)
+        try:
+            with open(cache_file) as cache:
+                cached = json.load(cache)
+            if cached.get('key') == key:
+                logging.debug("Using cached toolchain versions from %r",
+                              cache_file)
+                return cached['output']
+        except (OSError, ValueError) as exc:
+            logging.debug("toolchain versions cache: %r", exc)
+
     result = subprocess.run([print_toolchain_versions_path],
                             stdout=subprocess.PIPE)
     result = result.stdout.decode('utf-8')
 
+    if cache_file is not None:
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        with open(tmp_file, 'w') as cache:
+            json.dump({'key': key, 'output': result}, cache)
+        os.replace(tmp_file, cache_file)
+    return result
+
+
+def toolchain_versions_to_dict(print_toolchain_versions_path, flatten=False,
+                               cache_file=None):
+    result = _read_toolchain_versions(print_toolchain_versions_path,
+                                      cache_file)
+
     sep_headers_pattern = re.compile(r'(.*)\n-+\n((?:.|\n[^\n])*)',
                                      re.MULTILINE)
     riot_env = {}
@@ -85,6 +149,7 @@ def toolchain_versions_to_dict(print_toolchain_versions_path, flatten=False):
 
 
 def get_repo_val(repo_path, repo_name=None, flatten=False):
+    git = _import_git()
     logging.debug("Getting repo info from %r", repo_path)
     try:
         repo = git.Repo(repo_path)
@@ -201,6 +266,11 @@ PARSER.add_argument('--py', '-p', default=False, action='store_true',
                     help='Writes python module related output')
 PARSER.add_argument('--tool', '-t', default=False, action='store_true',
                     help='Writes toolchain related output')
+PARSER.add_argument('--tool-cache', default=None,
+                    help='Cache file for toolchain versions, invalidated '
+                         'when PATH or a toolchain binary changes')
+PARSER.add_argument('--jobs', '-j', type=int, default=None,
+                    help='Number of threads used to collect information')
 PARSER.add_argument('--loglevel', choices=LOG_LEVELS, default='info',
                     help='Python logger log level')
 
@@ -211,26 +281,37 @@ def main(args):
         loglevel = logging.getLevelName(args.loglevel.upper())
         logging.basicConfig(level=loglevel)
 
-    env = {}
+    # Collectors are independent and mostly wait on subprocesses, run them
+    # concurrently but merge their results in a fixed order
+    collectors = []
     if args.git:
-        if git is None:
+        if _import_git() is None:
             logging.info("Cannot collect repo information")
             logging.info("git module missing")
             logging.info("try to pip install gitpython")
         else:
-            env.update(get_repo_val(args.riot_dir, repo_name="RIOT",
-                                    flatten=args.flatten))
-            env.update(get_repo_val(args.rf_dir, repo_name="RobotFW-Tests",
-                                    flatten=args.flatten))
+            collectors.append((get_repo_val, (args.riot_dir, "RIOT",
+                                              args.flatten)))
+            collectors.append((get_repo_val, (args.rf_dir, "RobotFW-Tests",
+                                              args.flatten)))
     if args.env:
-        env.update(env_to_dict(flatten=args.flatten))
+        collectors.append((env_to_dict, (args.flatten,)))
     if args.py:
-        env.update(python_modules_to_dict(flatten=args.flatten))
+        collectors.append((python_modules_to_dict, (args.flatten,)))
     if args.tool:
         ptv_path = 'dist/tools/ci/print_toolchain_versions.sh'
         print_toolchain_versions_path = os.path.join(args.riot_dir, ptv_path)
-        env.update(toolchain_versions_to_dict(print_toolchain_versions_path,
-                                              flatten=args.flatten))
+        collectors.append((toolchain_versions_to_dict,
+                           (print_toolchain_versions_path, args.flatten,
+                            args.tool_cache)))
+
+    env = {}
+    if collectors:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(func, *func_args)
+                       for func, func_args in collectors]
+            for future in futures:
+                env.update(future.result())
 
     if args.console:
         print_env_to_console(env, args.flatten)
@@ -0,0 +1,408 @@
+#! /usr/bin/env python3
+"""Runs HIL test suites on all boards attached to a node concurrently.
+
+The boards are read from a board map, one attached board per line:
+
+    # <board> <VAR>=<value> ...
+    nucleo-f767zi PORT=/dev/ttyACM0 PHILIP_PORT=/dev/ttyUSB0 DEBUG_ADAPTER_ID=0668
+    samr21-xpro   PORT=/dev/ttyACM1 PHILIP_PORT=/dev/ttyUSB1 SERIAL=ATML2127
+
+Only boards with a dist/etc/conf/<board>.env file are supported. The variables
+are passed to make for all suites run on that board, so they must at least
+select the serial ports of the DUT and PHiLIP and, if several boards share a
+flasher type, the debug adapter. Without a board map the single board given by
+the BOARD, PORT and PHILIP_PORT environment variables is used.
+
+Each board runs its suites one after another (flash, robot-test) in its own
+make processes, with RFOUTPATH set to <outdir>/<board name>/<application>.
+Boards run concurrently. Afterwards the output.xml files of all runs are
+merged into <outdir>/output.xml and <outdir>/xunit.xml, and a summary of all
+runs including their durations is written to <outdir>/runs.json.
+
+With --shard, identical boards work as one: the test cases of each suite are
+split across them, balanced by the test durations of earlier runs (the
+output.xml files below the output directory or given by --history). Each
+shard runs in <outdir>/<board>/<application>/shards/<board name> and the
+shard results are merged into <outdir>/<board>/<application>/output.xml and
+xunit.xml, as if the suite had run on a single board.
+"""
+import argparse
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import robot_shards
+
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
+
+_PATH = os.path.dirname(os.path.abspath(__file__))
+_RF_DIR = os.path.abspath(os.path.join(_PATH, '../../../'))
+_CONF_DIR = os.path.join(_RF_DIR, 'dist', 'etc', 'conf')
+_TESTS_DIR = os.path.join(_RF_DIR, 'tests')
+_OUTPUT_TO_XUNIT = os.path.join(_RF_DIR, 'dist', 'tools', 'output_to_xunit',
+                                'output_to_xunit.py')
+
+# Directories in tests/ that are not test applications
+_NON_TEST_DIRS = ('common', 'if_parser')
+
+FAILED_XUNIT = """<?xml version='1.0' encoding='UTF-8'?>
+<testsuite errors="0" failures="1" name="{app}" skipped="0" tests="1" time="0.000"><testcase classname="{app}.{step}" name="{step}" time="0.000"><failure>{step} failed</failure></testcase></testsuite>
+"""
+
+
+def supported_boards(conf_dir=_CONF_DIR):
+    """Returns the names of all boards with a HIL configuration."""
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(conf_dir)
+                  if f.endswith('.env') and f != 'default.env')
+
+
+def available_tests(tests_dir=_TESTS_DIR):
+    """Returns the names of all test applications with robot tests."""
+    return sorted(d for d in os.listdir(tests_dir)
+                  if d not in _NON_TEST_DIRS and
+                  os.path.isdir(os.path.join(tests_dir, d, 'tests')))
+
+
+def parse_board_map(path):
+    """Reads attached boards from a board map file.
+
+    :return: List of dicts with name, board and env (dict of variables)
+    """
+    boards = []
+    with open(path) as board_map:
+        for lineno, line in enumerate(board_map, 1):
+            fields = shlex.split(line, comments=True)
+            if not fields:
+                continue
+            env = {}
+            for field in fields[1:]:
+                if '=' not in field:
+                    raise ValueError("{}:{}: expected VAR=value, got {!r}"
+                                     .format(path, lineno, field))
+                key, val = field.split('=', 1)
+                env[key] = val
+            boards.append({'board': fields[0], 'env': env})
+    return boards
+
+
+def boards_from_env():
+    """Returns the single board configured by the environment, if any."""
+    if not os.environ.get('BOARD'):
+        return []
+    env = {key: os.environ[key] for key in ('PORT', 'PHILIP_PORT')
+           if key in os.environ}
+    return [{'board': os.environ['BOARD'], 'env': env}]
+
+
+def name_boards(boards):
+    """Assigns unique names, identical boards are numbered <board>-<n>."""
+    counts = {}
+    for board in boards:
+        counts[board['board']] = counts.get(board['board'], 0) + 1
+    index = {}
+    for board in boards:
+        if counts[board['board']] == 1:
+            board['name'] = board['board']
+        else:
+            index[board['board']] = index.get(board['board'], 0) + 1
+            board['name'] = "{}-{}".format(board['board'],
+                                           index[board['board']])
+    return boards
+
+
+def _make(test, targets, env, log):
+    cmd = ['make', '-C', os.path.join(_TESTS_DIR, test)] + targets
+    log.write("$ {}\n".format(' '.join(cmd)))
+    log.flush()
+    return subprocess.run(cmd, env=env, stdout=log,
+                          stderr=subprocess.STDOUT).returncode
+
+
+def _board_env(board, **env):
+    ret = dict(os.environ)
+    ret.update(board['env'])
+    ret.update({'BOARD': board['board'], 'RIOT_CI_BUILD': '1'})
+    ret.update(env)
+    return ret
+
+
+def build_tests(boards, tests, outdir):
+    """Builds all tests once per board type.
+
+    Builds run one after another, as builds of identical boards would share
+    their output directories.
+
+    :return: Set of (board, test) tuples that failed to build
+    """
+    failed = set()
+    for board in sorted({board['board'] for board in boards}):
+        for test in tests:
+            logfile = os.path.join(outdir, 'build-{}-{}.log'.format(board, test))
+            with open(logfile, 'w') as log:
+                env = _board_env({'board': board, 'env': {}})
+                if _make(test, ['all'], env, log) != 0:
+                    logging.warning("%s: building %s failed", board, test)
+                    failed.add((board, test))
+    return failed
+
+
+def run_test(board, test, outdir, build_failed=False, rfoutpath=None,
+             argfile=None):
+    """Flashes and runs one test application on a board.
+
+    :param build_failed:    If True, only record the build failure
+    :param rfoutpath:       Result directory, defaults to
+                            <outdir>/<board name>/tests_<test>
+    :param argfile:         Robot argument file passed to the run, relative
+                            to rfoutpath
+
+    :return: Dict describing the run
+    """
+    app = 'tests_{}'.format(test)
+    rfoutpath = rfoutpath or os.path.join(outdir, board['name'], app)
+    os.makedirs(rfoutpath, exist_ok=True)
+    env = _board_env(board, RFOUTPATH=rfoutpath)
+    if argfile:
+        env['ROBOT_EXTRA_ARGS'] = "{} --argumentfile {}".format(
+            env.get('ROBOT_EXTRA_ARGS', ''), os.path.join(rfoutpath, argfile))
+
+    run = {'name': board['name'], 'board': board['board'], 'test': test,
+           'rfoutpath': rfoutpath, 'step': 'build', 'returncode': 0}
+    start = time.monotonic()
+    steps = [('flash', ['flash-only']), ('robot-clean', ['robot-clean']),
+             ('robot-test', ['robot-test'])]
+    if build_failed:
+        run['returncode'] = 1
+        steps = []
+
+    with open(os.path.join(rfoutpath, 'runner.log'), 'w') as log:
+        for step, targets in steps:
+            run['step'] = step
+            run['returncode'] = _make(test, targets, env, log)
+            if run['returncode'] != 0:
+                break
+    run['duration'] = time.monotonic() - start
+
+    if run['returncode'] != 0 and run['step'] != 'robot-test':
+        # Nothing was tested, record the failure like the CI does
+        with open(os.path.join(rfoutpath, 'xunit.xml'), 'w') as xunit:
+            xunit.write(FAILED_XUNIT.format(app=app, step=run['step']))
+
+    logging.info("%s: %s %s after %.1f s", board['name'], test,
+                 "passed" if run['returncode'] == 0 else
+                 "failed in " + run['step'], run['duration'])
+    return run
+
+
+def run_board(board, tests, outdir, build_failed=()):
+    """Runs all tests on one board, one after another."""
+    return [run_test(board, test, outdir,
+                     (board['board'], test) in build_failed)
+            for test in tests]
+
+
+def run_sharded(boards, test, outdir, durations=None, build_failed=False):
+    """Runs the tests of one application split across identical boards.
+
+    :param boards:      Boards of the same type
+    :param durations:   Test durations from earlier runs,
+                        see robot_shards.load_durations()
+
+    :return: Dict describing the combined run, with the shard runs in shards
+    """
+    app = 'tests_{}'.format(test)
+    group = {'name': boards[0]['board'], 'board': boards[0]['board'],
+             'env': {}}
+    rfoutpath = os.path.join(outdir, group['name'], app)
+    if build_failed:
+        return run_test(group, test, outdir, build_failed)
+
+    tests = robot_shards.collect_tests(os.path.join(_TESTS_DIR, test, 'tests'),
+                                       app)
+    shards = [(board, shard) for board, shard in
+              zip(boards, robot_shards.split_tests(tests, len(boards),
+                                                   durations))
+              if shard]
+    logging.info("%s: splitting %d tests of %s across %s", group['name'],
+                 len(tests), test, ', '.join(b['name'] for b, _ in shards))
+
+    start = time.monotonic()
+    futures = []
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        for board, shard in shards:
+            shard_path = os.path.join(rfoutpath, 'shards', board['name'])
+            os.makedirs(shard_path, exist_ok=True)
+            robot_shards.write_argument_file(
+                os.path.join(shard_path, 'shard.args'), shard)
+            futures.append(pool.submit(run_test, board, test, outdir,
+                                       rfoutpath=shard_path,
+                                       argfile='shard.args'))
+    runs = [future.result() for future in futures]
+
+    run = {'name': group['name'], 'board': group['board'], 'test': test,
+           'rfoutpath': rfoutpath, 'shards': runs,
+           'step': next((r['step'] for r in runs if r['returncode'] != 0),
+                        'robot-test'),
+           'returncode': max(r['returncode'] for r in runs),
+           'duration': time.monotonic() - start}
+
+    outputs = [os.path.join(r['rfoutpath'], 'output.xml') for r in runs]
+    outputs = [output for output in outputs if os.path.exists(output)]
+    if outputs:
+        output = robot_shards.merge_outputs(
+            outputs, os.path.join(rfoutpath, 'output.xml'), tests)
+        with open(os.path.join(rfoutpath, 'runner.log'), 'w') as log:
+            subprocess.run([sys.executable, _OUTPUT_TO_XUNIT, '--output',
+                            os.path.join(rfoutpath, 'xunit.xml'), output],
+                           stdout=log, stderr=subprocess.STDOUT)
+    else:
+        # Nothing was tested, record the failure like the CI does
+        with open(os.path.join(rfoutpath, 'xunit.xml'), 'w') as xunit:
+            xunit.write(FAILED_XUNIT.format(app=app, step=run['step']))
+    for shard_run in runs:
+        # Only the merged result must be found by tools scanning for xunit.xml
+        shard_xunit = os.path.join(shard_run['rfoutpath'], 'xunit.xml')
+        if os.path.exists(shard_xunit):
+            os.remove(shard_xunit)
+
+    logging.info("%s: %s %s after %.1f s", group['name'], test,
+                 "passed" if run['returncode'] == 0 else
+                 "failed in " + run['step'], run['duration'])
+    return run
+
+
+def run_group(boards, tests, outdir, durations=None, build_failed=()):
+    """Runs all tests on a group of identical boards, one after another."""
+    if len(boards) == 1:
+        return run_board(boards[0], tests, outdir, build_failed)
+    return [run_sharded(boards, test, outdir, durations,
+                        (boards[0]['board'], test) in build_failed)
+            for test in tests]
+
+
+def _rebot(outputs, name, outdir):
+    from robot import rebot
+
+    with open(os.devnull, 'w') as devnull:
+        rebot(*outputs, name=name, output=os.path.join(outdir, 'output.xml'),
+              xunit=os.path.join(outdir, 'xunit.xml'), log='NONE',
+              report='NONE', stdout=devnull)
+    return os.path.join(outdir, 'output.xml')
+
+
+def merge_results(runs, outdir, name="RIOT HIL"):
+    """Merges the output.xml files of all runs into one output and xunit.
+
+    Runs are first merged per board into <outdir>/<board name>/output.xml,
+    so the merged result has one suite per board.
+    """
+    boards = {}
+    for run in runs:
+        output = os.path.join(run['rfoutpath'], 'output.xml')
+        if os.path.exists(output):
+            boards.setdefault(run['name'], []).append(output)
+    if not boards:
+        logging.warning("No robot results to merge")
+        return None
+
+    board_outputs = [_rebot(outputs, board, os.path.join(outdir, board))
+                     for board, outputs in sorted(boards.items())]
+    return _rebot(board_outputs, name, outdir)
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('--board-map', default=os.environ.get('HIL_BOARD_MAP'),
+                    help='File mapping attached boards to their ports, '
+                         'defaults to $HIL_BOARD_MAP')
+PARSER.add_argument('--tests', nargs='+', default=None,
+                    help='Test applications to run, defaults to all')
+PARSER.add_argument('--outdir', default=os.path.join(_RF_DIR, 'build',
+                                                     'robot'),
+                    help='Directory for the results of all boards')
+PARSER.add_argument('--build', default=False, action='store_true',
+                    help='Build the test applications before flashing')
+PARSER.add_argument('--jobs', '-j', type=int, default=None,
+                    help='Number of boards (groups of identical boards with '
+                         '--shard) to run concurrently, '
+                         'defaults to all')
+PARSER.add_argument('--shard', default=False, action='store_true',
+                    help='Split the tests of each suite across identical '
+                         'boards instead of running all tests on each')
+PARSER.add_argument('--history', nargs='+', default=None,
+                    help='output.xml files of earlier runs used to balance '
+                         'shards, defaults to all below --outdir')
+PARSER.add_argument('--no-merge', default=False, action='store_true',
+                    help='Do not merge the results of all runs')
+PARSER.add_argument('--loglevel', choices=LOG_LEVELS, default='info',
+                    help='Python logger log level')
+
+
+def main(args):
+    """Run test suites on all attached boards concurrently."""
+    if args.loglevel:
+        loglevel = logging.getLevelName(args.loglevel.upper())
+        logging.basicConfig(level=loglevel)
+
+    if args.board_map:
+        boards = parse_board_map(args.board_map)
+    else:
+        boards = boards_from_env()
+    supported = supported_boards()
+    for board in [b for b in boards if b['board'] not in supported]:
+        logging.warning("%s has no HIL configuration, skipping",
+                        board['board'])
+    boards = name_boards([b for b in boards if b['board'] in supported])
+    if not boards:
+        logging.error("No supported boards attached")
+        return 1
+
+    tests = args.tests or available_tests()
+    unknown = set(tests) - set(available_tests())
+    if unknown:
+        logging.error("Unknown tests: %s", ', '.join(sorted(unknown)))
+        return 1
+
+    os.makedirs(args.outdir, exist_ok=True)
+    build_failed = set()
+    if args.build:
+        build_failed = build_tests(boards, tests, args.outdir)
+
+    logging.info("Running %d tests on %s", len(tests),
+                 ', '.join(b['name'] for b in boards))
+    groups = [[board] for board in boards]
+    durations = None
+    if args.shard:
+        groups = {}
+        for board in boards:
+            groups.setdefault(board['board'], []).append(board)
+        groups = list(groups.values())
+        history = args.history or glob(os.path.join(args.outdir, '**',
+                                                    'output.xml'),
+                                       recursive=True)
+        durations = robot_shards.load_durations(history)
+
+    runs = []
+    with ThreadPoolExecutor(max_workers=args.jobs or len(groups)) as pool:
+        futures = [pool.submit(run_group, group, tests, args.outdir,
+                               durations, build_failed) for group in groups]
+        for future in futures:
+            runs.extend(future.result())
+
+    with open(os.path.join(args.outdir, 'runs.json'), 'w') as summary:
+        json.dump(runs, summary, indent=2)
+
+    if not args.no_merge:
+        merge_results(runs, args.outdir)
+
+    return 0 if all(run['returncode'] == 0 for run in runs) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(PARSER.parse_args()))
@@ -0,0 +1,231 @@
+#! /usr/bin/env python3
+"""Combines the results of all boards into a single robot.xml.
+
+The results directory has the layout <dir>/<board>/<testsuite>/xunit.xml and
+may contain the metadata.xml written by env_parser.py. The combined document
+looks like:
+
+    <result name="RIOT HIL">
+      <metadata>...</metadata>
+      <boards>
+        <board name="<board>"><testsuite>...</testsuite>...</board>
+      </boards>
+    </result>
+
+The xunit files are checked by a pool of workers in parallel and then copied
+into the output chunk by chunk, so memory usage does not depend on the size of
+the results. Invalid xunit files are skipped, with --strict the exit status
+is 1 if there are any.
+
+With --index the byte offsets and lengths of every board and testsuite within
+robot.xml are written to a JSON file, so a single board can be read without
+parsing the whole document. With --split a separate document with the same
+structure is written for each board.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import quoteattr
+
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
+
+XUNIT_FILE = 'xunit.xml'
+METADATA_FILE = 'metadata.xml'
+
+
+def find_results(basedir):
+    """Returns the xunit files of all boards as {board: [(suite, path)]}."""
+    results = {}
+    for board in sorted(os.listdir(basedir)):
+        board_dir = os.path.join(basedir, board)
+        if not os.path.isdir(board_dir):
+            continue
+        suites = results.setdefault(board, [])
+        for suite in sorted(os.listdir(board_dir)):
+            xunit = os.path.join(board_dir, suite, XUNIT_FILE)
+            if os.path.isfile(xunit):
+                suites.append((suite, xunit))
+    return results
+
+
+def _body_offset(path):
+    """Returns the offset of the document after the XML declaration."""
+    with open(path, 'rb') as xml:
+        head = xml.read(512)
+    if not head.startswith(b'<?xml'):
+        return 0
+    end = head.find(b'?>') + len(b'?>')
+    while head[end:end + 1] in (b'\n', b'\r'):
+        end += 1
+    return end
+
+
+def check_xml(path, root_tag=None):
+    """Checks that a file is well-formed XML, streaming it element by element.
+
+    :return: Offset of the document after the XML declaration, None if the
+             file is invalid
+    """
+    try:
+        root = None
+        for event, elem in ET.iterparse(path, events=('start', 'end')):
+            if root is None:
+                root = elem
+            elif event == 'end':
+                elem.clear()
+        if root_tag is not None and root.tag != root_tag:
+            logging.error("%s: expected <%s>, found <%s>", path, root_tag,
+                          root.tag)
+            return None
+    except (ET.ParseError, OSError) as exc:
+        logging.error("%s: %s", path, exc)
+        return None
+    return _body_offset(path)
+
+
+class _Writer:
+    """Output file that keeps track of the number of bytes written."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self._file = open(path, 'wb')
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._file.write(data)
+        self.offset += len(data)
+
+    def copy(self, path, skip=0):
+        with open(path, 'rb') as src:
+            src.seek(skip)
+            start = self._file.tell()
+            shutil.copyfileobj(src, self._file)
+            self.offset += self._file.tell() - start
+
+    def close(self):
+        self._file.close()
+
+
+def _write_header(out, metadata, name):
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<result name={}>\n'.format(quoteattr(name)))
+    if metadata is not None:
+        out.copy(*metadata)
+        out.write('\n')
+    out.write('<boards>\n')
+
+
+def _write_board(out, board, suites):
+    """Writes a board element, returns its index entry."""
+    entry = {'offset': out.offset, 'suites': {}}
+    out.write('<board name={}>\n'.format(quoteattr(board)))
+    for suite, path, skip in suites:
+        start = out.offset
+        out.copy(path, skip)
+        entry['suites'][suite] = {'offset': start,
+                                  'length': out.offset - start}
+        out.write('\n')
+    out.write('</board>\n')
+    entry['length'] = out.offset - entry['offset']
+    return entry
+
+
+def _write_footer(out):
+    out.write('</boards>\n')
+    out.write('</result>\n')
+
+
+def merge_results(basedir, output, index=None, split_dir=None, jobs=None,
+                  name="RIOT HIL"):
+    """Writes the combined results of all boards in basedir to output.
+
+    :param index:       Path of the JSON index of board and suite offsets
+    :param split_dir:   Directory for one combined document per board
+
+    :return: Number of invalid xunit files
+    """
+    results = find_results(basedir)
+    metadata_path = os.path.join(basedir, METADATA_FILE)
+    metadata = None
+    if os.path.isfile(metadata_path):
+        skip = check_xml(metadata_path)
+        if skip is not None:
+            metadata = (metadata_path, skip)
+    else:
+        logging.warning("%s not found", metadata_path)
+
+    files = [path for suites in results.values() for _, path in suites]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        offsets = dict(zip(files, pool.map(
+            lambda path: check_xml(path, 'testsuite'), files)))
+
+    out = _Writer(output)
+    _write_header(out, metadata, name)
+    boards = {}
+    for board, suites in results.items():
+        logging.info("Processing %s", board)
+        valid = [(suite, path, offsets[path]) for suite, path in suites
+                 if offsets[path] is not None]
+        boards[board] = _write_board(out, board, valid)
+        if split_dir:
+            os.makedirs(split_dir, exist_ok=True)
+            board_out = _Writer(os.path.join(split_dir, board + '.xml'))
+            _write_header(board_out, metadata, name)
+            _write_board(board_out, board, valid)
+            _write_footer(board_out)
+            board_out.close()
+    _write_footer(out)
+    out.close()
+
+    if index:
+        with open(index, 'w') as index_file:
+            json.dump({'file': os.path.basename(output), 'boards': boards},
+                      index_file, indent=2)
+    return sum(offset is None for offset in offsets.values())
+
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('basedir', help='Path to the robot results')
+PARSER.add_argument('--output', default=None,
+                    help='Combined results, defaults to <basedir>/robot.xml')
+PARSER.add_argument('--index', nargs='?', const='', default=None,
+                    help='Write the offsets of all boards and suites to a JSON '
+                         'file, defaults to <output>.index.json')
+PARSER.add_argument('--split', default=None, metavar='DIR',
+                    help='Also write one document per board to DIR')
+PARSER.add_argument('--jobs', '-j', type=int, default=None,
+                    help='Number of xunit files checked in parallel')
+PARSER.add_argument('--strict', action='store_true',
+                    help='Fail if any xunit file is invalid')
+PARSER.add_argument('--loglevel', choices=LOG_LEVELS, default='info',
+                    help='Python logger log level')
+
+
+def main(args):
+    """Combine the results of all boards."""
+    if args.loglevel:
+        loglevel = logging.getLevelName(args.loglevel.upper())
+        logging.basicConfig(level=loglevel)
+
+    output = args.output or os.path.join(args.basedir, 'robot.xml')
+    index = args.index
+    if index == '':
+        index = os.path.splitext(output)[0] + '.index.json'
+
+    invalid = merge_results(args.basedir, output, index, args.split,
+                            args.jobs)
+    if invalid:
+        logging.error("Skipped %d invalid xunit files", invalid)
+    return 1 if invalid and args.strict else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(PARSER.parse_args()))
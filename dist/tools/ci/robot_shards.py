@@ -0,0 +1,233 @@
+"""Splits the test cases of a RobotFramework test application into shards.
+
+Shards are balanced by the test durations recorded in earlier output.xml
+files, every shard selects its tests with a robot argument file. The
+output.xml files of all shards are merged back into one output.xml with the
+same structure as the output of a single run, so that output_to_xunit.py and
+the plotters can process it unchanged.
+"""
+import copy
+import logging
+import os
+import statistics
+import xml.etree.ElementTree as ET
+from datetime import datetime as DT
+
+
+# Duration assumed for tests without history and no other reference
+DEFAULT_DURATION = 1.0
+
+TIME_FORMAT = "%Y%m%d %H:%M:%S.%f"
+STATUS_ORDER = ('FAIL', 'PASS', 'SKIP', 'NOT RUN')
+
+_PATTERN_ESCAPES = str.maketrans({'[': '[[]', '*': '[*]', '?': '[?]'})
+
+
+def collect_tests(testdir, name):
+    """Returns the long names of all tests of a test application in order.
+
+    :param testdir: Directory containing the robot files
+    :param name:    Name of the top level suite, see --name of robot
+    """
+    from robot.api import TestSuiteBuilder
+
+    suite = TestSuiteBuilder().build(testdir)
+    suite.name = name
+    return [getattr(test, 'full_name', None) or test.longname
+            for test in suite.all_tests]
+
+
+def _elapsed(status):
+    if status.get('elapsed') is not None:  # RobotFramework >= 7
+        return float(status.get('elapsed'))
+    start, end = status.get('starttime'), status.get('endtime')
+    if not start or not end or 'N/A' in (start, end):
+        return None
+    return (DT.strptime(end, TIME_FORMAT) -
+            DT.strptime(start, TIME_FORMAT)).total_seconds()
+
+
+def load_durations(outputs, prefix='tests_'):
+    """Reads test durations from output.xml files.
+
+    Test names are taken relative to the first suite starting with prefix,
+    so results merged below additional suites (e.g. one per board) map to
+    the same names. Durations of tests found several times are averaged.
+
+    :return: Dict of test long name to duration in seconds
+    """
+    durations = {}
+    for output in outputs:
+        suites = []
+        try:
+            for event, elem in ET.iterparse(output, events=('start', 'end')):
+                if elem.tag == 'suite':
+                    if event == 'start':
+                        suites.append(elem.get('name'))
+                    else:
+                        suites.pop()
+                        elem.clear()
+                elif elem.tag == 'test' and event == 'end':
+                    status = elem.findall('status')
+                    elapsed = _elapsed(status[-1]) if status else None
+                    names = suites + [elem.get('name')]
+                    top = next((i for i, n in enumerate(suites)
+                                if n.startswith(prefix)), 0)
+                    if elapsed is not None:
+                        durations.setdefault('.'.join(names[top:]),
+                                             []).append(elapsed)
+                    elem.clear()
+        except (ET.ParseError, OSError) as exc:
+            logging.warning("Ignoring durations of %s: %r", output, exc)
+    return {name: statistics.mean(d) for name, d in durations.items()}
+
+
+def split_tests(tests, count, durations=None):
+    """Splits tests into count shards with balanced total durations.
+
+    Longest tests are assigned first, each to the shard with the lowest total
+    duration so far. Tests without recorded duration are assumed to take the
+    median duration of the known ones. Within a shard the original order is
+    kept, so tests of a suite stay together.
+
+    :return: List of count lists of test names
+    """
+    durations = durations or {}
+    known = [durations[test] for test in tests if test in durations]
+    default = statistics.median(known) if known else DEFAULT_DURATION
+
+    totals = [0.0] * count
+    shards = [[] for _ in range(count)]
+    order = {test: index for index, test in enumerate(tests)}
+    for test in sorted(tests, key=lambda t: (-durations.get(t, default),
+                                             order[t])):
+        shard = totals.index(min(totals))
+        shards[shard].append(test)
+        totals[shard] += durations.get(test, default)
+    return [sorted(shard, key=order.get) for shard in shards]
+
+
+def write_argument_file(path, tests):
+    """Writes a robot argument file selecting the given tests."""
+    with open(path, 'w') as argfile:
+        for test in tests:
+            argfile.write("--test {}\n".format(test.translate(_PATTERN_ESCAPES)))
+    return path
+
+
+def _worst_status(statuses):
+    return min(statuses, key=lambda s: STATUS_ORDER.index(s)
+               if s in STATUS_ORDER else len(STATUS_ORDER))
+
+
+def _merge_status(status, other):
+    """Merges the status of the same suite in two shards."""
+    status.set('status', _worst_status([status.get('status'),
+                                        other.get('status')]))
+    if status.get('starttime') is not None:
+        for attr, pick in (('starttime', min), ('endtime', max)):
+            times = [t for t in (status.get(attr), other.get(attr))
+                     if t and t != 'N/A']
+            if times:
+                status.set(attr, pick(times))
+    elif status.get('start') is not None:  # RobotFramework >= 7
+        starts = [DT.fromisoformat(s.get('start')) for s in (status, other)]
+        ends = [start.timestamp() + float(s.get('elapsed'))
+                for start, s in zip(starts, (status, other))]
+        status.set('start', min(starts).isoformat())
+        status.set('elapsed', "{:.6f}".format(max(ends) -
+                                              min(starts).timestamp()))
+
+
+def _merge_suite(suite, other, order):
+    tests = suite.findall('test')
+    known_tests = {test.get('name') for test in tests}
+    suites = {child.get('name'): child for child in suite.findall('suite')}
+
+    for child in other.findall('suite'):
+        if child.get('name') in suites:
+            _merge_suite(suites[child.get('name')], child, order)
+        else:
+            suites[child.get('name')] = copy.deepcopy(child)
+            suite.append(suites[child.get('name')])
+    tests += [copy.deepcopy(test) for test in other.findall('test')
+              if test.get('name') not in known_tests]
+    _merge_status(suite.find('status'), other.find('status'))
+
+    # Restore the original order of suites and tests, keeping suite setup,
+    # teardown, documentation, metadata and status around them
+    children = list(suite)
+    for child in children:
+        if child.tag in ('suite', 'test'):
+            suite.remove(child)
+    position = next((i for i, child in enumerate(list(suite))
+                     if not (child.tag == 'kw' and
+                             child.get('type') == 'SETUP') and
+                     child.tag != 'setup'), len(suite))
+    key = order.get
+    ordered = sorted(suites.values(), key=lambda s: key(s.get('_path'), 0))
+    ordered += sorted(tests, key=lambda t: key(t.get('_path'), 0))
+    for offset, child in enumerate(ordered):
+        suite.insert(position + offset, child)
+
+
+def _annotate_paths(suite, path=()):
+    path = path + (suite.get('name'),)
+    suite.set('_path', '.'.join(path))
+    for test in suite.findall('test'):
+        test.set('_path', '.'.join(path + (test.get('name'),)))
+    for child in suite.findall('suite'):
+        _annotate_paths(child, path)
+
+
+def _strip_paths(root):
+    for elem in root.iter():
+        elem.attrib.pop('_path', None)
+
+
+def _merge_errors(errors, other):
+    """Adds the messages of other not in errors yet, ignoring timestamps.
+
+    Every shard runs the suite setups of its tests, suite level errors would
+    otherwise be repeated once per shard.
+    """
+    known = {(msg.get('level'), msg.text) for msg in errors}
+    for msg in other:
+        if (msg.get('level'), msg.text) not in known:
+            known.add((msg.get('level'), msg.text))
+            errors.append(copy.deepcopy(msg))
+
+
+def merge_outputs(outputs, dest, tests):
+    """Merges the output.xml files of all shards of a test application.
+
+    :param outputs: output.xml files of the shards
+    :param dest:    Path of the merged output.xml
+    :param tests:   Long names of all tests in the order of a single run
+    """
+    order = {}
+    for index, test in enumerate(tests):
+        order[test] = index
+        parts = test.split('.')
+        for depth in range(1, len(parts)):
+            order.setdefault('.'.join(parts[:depth]), index)
+
+    trees = [ET.parse(output) for output in outputs]
+    base = trees[0].getroot()
+    for tree in trees:
+        _annotate_paths(tree.getroot().find('suite'))
+    for tree in trees[1:]:
+        _merge_suite(base.find('suite'), tree.getroot().find('suite'), order)
+        errors = tree.getroot().find('errors')
+        if errors is not None and base.find('errors') is not None:
+            _merge_errors(base.find('errors'), errors)
+    _strip_paths(base)
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    trees[0].write(dest, encoding='UTF-8', xml_declaration=True)
+
+    # Let RobotFramework recalculate the statistics of the merged suites
+    from robot.api import ExecutionResult
+
+    ExecutionResult(dest).save(dest)
+    return dest
@@ -1,101 +1,111 @@
 #! /usr/bin/env python3
+import os
 import sys
+import shutil
 import argparse
+import tempfile
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as DT
+from pathlib import Path
 
 
 TIME_FORMAT = "%Y%m%d %H:%M:%S.%f"
 XUNIT_OUT = "xunit.xml"
+ROBOT_OUT = "output.xml"
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8'?>\n"
 
-args_parser = argparse.ArgumentParser(
-    description="Parse RobotFrameworks output.xml to xUnit format",
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-)
-args_parser.add_argument(
-    "--output",
-    type=str,
-    help="path to file where the output should be written to",
-    default=XUNIT_OUT,
-)
-args_parser.add_argument(
-    "input", type=str, help="path to a file in RobotFramework output format"
-)
-args = args_parser.parse_args()
-
-tree = ET.parse(args.input)
-root = tree.getroot()
-
-suite = root.find("suite")
-testsuite = {
-    "name": suite.get("name"),
-    "failures": 0,
-    "skipped": 0,
-}
-
-starttime = DT.strptime(suite.find("status").get("starttime"), TIME_FORMAT)
-endtime = DT.strptime(suite.find("status").get("endtime"), TIME_FORMAT)
-suitetime = str((endtime - starttime).total_seconds())
-testsuite["time"] = suitetime
-
-testcases = list()
-child_suites = suite.findall("suite")
-for suite in child_suites:
-    for test in suite.findall("test"):
-        testcase = {
-            "classname": f"{testsuite['name']}.{suite.get('name')}",
-            "name": test.get("name"),
-            "failed": False,
-            "skipped": False,
-        }
-
-        starttime = DT.strptime(test.find("status").get("starttime"), TIME_FORMAT)
-        endtime = DT.strptime(test.find("status").get("endtime"), TIME_FORMAT)
-        testtime = str((endtime - starttime).total_seconds())
-        testcase["time"] = testtime
-
-        # check if testcase failed
-        if test.find("status").get("status") == "FAIL":
-            testcase["failed"] = True
-            testcase["failed_text"] = test.find("status").text
-            testsuite["failures"] += 1
-
-        elif test.find("status").get("status") == "SKIP":
-            testcase["skipped"] = True
-            testcase["skipped_text"] = test.find("status").text
-            testsuite["skipped"] += 1
-
-        testcase["records"] = list()
-        for record in test.findall(".//kw[@name='Record Property']"):
-            r = dict()
-            for e in record.iter("msg"):
-                text = e.text
-                if text.startswith("NAME:"):
-                    r["name"] = text[len("NAME: ") :]
-                elif text.startswith("VALUE:"):
-                    r["value"] = text[len("VALUE: ") :]
-            testcase["records"].append(r)
-        testcases.append(testcase)
-
-stats = root.find("statistics/total")
-total_all = next(obj for obj in stats if obj.text == 'All Tests')
-testsuite["failures"] = str(int(total_all.get("fail")))
-testsuite["skipped"] = str(int(total_all.get("skip")))
-testsuite["errors"] = str(len(root.find("errors")))
-testsuite["testcases"] = testcases
-testsuite["tests"] = str(len(testsuite["testcases"]))
-
-# Parsing done, building the xunit output
-newroot = ET.Element("testsuite")
-newroot.set("name", testsuite["name"])
-newroot.set("tests", testsuite["tests"])
-newroot.set("errors", testsuite["errors"])
-newroot.set("failures", testsuite["failures"])
-newroot.set("skipped", testsuite["skipped"])
-newroot.set("time", testsuite["time"])
-
-for tc in testsuite["testcases"]:
-    testcase = ET.SubElement(newroot, "testcase")
+
+def _elapsed(status):
+    starttime = DT.strptime(status.get("starttime"), TIME_FORMAT)
+    endtime = DT.strptime(status.get("endtime"), TIME_FORMAT)
+    return str((endtime - starttime).total_seconds())
+
+
+def _parse_record_msg(record, text):
+    if text.startswith("NAME:"):
+        record["name"] = text[len("NAME: ") :]
+    elif text.startswith("VALUE:"):
+        record["value"] = text[len("VALUE: ") :]
+
+
+def _set_testcase_status(testcase, status):
+    testcase["time"] = _elapsed(status)
+
+    # check if testcase failed
+    if status.get("status") == "FAIL":
+        testcase["failed"] = True
+        testcase["failed_text"] = status.text
+
+    elif status.get("status") == "SKIP":
+        testcase["skipped"] = True
+        testcase["skipped_text"] = status.text
+
+
+def _new_testcase(suite_name, child_suite_name, test_name):
+    return {
+        "classname": f"{suite_name}.{child_suite_name}",
+        "name": test_name,
+        "failed": False,
+        "skipped": False,
+        "records": list(),
+    }
+
+
+def parse_output(path):
+    """Parses a RobotFramework output.xml into a testsuite dict."""
+    tree = ET.parse(path)
+    root = tree.getroot()
+
+    suite = root.find("suite")
+    testsuite = {
+        "name": suite.get("name"),
+        "failures": 0,
+        "skipped": 0,
+    }
+    testsuite["time"] = _elapsed(suite.find("status"))
+
+    testcases = list()
+    child_suites = suite.findall("suite")
+    for suite in child_suites:
+        for test in suite.findall("test"):
+            testcase = _new_testcase(testsuite["name"], suite.get("name"),
+                                     test.get("name"))
+            _set_testcase_status(testcase, test.find("status"))
+
+            for record in test.findall(".//kw[@name='Record Property']"):
+                # e.g. in IF branches that were not taken
+                if record.find("status").get("status") == "NOT RUN":
+                    continue
+                r = dict()
+                for e in record.iter("msg"):
+                    _parse_record_msg(r, e.text)
+                testcase["records"].append(r)
+            testcases.append(testcase)
+
+    stats = root.find("statistics/total")
+    total_all = next(obj for obj in stats if obj.text == 'All Tests')
+    testsuite["failures"] = str(int(total_all.get("fail")))
+    testsuite["skipped"] = str(int(total_all.get("skip")))
+    testsuite["errors"] = str(len(root.find("errors")))
+    testsuite["testcases"] = testcases
+    testsuite["tests"] = str(len(testsuite["testcases"]))
+    return testsuite
+
+
+def _testsuite_element(testsuite):
+    newroot = ET.Element("testsuite")
+    newroot.set("name", testsuite["name"])
+    newroot.set("tests", testsuite["tests"])
+    newroot.set("errors", testsuite["errors"])
+    newroot.set("failures", testsuite["failures"])
+    newroot.set("skipped", testsuite["skipped"])
+    newroot.set("time", testsuite["time"])
+    return newroot
+
+
+def _testcase_element(parent, tc):
+    testcase = ET.SubElement(parent, "testcase")
     testcase.set("classname", tc["classname"])
     testcase.set("name", tc["name"])
     testcase.set("time", tc["time"])
@@ -116,9 +126,246 @@ for tc in testsuite["testcases"]:
                 record.set("value", r["value"])
             except KeyError:
                 pass
+    return testcase
+
+
+def write_xunit(testsuite, output):
+    """Writes a parsed testsuite dict in xUnit format."""
+    newroot = _testsuite_element(testsuite)
+    for tc in testsuite["testcases"]:
+        _testcase_element(newroot, tc)
+
+    newtree = ET.ElementTree(newroot)
+    newtree.write(output, encoding="UTF-8", xml_declaration=True)
+
+
+def convert(path, output):
+    """Converts output.xml to xunit.xml, returns the number of failed tests."""
+    testsuite = parse_output(path)
+    write_xunit(testsuite, output)
+    return int(testsuite["failures"])
+
+
+def convert_streaming(path, output):
+    """Converts output.xml to xunit.xml with bounded memory usage.
+
+    The input is read with iterparse and every subtree is cleared as soon as
+    it is processed. Serialized testcases are spooled to a temporary file
+    since the testsuite attributes are only known after the whole input was
+    read. The output is identical to the one of convert().
+
+    Returns the number of failed tests.
+    """
+    testsuite = {"tests": 0}
+    total_all = None
+    errors = 0
+
+    path_tags = []
+    testcase = None
+    open_records = []
+    record_depths = []
+
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as spool:
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                path_tags.append(elem.tag)
+                depth = len(path_tags)
+                if depth == 2 and elem.tag == "suite":
+                    testsuite["name"] = elem.get("name")
+                elif depth == 3 and elem.tag == "suite":
+                    child_suite_name = elem.get("name")
+                elif (depth == 4 and elem.tag == "test" and
+                        path_tags[1:3] == ["suite", "suite"]):
+                    testcase = _new_testcase(testsuite["name"],
+                                             child_suite_name, elem.get("name"))
+                elif (testcase is not None and elem.tag == "kw" and
+                        elem.get("name") == "Record Property"):
+                    r = dict()
+                    testcase["records"].append(r)
+                    open_records.append(r)
+                    record_depths.append(depth)
+                continue
+
+            depth = len(path_tags)
+            path_tags.pop()
+            if testcase is not None:
+                if elem.tag == "msg" and open_records:
+                    # nested records also contain the msgs of their children
+                    for r in open_records:
+                        _parse_record_msg(r, elem.text)
+                elif elem.tag == "kw" and elem.get("name") == "Record Property":
+                    open_records.pop()
+                    record_depths.pop()
+                elif (elem.tag == "status" and record_depths and
+                        depth == record_depths[-1] + 1 and
+                        elem.get("status") == "NOT RUN"):
+                    r = open_records[-1]
+                    testcase["records"] = [x for x in testcase["records"]
+                                           if x is not r]
+                elif depth == 5 and elem.tag == "status":
+                    _set_testcase_status(testcase, elem)
+                elif depth == 4 and elem.tag == "test":
+                    parent = ET.Element("testsuite")
+                    _testcase_element(parent, testcase)
+                    spool.write(ET.tostring(parent[0], encoding="unicode"))
+                    testsuite["tests"] += 1
+                    testcase = None
+                    # the test is done, drop it from its suite as well
+                    elem.clear()
+                    continue
+                if depth > 4:
+                    elem.clear()
+            else:
+                if depth == 3 and elem.tag == "status" and path_tags[1] == "suite":
+                    testsuite["time"] = _elapsed(elem)
+                elif elem.tag == "stat" and path_tags[1:] == ["statistics", "total"]:
+                    if total_all is None and elem.text == 'All Tests':
+                        total_all = dict(elem.attrib)
+                elif depth == 3 and path_tags[1] == "errors":
+                    errors += 1
+                if depth >= 3:
+                    elem.clear()
+
+        testsuite["failures"] = str(int(total_all.get("fail")))
+        testsuite["skipped"] = str(int(total_all.get("skip")))
+        testsuite["errors"] = str(errors)
+        testsuite["tests"] = str(testsuite["tests"])
+
+        # Write the testsuite tag by hand, followed by the spooled testcases
+        header = ET.tostring(_testsuite_element(testsuite), encoding="unicode",
+                             short_empty_elements=False)
+        header = header[:-len("</testsuite>")]
+        with open(output, "w", encoding="utf-8") as fd:
+            fd.write(XML_DECLARATION)
+            if spool.tell() == 0:
+                fd.write(header[:-1] + " />")
+            else:
+                fd.write(header)
+                spool.seek(0)
+                shutil.copyfileobj(spool, fd)
+                fd.write("</testsuite>")
+
+    return int(testsuite["failures"])
+
+
+def _read_xunit_failures(path):
+    """Reads the failures attribute of an existing xunit.xml.
+
+    Returns None if the file is unreadable, e.g. truncated by an aborted
+    conversion, or its root lacks a valid failures attribute.
+    """
+    try:
+        for _, elem in ET.iterparse(path, events=("start",)):
+            return int(elem.get("failures"))
+    except (OSError, ET.ParseError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _convert_job(job):
+    path, output, streaming = job
+    try:
+        if streaming:
+            return path, convert_streaming(path, output), None
+        return path, convert(path, output), None
+    except Exception as exc:
+        return path, None, exc
+
+
+def convert_batch(directory, output_name=XUNIT_OUT, jobs=None,
+                  streaming=False, force=False):
+    """Converts every output.xml below directory using a process pool.
+
+    Each result is written next to its output.xml. Inputs whose result is
+    newer than the input are skipped unless force is set, their failures are
+    taken from the existing result. Unreadable results are converted again.
+
+    Returns the total number of failed tests and failed conversions.
+    """
+    failures = 0
+    pending = []
+    for path in sorted(Path(directory).rglob(ROBOT_OUT)):
+        output = path.with_name(output_name)
+        if (not force and output.exists() and
+                output.stat().st_mtime > path.stat().st_mtime):
+            failed = _read_xunit_failures(output)
+            if failed is not None:
+                print(f" . {path}: up to date")
+                failures += failed
+                continue
+            print(f" . {output}: unreadable, converting again", file=sys.stderr)
+        pending.append((str(path), str(output), streaming))
+
+    if not pending:
+        return failures
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for path, failed, exc in pool.map(_convert_job, pending):
+            if exc is not None:
+                print(f" . {path}: conversion failed: {exc!r}", file=sys.stderr)
+                failures += 1
+            else:
+                print(f" . {path}: {failed} failure(s)")
+                failures += failed
+
+    return failures
+
+
+def main():
+    args_parser = argparse.ArgumentParser(
+        description="Parse RobotFrameworks output.xml to xUnit format",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    args_parser.add_argument(
+        "--output",
+        type=str,
+        help="path to file where the output should be written to",
+        default=XUNIT_OUT,
+    )
+    args_parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="parse the input incrementally to keep memory usage bounded, "
+             "recommended for large output.xml files",
+    )
+    args_parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="treat input as a directory and convert every output.xml found "
+             "below it, results are written next to each input using the "
+             "file name given by --output",
+    )
+    args_parser.add_argument(
+        "--jobs",
+        type=int,
+        help="number of worker processes used with --batch, defaults to the "
+             "number of CPUs",
+        default=None,
+    )
+    args_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="with --batch, also convert inputs whose result is up to date",
+    )
+    args_parser.add_argument(
+        "input", type=str, help="path to a file in RobotFramework output format"
+    )
+    args = args_parser.parse_args()
+
+    if args.batch:
+        failures = convert_batch(args.input, os.path.basename(args.output),
+                                 args.jobs, args.streaming, args.force)
+        # Exit codes are truncated to 8 bit, make sure failures are not lost
+        return min(failures, 255)
+
+    if args.streaming:
+        failures = convert_streaming(args.input, args.output)
+    else:
+        failures = convert(args.input, args.output)
+
+    # To catch failures in make we add failures to the exit code
+    return failures
 
-newtree = ET.ElementTree(newroot)
-newtree.write(args.output, encoding="UTF-8", xml_declaration=True)
 
-# To catch failures in make we add failures to the exit code
-sys.exit(int(total_all.get("fail")))
+if __name__ == "__main__":
+    sys.exit(main())
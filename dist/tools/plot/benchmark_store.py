@@ -0,0 +1,183 @@
+"""Parsed and cached benchmark results from xunit files.
+
+Parsing xunit files with large benchmark properties and decoding the recorded
+statistics is expensive. The BenchmarkStore does this once per xunit file and
+keeps the result in an on-disk cache (one .npz file per xunit file) that is
+invalidated as soon as the path, mtime or size of the xunit file changes.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import xmltodict
+
+# The benchmark statistics are shared with the RobotFramework libraries
+sys.path.append(str(Path(__file__).resolve().parents[2] / "robotframework" / "lib"))
+from bench_stats import BenchStats  # noqa: E402
+
+LOG = logging.getLogger(__name__)
+
+
+class BenchmarkStore:
+    """Indexed store of benchmark properties parsed from xunit files.
+
+    Properties starting with DECODED_PROPERTY_PREFIX hold recorded statistics
+    dicts, their values are decoded into float64 arrays. Statistics recorded
+    without values (BENCH_RECORD_VALUES=0) are approximated by the buckets of
+    their quantile sketch. Other properties are kept as lists of raw strings,
+    except for IGNORED_PROPERTIES and the command timings
+    (IGNORED_PROPERTY_PREFIXES) which are dropped entirely. Recorded traces are
+    never parsed, use trace_encoding.decode_trace() to load them on request.
+    """
+
+    CACHE_VERSION = 1
+    DECODED_PROPERTY_PREFIX = 'bench_'
+    TRACE_PROPERTY = 'trace'
+    IGNORED_PROPERTIES = (TRACE_PROPERTY,)
+    IGNORED_PROPERTY_PREFIXES = ('cmd-timing-',)
+
+    def __init__(self, cache_dir=None, values_key="values"):
+        self.cache_dir = cache_dir
+        self.values_key = values_key
+
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def load(self, xunit_file, testsuite_name_pattern):
+        """Returns the properties and decoded values of a xunit file.
+
+        :param xunit_file:              Path to the xunit file
+        :param testsuite_name_pattern:  Regex the testsuite name has to match
+
+        :return: Tuple (props, values) with props being {testcase: {property:
+                 [raw values]}} and values being {(testcase, property): array}
+        """
+        stat = os.stat(xunit_file)
+        source = {
+            'version': self.CACHE_VERSION,
+            'path': os.path.abspath(xunit_file),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+        }
+
+        cached = self._read_cache(source)
+        if cached is not None:
+            LOG.debug("Using cached benchmarks for {}".format(xunit_file))
+            return cached
+
+        props, values = self._parse_xunit_file(xunit_file, testsuite_name_pattern)
+        self._write_cache(source, props, values)
+        return props, values
+
+    def _cache_file(self, source):
+        key = hashlib.sha1(source['path'].encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, "{}.npz".format(key))
+
+    def _read_cache(self, source):
+        if not self.cache_dir:
+            return None
+
+        cache_file = self._cache_file(source)
+        if not os.path.exists(cache_file):
+            return None
+
+        with np.load(cache_file, allow_pickle=False) as cache:
+            if json.loads(str(cache['source'])) != source:
+                return None
+
+            props = json.loads(str(cache['props']))
+            values = {}
+            for key, (testcase, prop) in enumerate(json.loads(str(cache['index']))):
+                values[(testcase, prop)] = cache["v{}".format(key)]
+
+        return props, values
+
+    def _write_cache(self, source, props, values):
+        if not self.cache_dir:
+            return
+
+        index = list(values.keys())
+        arrays = {"v{}".format(key): values[name] for key, name in enumerate(index)}
+
+        # Write to a temporary file first, parallel runs may share the cache
+        cache_file = self._cache_file(source)
+        tmp_file = "{}.{}.tmp.npz".format(cache_file[:-len(".npz")], os.getpid())
+        np.savez(
+            tmp_file,
+            source=np.array(json.dumps(source)),
+            props=np.array(json.dumps(props)),
+            index=np.array(json.dumps(index)),
+            **arrays
+        )
+        os.replace(tmp_file, cache_file)
+
+    def _decode_values(self, raw_values):
+        values = []
+        for traceset_json in raw_values:
+            traceset = json.loads(traceset_json.replace("'", "\""))
+            if self.values_key not in traceset and 'sketch' in traceset:
+                stats = BenchStats.from_dict(traceset)
+                buckets, counts = stats.sketch.buckets()
+                values.extend(np.repeat(np.clip(buckets, stats.min, stats.max), counts))
+                continue
+            values.extend(traceset[self.values_key])
+
+        return np.asarray(values, dtype=np.float64)
+
+    @staticmethod
+    def decode_stats(raw_values):
+        """Merges recorded statistics dicts into one BenchStats instance.
+
+        Only the summaries and sketches are merged, so the cost does not
+        depend on the number of samples.
+        """
+        stats = BenchStats()
+        for traceset_json in raw_values:
+            stats.merge(BenchStats.from_dict(json.loads(traceset_json.replace("'", "\""))))
+        return stats
+
+    def _parse_xunit_file(self, xunit_file, testsuite_name_pattern):
+        # Parse xUnit file
+        with open(xunit_file) as fd:
+            xunit = xmltodict.parse(fd.read())
+
+        # Verify testsuite
+        testsuite = xunit['testsuite']
+        if not re.match(testsuite_name_pattern, testsuite['@name']):
+            raise ImportError("Testsuite names doesn't match! Expected: '{}', Actual: '{}'".format(
+                testsuite_name_pattern,
+                testsuite['@name']
+            ))
+
+        # Extract benchmarks (testcase properties) from testsuite
+        benchmarks = {}
+        values = {}
+        for benchmark in testsuite['testcase']:
+            if 'skipped' in benchmark:
+                continue
+
+            props = {}
+            raw_values = {}
+            for property in benchmark['properties']['property']:
+                try:
+                    name = property['@name']
+                    if name in self.IGNORED_PROPERTIES or name.startswith(self.IGNORED_PROPERTY_PREFIXES):
+                        continue
+                    if name.startswith(self.DECODED_PROPERTY_PREFIX):
+                        raw_values.setdefault(name, []).append(property['@value'])
+                    else:
+                        props.setdefault(name, []).append(property['@value'])
+                except TypeError:
+                    pass  # Failed tests have empty props
+
+            for name, raw in raw_values.items():
+                values[(benchmark['@name'], name)] = self._decode_values(raw)
+
+            benchmarks[benchmark['@name']] = props
+
+        return benchmarks, values
@@ -4,19 +4,25 @@ import argparse
 import json
 import logging
 import os
-import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from pathlib import Path
 from si_prefix import si_format
-import xmltodict
 
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
 
+from benchmark_store import BenchmarkStore
+from static_report import StaticReport
+
 LOG = logging.getLogger(__name__)
 
+# A single figure to render: Name of the FigurePlotter plot method and its kwargs
+FigureSpec = namedtuple('FigureSpec', ['plot', 'kwargs'])
+
 
 class FigurePlotter:
 
@@ -46,29 +52,41 @@ class FigurePlotter:
         yaxis_showline=True
     )
 
-    def __init__(self, indir, outdir, dump_data):
+    def __init__(self, indir, outdir, dump_data, cache_dir=None, report=False):
         self.indir = indir
         self.outdir = outdir
         self.dump_data = dump_data
+        self.store = BenchmarkStore(cache_dir)
+        self.report = StaticReport(outdir) if report else None
+        self._report_group = None
+        self._report_entries = []
 
         self.benchmarks = {}
+        self.benchmark_values = {}
         self.board_fcpu = {}
         self.gpio_latencies = {}
+        self.absolute_timeouts = set()
+        self.periodic_timeouts = set()
 
         self._parse_all_benchmarks_from_dir(self.indir)
         self._validate_benchmark_data()
         self._calc_board_fcpu()
         self._calc_gpio_latencies()
+        self._index_timeout_benchmarks()
 
         # GPIO latencies 500 repeats (TEST_REPEATS = 10)
         # self.gpio_latencies = {'arduino-mega2560': 5.010871000000085e-06, 'nucleo-l152re': 7.175460000000281e-07, 'stk3200': 1.083816000000127e-06, 'nucleo-f767zi': 4.309980000001695e-07, 'nucleo-f103rb': 4.6523099999990044e-07, 'esp32-wroom-32': 4.677369999999414e-07, 'z1': 7.87545200000019e-06, 'esp8266-esp-12x': 4.3250200000000227e-07, 'slstk3401a': 5.742140000002957e-07, 'slstk3400a': 1.083989999999952e-06, 'nucleo-g474re': 1.0577600000019707e-07}
 
     def _parse_all_benchmarks_from_dir(self, directory):
         for path in Path(directory).rglob(self.XUNIT_FILE_PATTERN):
-            xunit_data = self._parse_xunit_file(path)
+            xunit_data, values = self.store.load(path, self.XUNIT_TESTSUITE_NAME_PATTERN)
             board = xunit_data['Record Metadata']['board'][0]
             suite = xunit_data['Record Metadata']['testsuite'][0]
 
+            # Index decoded benchmark values by (board, suite, testcase, property)
+            for (testcase, prop), data in values.items():
+                self.benchmark_values[(board, suite, testcase, prop)] = data
+
             api = 'UNKNOWN'
             if suite == self.SUITE_UTIMER:
                 api = 'periph_utimer'
@@ -91,46 +109,6 @@ class FigurePlotter:
                 suite
             ))
 
-    def _parse_xunit_file(self, xunit_file, testsuite_name_pattern=XUNIT_TESTSUITE_NAME_PATTERN):
-        # Parse xUnit file
-        with open(xunit_file) as fd:
-            self.xunit = xmltodict.parse(fd.read())
-
-        # Verify testsuite
-        testsuite = self.xunit['testsuite']
-        if not re.match(testsuite_name_pattern, testsuite['@name']):
-            raise ImportError("Testsuite names doesn't match! Expected: '{}', Actual: '{}'".format(
-                testsuite_name_pattern,
-                testsuite['@name']
-            ))
-
-        # Extract benchmarks (testcase properties) from testsuite
-        benchmarks = {}
-        for benchmark in testsuite['testcase']:
-            if 'skipped' in benchmark:
-                continue
-
-            props = {}
-            for property in benchmark['properties']['property']:
-                try:
-                    if property['@name'] not in props:
-                        props[property['@name']] = []
-                    props[property['@name']].append(property['@value'])
-                except TypeError:
-                    pass  # Failed tests have empty props
-
-            benchmarks[benchmark['@name']] = props
-
-        return benchmarks
-
-    def _extract_bench_values_from_json(self, bench_props, values_key="values"):
-        values = []
-        for traceset_json in bench_props:
-            traceset = json.loads(traceset_json.replace("'", "\""))
-            values = values + traceset[values_key]
-
-        return values
-
     def _validate_benchmark_data(self):
         for board, benchmarks in self.benchmarks.items():
             for suite in self.EXPECTED_SUITES:
@@ -157,15 +135,41 @@ class FigurePlotter:
 
     def _calc_gpio_latencies(self):
         for board, suites in self.benchmarks.items():
-            durations = []
-            for suite in suites.values():
-                durations = durations + self._extract_bench_values_from_json(
-                    suite['benchmarks']['Measure GPIO Latency 1us']['bench_gpio_latency']
-                )
+            durations = np.concatenate([
+                self._get_benchmark_data(board, suite, 'Measure GPIO Latency 1us', 'bench_gpio_latency')
+                for suite in suites.keys()
+            ])
 
             self.gpio_latencies[board] = np.average(durations)
             LOG.info("GPIO Latency on board {} = {}".format(board, self.gpio_latencies[board]))
 
+    def _index_timeout_benchmarks(self):
+        """Collects all (freq, ticks) and (freq, ticks, cycles) tuples of the
+        absolute and periodic timeout benchmarks present in the parsed data.
+        """
+        for suites in self.benchmarks.values():
+            for suite_data in suites.values():
+                for bench_name, bench_data in suite_data['benchmarks'].items():
+                    if not bench_data:
+                        continue
+
+                    if bench_name.startswith('Benchmark Absolute Timeouts'):
+                        self.absolute_timeouts.add((
+                            int(bench_data['frequency'][0]),
+                            int(bench_data['ticks'][0])
+                        ))
+                    elif bench_name.startswith('Benchmark Periodic Timeouts'):
+                        self.periodic_timeouts.add((
+                            int(bench_data['frequency'][0]),
+                            int(bench_data['ticks'][0]),
+                            int(bench_data['cycles'][0])
+                        ))
+
+        LOG.info("Found {} absolute and {} periodic timeout configurations".format(
+            len(self.absolute_timeouts),
+            len(self.periodic_timeouts)
+        ))
+
     def _dump_dataframe_to_csv(self, df, title):
         outfile = "{}.csv".format(os.path.join(self.outdir, title))
         df.to_csv(
@@ -177,11 +181,16 @@ class FigurePlotter:
         LOG.info("Exported DataFrame to csv: {}".format(outfile))
 
     def _save_figure_as_html(self, fig, title):
+        if self.report is not None:
+            self._report_entries.append(self.report.add_figure(fig, title, group=self._report_group))
+            return
+
+        # All figures share the plotly.min.js written next to them
         outfile = "{}.html".format(os.path.join(self.outdir, title))
         fig.write_html(
             outfile,
             full_html=True,
-            include_plotlyjs=True,
+            include_plotlyjs="directory",
         )
         LOG.info("Wrote figure: {}".format(outfile))
 
@@ -197,9 +206,7 @@ class FigurePlotter:
         self._save_figure_as_image(fig, title, filetype="pdf")
 
     def _get_benchmark_data(self, board, testsuite, testcase, datavar):
-        return self._extract_bench_values_from_json(
-            self.benchmarks[board][testsuite]['benchmarks'][testcase][datavar]
-        )
+        return self.benchmark_values[(board, testsuite, testcase, datavar)]
 
     def _get_gpio_latency(self, board):
         return self.gpio_latencies[board]
@@ -207,6 +214,114 @@ class FigurePlotter:
     def get_boards(self):
         return self.benchmarks.keys()
 
+    def _find_benchmarks(self, prefix, boards=None, timeout=None, **props):
+        """Returns (board, suite, testcase) of all benchmarks matching the
+        given testcase name prefix and integer properties (e.g. frequency).
+        """
+        matches = []
+        for board in (boards if boards is not None else self.benchmarks.keys()):
+            for suite, suite_data in self.benchmarks[board].items():
+                for case, data in suite_data['benchmarks'].items():
+                    if not case.startswith(prefix) or not data:
+                        continue
+                    if any(int(data[prop][0]) != value for prop, value in props.items()):
+                        continue
+                    if timeout is not None and int(data['ticks'][0])/int(data['frequency'][0]) != timeout:
+                        continue
+                    matches.append((board, suite, case))
+
+        return matches
+
+    def get_figure_specs(self):
+        """Returns the list of all figures to plot, overview plots first."""
+        specs = [FigureSpec('plot_gpio_latencies', {})]
+
+        for operation in ["Read", "Write", "Set", "Clear"]:
+            specs.append(FigureSpec('plot_simple_operations', dict(op=operation)))
+            specs.append(FigureSpec('plot_simple_operations', dict(op=operation, convert_to_cpu_cycles=True)))
+
+        # Only timeout configurations that were actually benchmarked
+        for freq, ticks in sorted(self.absolute_timeouts):
+            specs.append(FigureSpec('plot_absolute_timeout_latencies', dict(freq=freq, ticks=ticks)))
+        for freq, ticks, cycles in sorted(self.periodic_timeouts):
+            specs.append(FigureSpec('plot_periodic_timeout_latencies', dict(freq=freq, ticks=ticks, cycles=cycles)))
+
+        for channels in range(1, 9):
+            specs.append(FigureSpec('plot_parallel_callbacks', dict(channels=channels)))
+
+        # Board specific plots
+        for board in self.get_boards():
+            specs.append(FigureSpec('plot_board_gpio_latency', dict(board=board)))
+            specs.append(FigureSpec('plot_board_read_write_ops', dict(board=board)))
+            specs.append(FigureSpec('plot_board_set_clear_ops', dict(board=board)))
+
+            for freq in [10e6, 10e5, 10e4, 10e3]:
+                specs.append(FigureSpec('plot_board_absolute_timeouts_grouped_by_freq', dict(board=board, freq=freq)))
+
+            for timeout in [1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1e-0]:
+                specs.append(FigureSpec('plot_board_absolute_timeouts_grouped_by_timeout', dict(board=board, timeout=timeout)))
+
+            specs.append(FigureSpec('plot_board_periodic_timeouts_grouped_by_timeout', dict(board=board, timeout=1e-3)))
+
+            specs.append(FigureSpec('plot_board_parallel_callback_latencies', dict(board=board)))
+
+        return specs
+
+    def has_data(self, spec):
+        """Checks whether there are any benchmarks to plot for the given
+        FigureSpec without building the figure.
+        """
+        kwargs = spec.kwargs
+        boards = [kwargs['board']] if 'board' in kwargs else None
+
+        if spec.plot == 'plot_absolute_timeout_latencies':
+            return (kwargs['freq'], kwargs['ticks']) in self.absolute_timeouts
+        if spec.plot == 'plot_periodic_timeout_latencies':
+            return (kwargs['freq'], kwargs['ticks'], kwargs['cycles']) in self.periodic_timeouts
+        if spec.plot == 'plot_parallel_callbacks':
+            return bool(self._find_benchmarks('Benchmark Parallel Callbacks', channels=kwargs['channels']))
+        if spec.plot == 'plot_board_absolute_timeouts_grouped_by_freq':
+            return bool(self._find_benchmarks('Benchmark Absolute Timeouts', boards, frequency=kwargs['freq']))
+        if spec.plot == 'plot_board_absolute_timeouts_grouped_by_timeout':
+            return bool(self._find_benchmarks('Benchmark Absolute Timeouts', boards, timeout=kwargs['timeout']))
+        if spec.plot == 'plot_board_periodic_timeouts_grouped_by_timeout':
+            return bool(self._find_benchmarks('Benchmark Periodic Timeouts', boards, timeout=kwargs['timeout']))
+        if spec.plot == 'plot_board_parallel_callback_latencies':
+            return bool(self._find_benchmarks('Benchmark Parallel Callbacks', boards))
+
+        return True
+
+    def plot(self, spec):
+        """Renders a FigureSpec, returns the report entries of its figures."""
+        self._report_group = spec.kwargs.get('board')
+        self._report_entries = []
+        getattr(self, spec.plot)(**spec.kwargs)
+        return self._report_entries
+
+    def write_manifest(self, specs, outfile):
+        """Writes the benchmarked timeout configurations and the list of
+        figures to plot as JSON.
+        """
+        manifest = {
+            'boards': sorted(self.get_boards()),
+            'absolute_timeouts': [
+                dict(frequency=freq, ticks=ticks)
+                for freq, ticks in sorted(self.absolute_timeouts)
+            ],
+            'periodic_timeouts': [
+                dict(frequency=freq, ticks=ticks, cycles=cycles)
+                for freq, ticks, cycles in sorted(self.periodic_timeouts)
+            ],
+            'figures': [
+                dict(plot=spec.plot, kwargs=spec.kwargs)
+                for spec in specs
+            ]
+        }
+
+        with open(outfile, 'w') as fd:
+            json.dump(manifest, fd, indent=2)
+        LOG.info("Wrote manifest: {}".format(outfile))
+
     #############################
     ### Board specific plots ####
     #############################
@@ -221,7 +336,7 @@ class FigurePlotter:
                         continue
 
                     timeout_us = int(data['timeout_us'][0])
-                    for duration in self._extract_bench_values_from_json(data['bench_gpio_latency']):
+                    for duration in self._get_benchmark_data(board, testsuite, case, 'bench_gpio_latency'):
                         durations.append({
                             'api': testsuite_data['api'],
                             'timeout': timeout_us / 1e6,
@@ -366,7 +481,7 @@ class FigurePlotter:
                     if int(data['frequency'][0]) == freq:
                         timeout = int(data['ticks'][0])/int(data['frequency'][0])
                         if timeout not in ignored_timeouts:
-                            for duration in self._extract_bench_values_from_json(data['bench_absolute_timeouts']):
+                            for duration in self._get_benchmark_data(board, testsuite, case, 'bench_absolute_timeouts'):
                                 duration = duration - self._get_gpio_latency(board)
                                 timeouts.append({
                                     'api': testsuite_data['api'],
@@ -427,7 +542,7 @@ class FigurePlotter:
 
                     case_timeout = int(data['ticks'][0])/int(data['frequency'][0])
                     if case_timeout == timeout:
-                        for duration in self._extract_bench_values_from_json(data['bench_absolute_timeouts']):
+                        for duration in self._get_benchmark_data(board, testsuite, case, 'bench_absolute_timeouts'):
                             duration = duration - self._get_gpio_latency(board)
                             timeouts.append({
                                 'api': testsuite_data['api'],
@@ -488,7 +603,7 @@ class FigurePlotter:
 
                     case_timeout = int(data['ticks'][0])/int(data['frequency'][0])
                     if case_timeout == timeout:
-                        durations = self._extract_bench_values_from_json(data['bench_periodic_timeouts'])
+                        durations = self._get_benchmark_data(board, testsuite, case, 'bench_periodic_timeouts')
                         for duration in durations:
                             cycles = int(data['cycles'][0])
                             duration = (duration / cycles) - self._get_gpio_latency(board)
@@ -557,7 +672,7 @@ class FigurePlotter:
                     case_timeout = int(data['ticks'][0])/int(data['frequency'][0])
                     freq = int(data['frequency'][0])
                     timeout = case_timeout
-                    for duration in self._extract_bench_values_from_json(data['bench_parallel_callbacks']):
+                    for duration in self._get_benchmark_data(board, testsuite, case, 'bench_parallel_callbacks'):
                         duration = duration - self._get_gpio_latency(board)
                         timeouts.append({
                             'api': testsuite_data['api'],
@@ -872,7 +987,7 @@ class FigurePlotter:
                     elif datavar == 'bench_timer_'+op.lower():
                         op_label = 'periph_timer'
 
-                    if durations:
+                    if len(durations):
                         for duration in durations:
                             read_duration = (duration - self._get_gpio_latency(board)) / 10
                             if convert_to_cpu_cycles:
@@ -1034,6 +1149,41 @@ class FigurePlotter:
             self._dump_dataframe_to_csv(df, title)
 
 
+# Plotter instance of a render worker process, set by _init_render_worker()
+_worker_plotter = None
+
+
+def _init_render_worker(plotter):
+    global _worker_plotter
+    _worker_plotter = plotter
+
+
+def _render_figure(spec):
+    return spec, _worker_plotter.plot(spec)
+
+
+def render_figures(plotter, specs, jobs=1):
+    """Renders all given FigureSpecs, using a pool of jobs processes if jobs > 1.
+
+    Returns the report entries of all figures in the order of the specs.
+    """
+    entries = []
+    if jobs <= 1:
+        for spec in specs:
+            entries.extend(plotter.plot(spec))
+        return entries
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_render_worker,
+        initargs=(plotter,)
+    ) as pool:
+        for spec, spec_entries in pool.map(_render_figure, specs):
+            LOG.debug("Rendered figure: {}({})".format(spec.plot, spec.kwargs))
+            entries.extend(spec_entries)
+    return entries
+
+
 def main():
     # Parse and verify CLI args
     parser = argparse.ArgumentParser("Plot generation routines for periph_(u)timer_benchmarks")
@@ -1046,6 +1196,41 @@ def main():
         default=False,
         help="Dumps generated Pandas DaraFrames to outdir"
     )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        help="Directory to cache parsed xunit files in (default: <outdir>/.cache)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        default=False,
+        help="Always parse all xunit files, do not read or write the cache"
+    )
+    parser.add_argument(
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="Number of processes to render figures with (default: 1)"
+    )
+    parser.add_argument(
+        "--skip-empty",
+        dest="skip_empty",
+        action="store_true",
+        default=False,
+        help="Check all figures for data before rendering and skip empty ones"
+    )
+    parser.add_argument(
+        "--report",
+        dest="report",
+        action="store_true",
+        default=False,
+        help="Write a static report (<outdir>/index.html) with a shared plotly.js and "
+             "lazily loaded figure data instead of one HTML file per figure"
+    )
     args = parser.parse_args()
 
     if not os.path.exists(args.indir):
@@ -1064,51 +1249,30 @@ def main():
         ]
     )
 
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or os.path.join(args.outdir, ".cache")
+
     # Generate plots
     plotter = FigurePlotter(
         indir=args.indir,
         outdir=args.outdir,
-        dump_data=args.dump_data
+        dump_data=args.dump_data,
+        cache_dir=cache_dir,
+        report=args.report
     )
 
-    # Overview plots
-    plotter.plot_gpio_latencies()
-
-    for operation in ["Read", "Write", "Set", "Clear"]:
-        plotter.plot_simple_operations(operation)
-        plotter.plot_simple_operations(operation, convert_to_cpu_cycles=True)
-
-    for freq in [1e7, 1e6, 1e5, 1e4, 250000, 32768]:
-        for ticks in [1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 250]:
-            plotter.plot_absolute_timeout_latencies(freq=freq, ticks=ticks)
-            for cycles in [1e0, 1e1, 1e2, 1e3]:
-                plotter.plot_periodic_timeout_latencies(freq=freq, ticks=ticks, cycles=cycles)
-
-    for channels in range(1, 9):
-        plotter.plot_parallel_callbacks(channels)
-
-    # Board specific plots
-    for board in plotter.get_boards():
-        plotter.plot_board_gpio_latency(board)
-        plotter.plot_board_read_write_ops(board)
-        plotter.plot_board_set_clear_ops(board)
-
-        plotter.plot_board_absolute_timeouts_grouped_by_freq(board, freq=10e6)
-        plotter.plot_board_absolute_timeouts_grouped_by_freq(board, freq=10e5)
-        plotter.plot_board_absolute_timeouts_grouped_by_freq(board, freq=10e4)
-        plotter.plot_board_absolute_timeouts_grouped_by_freq(board, freq=10e3)
-
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-6)
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-5)
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-4)
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-3)
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-2)
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-1)
-        plotter.plot_board_absolute_timeouts_grouped_by_timeout(board, timeout=1e-0)
-
-        plotter.plot_board_periodic_timeouts_grouped_by_timeout(board, timeout=1e-3)
-
-        plotter.plot_board_parallel_callback_latencies(board)
+    # Build list of figures and render them
+    specs = plotter.get_figure_specs()
+    if args.skip_empty:
+        num_specs = len(specs)
+        specs = [spec for spec in specs if plotter.has_data(spec)]
+        LOG.info("Skipping {} of {} figures without data".format(num_specs - len(specs), num_specs))
+
+    plotter.write_manifest(specs, os.path.join(args.outdir, "manifest.json"))
+    entries = render_figures(plotter, specs, jobs=args.jobs)
+    if plotter.report is not None:
+        plotter.report.write_index(entries, title="periph_(u)timer Benchmarks")
 
 
 if __name__ == "__main__":
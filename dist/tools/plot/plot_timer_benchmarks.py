@@ -1,47 +1,110 @@
 import os
 import argparse
 import itertools
-import subprocess
+import re
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import xml.etree.ElementTree as ET
 
 from ast import literal_eval
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from static_report import StaticReport, write_plotly_bundle
+
+
+XUNIT_FILE = "xunit.xml"
+TESTSUITE_DIR_PATTERN = r"^tests_[xz]timer_benchmarks$"
+# Command round trip times recorded in test teardowns, see CommandTimings
+IGNORED_PROPERTY_PREFIXES = ("cmd-timing-",)
+
+
+def parse_values(value):
+    """Parses a recorded property value into a float64 array.
+
+    Scalars and flat lists of numbers are split and converted by NumPy
+    directly, which is much faster than literal_eval for long lists. Other
+    values fall back to literal_eval, values that are not numeric at all are
+    returned unchanged.
+    """
+    stripped = value.strip().lstrip("[(").rstrip("])")
+    try:
+        if not stripped:
+            return np.empty(0)
+        return np.array(stripped.split(","), dtype=np.float64)
+    except ValueError:
+        pass
+
+    try:
+        return np.asarray(literal_eval(value), dtype=np.float64).ravel()
+    except (ValueError, TypeError, SyntaxError):
+        return value
 
 
 class FigurePlotter:
-    def __init__(self, input, outdir, ci_build, board):
+    def __init__(self, input, outdir, ci_build, board, report=None):
         self.root = ET.parse(input).getroot()
+        self.properties = self._index_properties(self.root)
         self.outdir = outdir
         self.board = board
+        self.report = report
+        self.report_entries = []
         if ci_build:
             self.plotlyjs = False
             self.full_html = False
         else:
-            self.plotlyjs = "cdn"
+            # Shared plotly.min.js next to the figures, usable offline
+            self.plotlyjs = "directory"
             self.full_html = True
+            if outdir is not None and report is None:
+                write_plotly_bundle(outdir)
 
         version = self.root.find(".//property[@name='timer-version']")
         if version is None:
             raise RuntimeError("timer version not found")
         self.timer_version = version.get("value")
 
-    def plot_accuracy(self):
-        # parse
+    @staticmethod
+    def _index_properties(root):
+        """Groups all testcase properties by classname and name prefix.
+
+        Returns {classname: {prefix: [(name, values)]}} with the prefix being
+        the first dash separated part of the property name and the values
+        being parsed by parse_values().
+        Properties keep their document order, IGNORED_PROPERTY_PREFIXES are
+        skipped.
+        """
+        index = {}
+        for testcase in root.iter("testcase"):
+            classname = index.setdefault(testcase.get("classname"), {})
+            for prop in testcase.iter("property"):
+                name = prop.get("name")
+                if name is None or name.startswith(IGNORED_PROPERTY_PREFIXES):
+                    continue
+                value = parse_values(prop.get("value"))
+                classname.setdefault(name.split("-")[0], []).append((name, value))
+        return index
+
+    def _get_properties(self, testcase, prefix=None):
+        """Returns (name, values) of all properties of the given testcase
+        classname (without testsuite), optionally limited to a name prefix.
+        """
+        classname = "tests_{:s}_benchmarks.{:s}".format(self.timer_version, testcase)
+        groups = self.properties.get(classname, {})
+        if prefix is not None:
+            return groups.get(prefix, [])
+        return list(itertools.chain.from_iterable(groups.values()))
+
+    def accuracy_data(self):
         data = {
             "function": [],
             "target_duration": [],
             "actual_duration": [],
-            "timer_version": [],
-            "board": [],
         }
-        for prop in self.root.findall(
-            "testcase[@classname='tests_{}_benchmarks.Sleep Accuracy']//property".format(
-                self.timer_version
-            )
-        ):
-            name = prop.get("name").split("-")
+        for name, values in self._get_properties("Sleep Accuracy"):
+            name = name.split("-")
             if "TIMER_SLEEP" in name:
                 function = "TIMER_SLEEP"
             elif "TIMER_SET" in name:
@@ -52,103 +115,62 @@ class FigurePlotter:
             result_type = name[-1]
             target = literal_eval(name[-2])
 
-            actual = [v * 1000000 for v in literal_eval(prop.get("value"))]
+            actual = values * 1000000
             if result_type == "dut":
                 # dut results are in microseconds, convert to seconds to uniform with philip results
-                actual = [v / 1000000 for v in actual]
+                actual = actual / 1000000
 
-            data["actual_duration"].extend(actual)
-            data["target_duration"].extend([target] * len(actual))
-            data["function"].extend([function] * len(actual))
-            data["timer_version"].extend([self.timer_version] * len(actual))
-            data["board"].extend([self.board] * len(actual))
+            data["actual_duration"].append(actual)
+            data["target_duration"].append(np.full(len(actual), target))
+            data["function"].append(np.full(len(actual), function))
+
+        data = {k: np.concatenate(v) if v else [] for k, v in data.items()}
+        data["timer_version"] = self.timer_version
+        data["board"] = self.board
 
         df = pd.DataFrame(data)
         df["diff_actual_target"] = df["actual_duration"] - df["target_duration"]
-        df = (
+        return (
             df.groupby(["timer_version", "board", "function", "target_duration"])
             .mean()
             .reset_index()
         )
 
-        # plot
-        fig = px.line(df, x="target_duration", y="diff_actual_target", color="function")
-
-        fig.update_layout(
-            dict(
-                title="Sleep Accuracy  {:s}-{:s}".format(
-                    self.board, self.timer_version
-                ),
-                xaxis_title="Target Sleep Duration [us]",
-                yaxis_title="Delay from Target Sleep Duration [us]",
-            ),
-        )
+    def jitter_data(self):
+        def get_timer_count(name):
+            return name.split("-")[1]
 
-        fig.write_html(
-            "{}/{}.html".format(self.outdir, "accuracy"),
-            full_html=self.full_html,
-            include_plotlyjs=self.plotlyjs,
-        )
+        data = {
+            "i": [],
+            "timer_count": [],
+            "timer_interval": [],
+            "start_time": [],
+            "wakeup_time": [],
+        }
 
-    def plot_jitter(self):
-        def get_value(property):
-            return literal_eval(property.get("value"))
-
-        def get_timer_count(property):
-            return property.get("name").split("-")[1]
-
-        def parse(root):
-            data = {
-                "i": [],
-                "board": [],
-                "timer_version": [],
-                "timer_count": [],
-                "timer_interval": [],
-                "start_time": [],
-                "wakeup_time": [],
-            }
-
-            testcase = root.find(
-                "testcase[@classname='tests_{:s}_benchmarks.Sleep Jitter']".format(
-                    self.timer_version
-                )
-            )
+        timer_interval = self._get_properties("Sleep Jitter", "timer")
+        timer_interval = [v for n, v in timer_interval if n == "timer-interval"]
+        if not timer_interval:
+            raise RuntimeError("timer_interval not found")
+        timer_interval = timer_interval[0][0]
+
+        hil_times = self._get_properties("Sleep Jitter", "hil")
+        start_times = [p for p in hil_times if p[0].endswith("start-time")]
+        wakeup_times = [p for p in hil_times if p[0].endswith("wakeup-time")]
+
+        for (name, s), (_, w) in zip(start_times, wakeup_times):
+            w_values = w * 1000000
 
-            timer_interval = testcase.find(".//property[@name='timer-interval']")
-            if timer_interval is None:
-                raise RuntimeError("timer_interval not found")
-
-            start_times = [
-                prop
-                for prop in testcase.findall(".//property")
-                if prop.get("name").endswith("start-time")
-                and "dut" not in prop.get("name")
-            ]
-            wakeup_times = [
-                prop
-                for prop in testcase.findall(".//property")
-                if prop.get("name").endswith("wakeup-time")
-                and "dut" not in prop.get("name")
-            ]
-
-            for start, wakeup in zip(start_times, wakeup_times):
-                timer_count = get_timer_count(start)
-                s = get_value(start)
-                w_values = [v * 1000000 for v in get_value(wakeup)]
-
-                data["i"].extend(range(len(w_values)))
-                data["start_time"].extend([s * 1000000] * len(w_values))
-                data["wakeup_time"].extend(w_values)
-                data["timer_count"].extend([timer_count] * len(w_values))
-                data["timer_version"].extend([self.timer_version] * len(w_values))
-                data["board"].extend([self.board] * len(w_values))
-                data["timer_interval"].extend(
-                    [get_value(timer_interval)] * len(w_values)
-                )
-
-            return pd.DataFrame(data)
-
-        df = parse(self.root)
+            data["i"].append(np.arange(len(w_values)))
+            data["start_time"].append(np.full(len(w_values), s[0] * 1000000))
+            data["wakeup_time"].append(w_values)
+            data["timer_count"].append(np.full(len(w_values), get_timer_count(name)))
+            data["timer_interval"].append(np.full(len(w_values), timer_interval))
+
+        data = {k: np.concatenate(v) if v else [] for k, v in data.items()}
+        data["board"] = self.board
+        data["timer_version"] = self.timer_version
+        df = pd.DataFrame(data)
 
         df["calculated_target"] = (
             df["start_time"] + (df["i"] + 1) * df["timer_interval"]
@@ -156,93 +178,197 @@ class FigurePlotter:
         df["diff_target_from_start"] = df["calculated_target"] - df["start_time"]
         df["diff_wakeup_from_start"] = df["wakeup_time"] - df["start_time"]
         df["diff_wakeup_from_target"] = df["wakeup_time"] - df["calculated_target"]
+        return df
 
-        fig = px.box(
-            df,
-            x="timer_count",
-            y="diff_wakeup_from_target",
-        )
-
-        fig.update_layout(
-            dict(
-                title="Sleep Jitter  {:s}-{:s}".format(self.board, self.timer_version),
-                xaxis_title="Number of Timers",
-                yaxis_title="Delay from Target Wakeup Time [us]",
-            ),
-        )
+    def set_remove_timer_data(self):
+        data = {
+            "i": [],
+            "method": [],
+            "duration": [],
+            "timer_count": [],
+        }
 
-        fig.write_html(
-            "{}/{}.html".format(self.outdir, "jitter"),
+        properties = [
+            p
+            for p in self._get_properties("Timer Overhead")
+            if "set" in p[0] or "remove" in p[0]
+        ]
+
+        for name, values in properties:
+            name = name.split("-")
+
+            values = values * 1000000
+            data["i"].append(np.arange(len(values)))
+            data["duration"].append(values)
+            data["timer_count"].append(np.full(len(values), int(name[2])))
+            data["method"].append(np.full(len(values), name[3]))
+
+        data = {k: np.concatenate(v) if v else [] for k, v in data.items()}
+        data["timer_version"] = self.timer_version
+        data["board"] = self.board
+        return pd.DataFrame(data)
+
+    def _write_html(self, fig, name):
+        if self.report is not None:
+            self.report_entries.append(self.report.add_figure(fig, name, group=self.board))
+            return
+        write_html(
+            fig,
+            "{}/{}.html".format(self.outdir, name),
             full_html=self.full_html,
             include_plotlyjs=self.plotlyjs,
         )
 
+    def plot_accuracy(self):
+        title = "Sleep Accuracy  {:s}-{:s}".format(self.board, self.timer_version)
+        self._write_html(accuracy_figure(self.accuracy_data(), title), "accuracy")
+
+    def plot_jitter(self):
+        title = "Sleep Jitter  {:s}-{:s}".format(self.board, self.timer_version)
+        self._write_html(jitter_figure(self.jitter_data(), title), "jitter")
+
     def plot_set_remove_timer_from_list(self):
-        def parse(root):
-            data = {
-                "i": [],
-                "method": [],
-                "duration": [],
-                "timer_count": [],
-                "timer_version": [],
-                "board": [],
-            }
-
-            path = "testcase[@classname='tests_{:s}_benchmarks.Timer Overhead']//property".format(
-                self.timer_version
-            )
-            properties = [
-                p
-                for p in root.findall(path)
-                if "set" in p.get("name") or "remove" in p.get("name")
-            ]
-
-            for prop in properties:
-                name = prop.get("name").split("-")
-
-                values = [v * 1000000 for v in literal_eval(prop.get("value"))]
-                data["i"].extend(range(len(values)))
-                data["duration"].extend(values)
-                data["timer_count"].extend([int(name[2])] * len(values))
-                data["method"].extend([name[3]] * len(values))
-                data["timer_version"].extend([self.timer_version] * len(values))
-                data["board"].extend([self.board] * len(values))
-
-            return pd.DataFrame(data)
-
-        def plot_overhead_set_remove(type, df):
-            if type not in ["set", "remove"]:
-                raise ValueError
-
-            df = df.loc[df["method"] == type]
-
-            # add box plot
-            fig = px.box(df, x="timer_count", y="duration")
-            # add median trendline
-            df_set_median = df.groupby("timer_count")["duration"].median().reset_index()
-            fig.add_scatter(x=df_set_median["timer_count"], y=df_set_median["duration"])
-            # set title, axis labels
+        df = self.set_remove_timer_data()
+        for type in ["set", "remove"]:
             operation_title = "Setting" if type == "set" else "Removing"
-            fig.update_layout(
-                dict(
-                    title="Overhead {:s} Timers  {:s}-{:s}".format(
-                        operation_title, self.board, self.timer_version
-                    ),
-                    xaxis_title="Timer Count",
-                    yaxis_title="Duration [us]",
-                    showlegend=False,
-                ),
-            )
-            # save file
-            fig.write_html(
-                "{}/{}.html".format(self.outdir, "{:s}_timer".format(type)),
-                full_html=self.full_html,
-                include_plotlyjs=self.plotlyjs,
+            title = "Overhead {:s} Timers  {:s}-{:s}".format(
+                operation_title, self.board, self.timer_version
             )
+            fig = set_remove_timer_figure(df, type, title)
+            self._write_html(fig, "{:s}_timer".format(type))
+
 
-        df = parse(self.root)
-        plot_overhead_set_remove("set", df)
-        plot_overhead_set_remove("remove", df)
+def write_html(fig, outfile, full_html, include_plotlyjs):
+    """Writes a figure as HTML with <br /> instead of <br> tags for XML."""
+    html = fig.to_html(full_html=full_html, include_plotlyjs=include_plotlyjs)
+    with open(outfile, "w", encoding="utf-8") as f:
+        f.write(html.replace("<br>", "<br />"))
+
+
+def accuracy_figure(df, title, color="function", **kwargs):
+    fig = px.line(df, x="target_duration", y="diff_actual_target", color=color, **kwargs)
+
+    fig.update_layout(
+        dict(
+            title=title,
+            xaxis_title="Target Sleep Duration [us]",
+            yaxis_title="Delay from Target Sleep Duration [us]",
+        ),
+    )
+    return fig
+
+
+def jitter_figure(df, title, **kwargs):
+    fig = px.box(
+        df,
+        x="timer_count",
+        y="diff_wakeup_from_target",
+        **kwargs
+    )
+
+    fig.update_layout(
+        dict(
+            title=title,
+            xaxis_title="Number of Timers",
+            yaxis_title="Delay from Target Wakeup Time [us]",
+        ),
+    )
+    return fig
+
+
+def set_remove_timer_figure(df, type, title, color=None):
+    if type not in ["set", "remove"]:
+        raise ValueError
+
+    df = df.loc[df["method"] == type]
+
+    # add box plot
+    fig = px.box(df, x="timer_count", y="duration", color=color)
+    # add median trendline, one per color group
+    groups = df.groupby(color) if color else [(None, df)]
+    for name, group in groups:
+        df_set_median = group.groupby("timer_count")["duration"].median().reset_index()
+        fig.add_scatter(
+            x=df_set_median["timer_count"],
+            y=df_set_median["duration"],
+            name="{} median".format(name) if color else None,
+        )
+    # set title, axis labels
+    fig.update_layout(
+        dict(
+            title=title,
+            xaxis_title="Timer Count",
+            yaxis_title="Duration [us]",
+            showlegend=color is not None,
+        ),
+    )
+    return fig
+
+
+def _find_xunit_files(directory):
+    """Returns (board, xunit file) of all xtimer and ztimer benchmark results
+    in a results directory laid out as <board>/<testsuite>/xunit.xml.
+    """
+    results = []
+    for path in sorted(Path(directory).glob("*/*/{}".format(XUNIT_FILE))):
+        if re.match(TESTSUITE_DIR_PATTERN, path.parent.name):
+            results.append((path.parent.parent.name, str(path)))
+    return results
+
+
+def _load_benchmark_data(job):
+    board, xunit_file = job
+    plotter = FigurePlotter(xunit_file, None, True, board)
+    return (
+        plotter.accuracy_data(),
+        plotter.jitter_data(),
+        plotter.set_remove_timer_data(),
+    )
+
+
+def plot_aggregated(directory, outdir, ci_build, jobs=None, report=None):
+    """Loads all xtimer and ztimer benchmark results of a results directory in
+    parallel and plots them into cross-board comparison figures.
+
+    Returns the report entries of the figures if a StaticReport is given.
+    """
+    xunit_files = _find_xunit_files(directory)
+    if not xunit_files:
+        raise RuntimeError("no timer benchmark results found in {}".format(directory))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_load_benchmark_data, xunit_files))
+
+    accuracy, jitter, set_remove = (pd.concat(dfs, ignore_index=True) for dfs in zip(*results))
+    for df in (accuracy, jitter, set_remove):
+        df["series"] = df["board"] + " (" + df["timer_version"] + ")"
+
+    figures = [
+        (accuracy_figure(accuracy, "Sleep Accuracy", color="series", line_dash="function"), "accuracy"),
+        (jitter_figure(jitter, "Sleep Jitter", color="series"), "jitter"),
+    ]
+    for type in ["set", "remove"]:
+        operation_title = "Setting" if type == "set" else "Removing"
+        figures.append((
+            set_remove_timer_figure(set_remove, type, "Overhead {:s} Timers".format(operation_title), color="series"),
+            "{:s}_timer".format(type),
+        ))
+
+    if report is not None:
+        return [report.add_figure(fig, name) for fig, name in figures]
+
+    full_html = not ci_build
+    plotlyjs = False if ci_build else "directory"
+    if not ci_build:
+        write_plotly_bundle(outdir)
+    for fig, name in figures:
+        write_html(
+            fig,
+            "{}/{}.html".format(outdir, name),
+            full_html=full_html,
+            include_plotlyjs=plotlyjs,
+        )
+    return []
 
 
 if __name__ == "__main__":
@@ -250,37 +376,65 @@ if __name__ == "__main__":
         description="Produce timer benchmarks plots from xunit results"
     )
 
-    parser.add_argument("input", help="xunit result file to parse")
+    parser.add_argument(
+        "input",
+        help="xunit result file to parse, or results directory with --aggregate",
+    )
     parser.add_argument("--outdir", help="output directory to write plots to")
     parser.add_argument(
         "--board",
-        help="specify board",
-        required=True,
+        help="specify board, required unless --aggregate is given",
     )
     parser.add_argument(
         "--for-ci",
         help="configure output for ci (this will exclude plotly.js from output files)",
         action="store_true",
     )
+    parser.add_argument(
+        "--aggregate",
+        help="treat input as results directory (<board>/<testsuite>/xunit.xml) "
+        "and plot all xtimer and ztimer benchmarks into cross-board figures",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--jobs",
+        help="number of processes to load xunit files with in --aggregate mode "
+        "(default: number of CPUs)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--report",
+        help="write a static report (<outdir>/index.html) with a shared plotly.js "
+        "and lazily loaded figure data instead of one HTML file per figure",
+        action="store_true",
+    )
 
     args = parser.parse_args()
+    if not args.aggregate and not args.board:
+        parser.error("--board is required unless --aggregate is given")
 
-    args.outdir = (
-        args.outdir
-        if args.outdir
-        else "{:s}/includes".format(args.input[: args.input.rfind("/")])
-    )
+    if args.aggregate:
+        args.outdir = (
+            args.outdir if args.outdir else os.path.join(args.input, "includes")
+        )
+    else:
+        args.outdir = (
+            args.outdir
+            if args.outdir
+            else "{:s}/includes".format(args.input[: args.input.rfind("/")])
+        )
     if not os.path.exists(args.outdir):
         os.makedirs(args.outdir)
 
-    plotter = FigurePlotter(args.input, args.outdir, args.for_ci, args.board)
-    plotter.plot_accuracy()
-    plotter.plot_jitter()
-    plotter.plot_set_remove_timer_from_list()
-
-    # call sed to convert <br> tags to <br /> for XML
-    subprocess.run(
-        "find {:s} -type f ".format(args.outdir)
-        + r"-execdir sed -i 's/<br>/<br \/>/g' {} \;",
-        shell=True,
-    )
+    report = StaticReport(args.outdir) if args.report else None
+    if args.aggregate:
+        entries = plot_aggregated(args.input, args.outdir, args.for_ci, args.jobs, report)
+    else:
+        plotter = FigurePlotter(args.input, args.outdir, args.for_ci, args.board, report)
+        plotter.plot_accuracy()
+        plotter.plot_jitter()
+        plotter.plot_set_remove_timer_from_list()
+        entries = plotter.report_entries
+    if report is not None:
+        report.write_index(entries, title="Timer Benchmarks")
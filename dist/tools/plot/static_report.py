@@ -0,0 +1,221 @@
+"""Static HTML report of many plotly figures with shared assets.
+
+Writing every figure as standalone HTML embeds a copy of plotly.js (several
+MB) into each file. A StaticReport instead writes the plotly.js bundle once,
+the data of every figure as compact JSON (numeric arrays are base64 encoded
+by plotly) and the plotly template shared by the figures once per template.
+The index page lists all figures and only loads the data of a figure when it
+is scrolled into view, so it opens instantly even with hundreds of figures.
+
+Layout of the report directory:
+
+    index.html                  List of all figures, loads them lazily
+    plotly.min.js               Shared plotly.js bundle
+    data/<figure>.json          Figure data and layout
+    data/template-<hash>.json   Plotly templates referenced by the figures
+
+The data is loaded with fetch(), so the report has to be served over HTTP,
+e.g. by the artifact server or `python3 -m http.server`.
+"""
+import hashlib
+import html
+import json
+import logging
+import os
+
+from plotly.offline import get_plotlyjs
+
+LOG = logging.getLogger(__name__)
+
+PLOTLY_BUNDLE = "plotly.min.js"
+DATA_DIR = "data"
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<title>{title}</title>
+<script src="{bundle}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 1em 2em; }}
+nav a {{ margin-right: 1em; }}
+.figure {{ display: inline-block; vertical-align: top; margin: 0.5em; }}
+.figure > .plot {{ border: 1px solid #eee; }}
+.figure > .label {{ font-size: small; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<nav>{nav}</nav>
+{sections}
+<script>
+(function () {{
+    var templates = {{}};
+
+    function load(url) {{
+        return fetch(url).then(function (response) {{
+            if (!response.ok) {{
+                throw new Error(url + ": " + response.status);
+            }}
+            return response.json();
+        }});
+    }}
+
+    function render(div) {{
+        var data = div.getAttribute("data-src");
+        load(data).then(function (fig) {{
+            var name = fig.template;
+            if (!name) {{
+                return fig;
+            }}
+            if (!(name in templates)) {{
+                templates[name] = load("{data_dir}/template-" + name + ".json");
+            }}
+            return templates[name].then(function (template) {{
+                fig.layout.template = template;
+                return fig;
+            }});
+        }}).then(function (fig) {{
+            div.style.minHeight = "";
+            Plotly.newPlot(div, fig.data, fig.layout, {{responsive: true}});
+        }}).catch(function (error) {{
+            div.textContent = "Failed to load " + data + ": " + error;
+        }});
+    }}
+
+    var plots = document.querySelectorAll(".plot[data-src]");
+    if (!("IntersectionObserver" in window)) {{
+        plots.forEach(render);
+        return;
+    }}
+    var observer = new IntersectionObserver(function (entries) {{
+        entries.forEach(function (entry) {{
+            if (entry.isIntersecting) {{
+                observer.unobserve(entry.target);
+                render(entry.target);
+            }}
+        }});
+    }}, {{rootMargin: "500px"}});
+    plots.forEach(function (div) {{ observer.observe(div); }});
+}})();
+</script>
+</body>
+</html>
+"""
+
+
+def write_plotly_bundle(outdir):
+    """Writes the plotly.js bundle to outdir unless it is already there.
+
+    :return: Path of the bundle
+    """
+    path = os.path.join(outdir, PLOTLY_BUNDLE)
+    if not os.path.exists(path):
+        # Parallel writers may share the directory, replace atomically
+        tmp_file = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp_file, path)
+    return path
+
+
+class StaticReport:
+    """Collects figures as lazily loaded data of a static report.
+
+    add_figure() may be called from several processes sharing outdir, the
+    index is written by write_index() once all figures are added.
+    """
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.data_dir = os.path.join(outdir, DATA_DIR)
+        os.makedirs(self.data_dir, exist_ok=True)
+        write_plotly_bundle(outdir)
+
+    def add_figure(self, fig, name, group=None):
+        """Writes the data of a figure.
+
+        :param fig:     Plotly figure
+        :param name:    File name of the figure data without extension
+        :param group:   Section of the index page listing the figure
+
+        :return: Index entry of the figure, see write_index()
+        """
+        figure = json.loads(fig.to_json(pretty=False, remove_uids=True))
+        layout = figure.setdefault("layout", {})
+        template = layout.pop("template", None)
+        if template is not None:
+            encoded = json.dumps(template, separators=(",", ":"), sort_keys=True)
+            figure["template"] = hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+            self._write_once("template-{}.json".format(figure["template"]), encoded)
+
+        outfile = os.path.join(self.data_dir, "{}.json".format(name))
+        with open(outfile, "w", encoding="utf-8") as f:
+            json.dump(figure, f, separators=(",", ":"))
+        LOG.info("Wrote figure data: {}".format(outfile))
+
+        title = layout.get("title", {})
+        title = title.get("text") if isinstance(title, dict) else title
+        return dict(
+            name=name,
+            title=title or name,
+            group=group,
+            width=layout.get("width"),
+            height=layout.get("height"),
+        )
+
+    def _write_once(self, filename, content):
+        path = os.path.join(self.data_dir, filename)
+        if os.path.exists(path):
+            return
+        tmp_file = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+
+    def write_index(self, entries, title="Benchmark Report"):
+        """Writes index.html listing the figures in the given order.
+
+        :param entries: Index entries returned by add_figure(), figures of
+                        the same group are listed in one section
+
+        :return: Path of the index page
+        """
+        groups = {}
+        for entry in entries:
+            groups.setdefault(entry.get("group") or "Overview", []).append(entry)
+
+        nav = []
+        sections = []
+        for i, (group, group_entries) in enumerate(groups.items()):
+            anchor = "group-{}".format(i)
+            nav.append('<a href="#{}">{}</a>'.format(anchor, html.escape(group)))
+            figures = []
+            for entry in group_entries:
+                style = "width: {}px; min-height: {}px;".format(
+                    entry.get("width") or 600, entry.get("height") or 500)
+                figures.append(
+                    '<div class="figure" id="{name}">'
+                    '<div class="plot" style="{style}" data-src="{src}"></div>'
+                    '<div class="label"><a href="#{name}">{title}</a></div>'
+                    '</div>'.format(
+                        name=html.escape(entry["name"], quote=True),
+                        style=style,
+                        src=html.escape("{}/{}.json".format(DATA_DIR, entry["name"]), quote=True),
+                        title=html.escape(entry["title"]),
+                    )
+                )
+            sections.append('<h2 id="{}">{}</h2>\n{}'.format(
+                anchor, html.escape(group), "\n".join(figures)))
+
+        outfile = os.path.join(self.outdir, "index.html")
+        with open(outfile, "w", encoding="utf-8") as f:
+            f.write(INDEX_TEMPLATE.format(
+                title=html.escape(title),
+                bundle=PLOTLY_BUNDLE,
+                data_dir=DATA_DIR,
+                nav="\n".join(nav),
+                sections="\n".join(sections),
+            ))
+        LOG.info("Wrote report index: {}".format(outfile))
+        return outfile
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Detects benchmark regressions by comparing results with a baseline.
+
+Both the current results and the baseline are results directories with the
+layout <dir>/<board>/<testsuite>/xunit.xml, several baseline directories
+(e.g. of earlier nights) are combined. All numeric samples recorded as
+properties of a benchmark testcase are compared per (board, testsuite,
+testcase, property), larger values are considered worse:
+
+- mannwhitney: one-sided Mann-Whitney U test whether the current samples are
+  stochastically larger than the baseline
+- bootstrap: bootstrap confidence interval of the relative change of the
+  median
+
+A benchmark regressed if the change is significant and the median increased
+by more than the threshold. The result is written as JUnit report with one
+testcase per benchmark, regressions are reported as failures. The exit status
+is 1 if any benchmark regressed.
+"""
+import argparse
+import json
+import logging
+import math
+import re
+import sys
+import xml.etree.ElementTree as ET
+from ast import literal_eval
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+
+# The statistics and trace encoding are shared with the RobotFramework libraries
+sys.path.append(str(Path(__file__).resolve().parents[2] / "robotframework" / "lib"))
+from bench_stats import BenchStats  # noqa: E402
+from trace_encoding import is_encoded_trace  # noqa: E402
+
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
+
+XUNIT_FILE = "xunit.xml"
+TESTSUITE_PATTERN = r"^tests_(periph_u?timer|[xz]timer)_benchmarks$"
+IGNORED_PROPERTIES = ('trace', 'adaptive_ci')
+# Command round trip times of the test setup, see CommandTimings
+IGNORED_PROPERTY_PREFIXES = ('cmd-timing-',)
+
+
+def parse_samples(value):
+    """Returns the numeric samples of a recorded property value.
+
+    Statistics dicts of the timer benchmarks contribute their values (or the
+    buckets of their quantile sketch), numbers and lists of numbers are
+    returned as is. Other values return None.
+    """
+    if is_encoded_trace(value):
+        return None
+    try:
+        parsed = json.loads(value.replace("'", "\""))
+    except ValueError:
+        try:
+            parsed = literal_eval(value)
+        except (ValueError, TypeError, SyntaxError, MemoryError):
+            return None
+
+    if isinstance(parsed, dict):
+        if 'values' in parsed:
+            parsed = parsed['values']
+        elif 'sketch' in parsed:
+            stats = BenchStats.from_dict(parsed)
+            buckets, counts = stats.sketch.buckets()
+            return np.repeat(np.clip(buckets, stats.min, stats.max), counts)
+        else:
+            return None
+    try:
+        samples = np.asarray(parsed, dtype=np.float64).ravel()
+    except (ValueError, TypeError):
+        return None
+    return samples[np.isfinite(samples)]
+
+
+def load_results(directories, testsuite_pattern=TESTSUITE_PATTERN):
+    """Collects the samples of all benchmarks below results directories.
+
+    :return: Dict of (board, testsuite, testcase, property) to float64 array
+    """
+    samples = {}
+    for directory in directories:
+        for xunit in sorted(Path(directory).glob("*/*/" + XUNIT_FILE)):
+            board = xunit.parent.parent.name
+            root = ET.parse(xunit).getroot()
+            suite = root.get("name")
+            if not re.match(testsuite_pattern, suite or ""):
+                continue
+
+            for testcase in root.iter("testcase"):
+                if testcase.find("skipped") is not None:
+                    continue
+                for prop in testcase.iter("property"):
+                    name = prop.get("name")
+                    if name is None or name in IGNORED_PROPERTIES \
+                            or name.startswith(IGNORED_PROPERTY_PREFIXES):
+                        continue
+                    values = parse_samples(prop.get("value", ""))
+                    if values is None or len(values) == 0:
+                        continue
+                    key = (board, suite, testcase.get("name"), name)
+                    samples.setdefault(key, []).append(values)
+    return {key: np.concatenate(values) for key, values in samples.items()}
+
+
+def _rankdata(data):
+    """Ranks starting at 1, tied values get their average rank."""
+    order = np.argsort(data, kind="mergesort")
+    ranks = np.empty(len(data), dtype=np.float64)
+    ranks[order] = np.arange(1, len(data) + 1)
+    _, inverse, counts = np.unique(data, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=ranks)
+    return (sums / counts)[inverse], counts
+
+
+def mann_whitney_greater(current, baseline):
+    """One-sided Mann-Whitney U test whether current tends to be larger.
+
+    Uses the normal approximation with tie and continuity correction.
+
+    :return: p-value
+    """
+    n1, n2 = len(current), len(baseline)
+    ranks, ties = _rankdata(np.concatenate([current, baseline]))
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - (ties ** 3 - ties).sum() / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 1 - NormalDist().cdf(z)
+
+
+def bootstrap_median_change(current, baseline, confidence, resamples, rng):
+    """Bootstrap confidence interval of the relative change of the median.
+
+    :return: Tuple (low, high)
+    """
+    current_medians = np.median(rng.choice(current, (resamples, len(current))), axis=1)
+    baseline_medians = np.median(rng.choice(baseline, (resamples, len(baseline))), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = current_medians / baseline_medians - 1
+    changes = changes[np.isfinite(changes)]
+    if len(changes) == 0:
+        return (math.nan, math.nan)
+    tail = (1 - confidence) / 2 * 100
+    return tuple(float(x) for x in np.percentile(changes, [tail, 100 - tail]))
+
+
+def compare(current, baseline, args, rng):
+    """Compares the samples of one benchmark.
+
+    :return: Dict describing the comparison, with status 'regression', 'ok'
+             or 'skipped'
+    """
+    result = {'samples': len(current), 'baseline_samples': len(baseline)}
+    if min(len(current), len(baseline)) < args.min_samples:
+        result.update(status='skipped', message="too few samples")
+        return result
+
+    median, baseline_median = float(np.median(current)), float(np.median(baseline))
+    change = median / baseline_median - 1 if baseline_median else math.inf if median > 0 else 0.0
+    result.update(median=median, baseline_median=baseline_median, change=change)
+
+    if args.method == 'mannwhitney':
+        result['p'] = mann_whitney_greater(current, baseline)
+        significant = result['p'] < args.alpha
+    else:
+        result['ci'] = bootstrap_median_change(current, baseline, 1 - args.alpha,
+                                               args.resamples, rng)
+        significant = result['ci'][0] > 0
+
+    regressed = significant and change > args.threshold
+    result['status'] = 'regression' if regressed else 'ok'
+    result['message'] = "median {:.4g} -> {:.4g} ({:+.1%}), {}".format(
+        baseline_median, median, change,
+        "p={:.3g}".format(result['p']) if 'p' in result else
+        "{:.0%} CI [{:+.1%}, {:+.1%}]".format(1 - args.alpha, *result['ci']))
+    return result
+
+
+def write_report(results, path, name="benchmark regressions"):
+    """Writes the comparison results as JUnit report."""
+    testsuite = ET.Element("testsuite", name=name, tests=str(len(results)),
+                           errors="0",
+                           failures=str(sum(r['status'] == 'regression' for r in results.values())),
+                           skipped=str(sum(r['status'] == 'skipped' for r in results.values())),
+                           time="0.000")
+    for (board, suite, testcase, prop), result in sorted(results.items()):
+        case = ET.SubElement(testsuite, "testcase",
+                             classname="{}.{}.{}".format(board, suite, testcase),
+                             name=prop, time="0.000")
+        if result['status'] == 'regression':
+            ET.SubElement(case, "failure", message=result['message']).text = result['message']
+        elif result['status'] == 'skipped':
+            ET.SubElement(case, "skipped", message=result['message']).text = result['message']
+        properties = ET.SubElement(case, "properties")
+        for key in ('samples', 'baseline_samples', 'median', 'baseline_median', 'change', 'p', 'ci'):
+            if key in result:
+                ET.SubElement(properties, "property", name=key, value=str(result[key]))
+    ET.ElementTree(testsuite).write(path, encoding="UTF-8", xml_declaration=True)
+
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__.splitlines()[0],
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+PARSER.add_argument('current', help='Results directory to check')
+PARSER.add_argument('baseline', nargs='+', help='Baseline results directories')
+PARSER.add_argument('--output', default='regressions.xml',
+                    help='Path of the JUnit report')
+PARSER.add_argument('--method', choices=('mannwhitney', 'bootstrap'),
+                    default='mannwhitney', help='Statistical test to use')
+PARSER.add_argument('--alpha', type=float, default=0.01,
+                    help='Significance level')
+PARSER.add_argument('--threshold', type=float, default=0.05,
+                    help='Minimum relative increase of the median to report')
+PARSER.add_argument('--min-samples', type=int, default=5,
+                    help='Minimum number of samples on both sides')
+PARSER.add_argument('--resamples', type=int, default=2000,
+                    help='Number of bootstrap resamples')
+PARSER.add_argument('--seed', type=int, default=0,
+                    help='Seed of the bootstrap resampling')
+PARSER.add_argument('--testsuites', default=TESTSUITE_PATTERN,
+                    help='Regex selecting the testsuites to compare')
+PARSER.add_argument('--loglevel', choices=LOG_LEVELS, default='info',
+                    help='Python logger log level')
+
+
+def main(args):
+    """Compare results with the baseline, returns the exit status."""
+    if args.loglevel:
+        loglevel = logging.getLevelName(args.loglevel.upper())
+        logging.basicConfig(level=loglevel)
+
+    current = load_results([args.current], args.testsuites)
+    baseline = load_results(args.baseline, args.testsuites)
+    if not current:
+        logging.error("No benchmark results found in %s", args.current)
+        return 2
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for key, samples in sorted(current.items()):
+        if key not in baseline:
+            results[key] = {'status': 'skipped', 'message': "no baseline",
+                            'samples': len(samples)}
+            continue
+        results[key] = compare(samples, baseline[key], args, rng)
+        if results[key]['status'] == 'regression':
+            logging.warning("%s: %s", '/'.join(key), results[key]['message'])
+
+    write_report(results, args.output)
+    regressions = sum(r['status'] == 'regression' for r in results.values())
+    logging.info("Compared %d benchmarks, %d regressions, %d skipped", len(results),
+                 regressions, sum(r['status'] == 'skipped' for r in results.values()))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(PARSER.parse_args()))
@@ -0,0 +1,344 @@
+#! /usr/bin/env python3
+"""Benchmarks the host side of the HIL pipeline against the simulator.
+
+Stages:
+
+    commands    DUT shell round trips, sequential and pipelined (commands/s)
+    trace       PHiLIP trace readout and post-processing (events/s)
+    xunit       output.xml to xunit.xml conversion (tests/s, MB/s)
+    plot        Cross-board timer benchmark plots (seconds)
+
+The simulator runs in its own process, so the devices do not compete with
+the benchmarked code for the GIL. The results are printed and written as a
+JSON summary.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASEDIR = Path(__file__).resolve().parents[2]
+SIM_DIR = Path(__file__).resolve().parent
+RF_LIB = BASEDIR / "robotframework" / "lib"
+RF_RES = BASEDIR / "robotframework" / "res"
+
+sys.path.append(str(RF_LIB))
+sys.path.append(str(BASEDIR / "tools" / "output_to_xunit"))
+sys.path.append(str(BASEDIR / "tools" / "plot"))
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
+STAGES = ('commands', 'trace', 'xunit', 'plot')
+
+XTIMER_SUITE = "tests_xtimer_benchmarks"
+
+LOG = logging.getLogger(__name__)
+
+
+def start_simulator(*args):
+    """Starts the simulator in a subprocess.
+
+    :return: Tuple (process, {'dut': port, 'philip': port})
+    """
+    proc = subprocess.Popen([sys.executable, "-m", "hilsim"] + list(args),
+                            cwd=str(SIM_DIR), stdout=subprocess.PIPE, text=True)
+    ports = json.loads(proc.stdout.readline())
+    LOG.info("Simulator running, DUT: {dut}, PHiLIP: {philip}".format(**ports))
+    return proc, ports
+
+
+def _percentiles(values):
+    values = np.asarray(values) * 1e6
+    return {"p{}_us".format(p): round(float(np.percentile(values, p)), 3) for p in (50, 90, 99)}
+
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else None
+
+
+def bench_commands(ports, count):
+    """Measures the command rate of the DUT shell interface."""
+    from periph_timer_benchmarks_if_base import PeriphUTimerBenchmarksIfBase
+
+    dut = PeriphUTimerBenchmarksIfBase(port=ports["dut"], parser="json")
+    dut.get_metadata()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        cmd_start = time.perf_counter()
+        reply = dut.get_metadata()
+        latencies.append(time.perf_counter() - cmd_start)
+        assert reply["result"] == "Success", reply
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    replies = dut.send_cmds(["get_metadata"] * count)
+    pipelined = time.perf_counter() - start
+    assert all(reply["result"] == "Success" for reply in replies)
+
+    return dict(
+        commands=count,
+        sequential_cmds_per_s=_rate(count, sequential),
+        pipelined_cmds_per_s=_rate(count, pipelined),
+        **_percentiles(latencies),
+    )
+
+
+def _synthetic_trace(events, seed=0):
+    """Returns a read_trace() like event list of DUT_IC pulses."""
+    from hilsim.models import LatencyModel, pulse_edges
+
+    rng = np.random.default_rng(seed)
+    times, values = pulse_edges(LatencyModel(2e-6, 4e-8, 0.01, rng=rng).sample(events // 2),
+                                LatencyModel(2e-5, 2e-6, rng=rng))
+    trace = []
+    prev = 0
+    for t, v in zip(times.round(9), values):
+        trace.append({"time": float(t), "source": "DUT_IC", "event": "RISING" if v else "FALLING",
+                      "diff": float(t - prev) if prev else 0, "source_diff": float(t - prev) if prev else 0})
+        prev = t
+    return trace
+
+
+def bench_trace(ports, runs, events):
+    """Measures trace readout over serial and trace post-processing."""
+    from PhilipAPI import PhilipAPI
+    from periph_timer_benchmarks_if_base import PeriphUTimerBenchmarksIfBase
+
+    dut = PeriphUTimerBenchmarksIfBase(port=ports["dut"], parser="json")
+    philip = PhilipAPI(ports["philip"], 115200)
+
+    read_time = process_time = 0.0
+    read_events = 0
+    for _ in range(runs):
+        philip.reset_mcu()
+        dut.bench_timer_read(None)
+        start = time.perf_counter()
+        trace = philip.read_trace()["data"]
+        read_time += time.perf_counter() - start
+        read_events += len(trace)
+        start = time.perf_counter()
+        dut.process_bench_timer_read(trace)
+        process_time += time.perf_counter() - start
+
+    philip.reset_mcu()
+    philip.start_trace_stream()
+    stream_time = 0.0
+    for _ in range(runs):
+        dut.bench_timer_read(None)
+        start = time.perf_counter()
+        philip.drain_trace()
+        stream_time += time.perf_counter() - start
+    stream_events = len(philip.stop_trace_stream()["data"])
+
+    trace = _synthetic_trace(events)
+    start = time.perf_counter()
+    dut.process_bench_timer_read(trace)
+    synthetic_time = time.perf_counter() - start
+
+    return dict(
+        runs=runs,
+        read_trace_events_per_s=_rate(read_events, read_time),
+        read_trace_s=round(read_time / runs, 4),
+        stream_events_per_s=_rate(stream_events, stream_time),
+        process_events_per_s=_rate(read_events, process_time),
+        synthetic_events=len(trace),
+        synthetic_process_events_per_s=_rate(len(trace), synthetic_time),
+    )
+
+
+def _robot_line(keyword, *args):
+    return "    ".join(["   ", keyword] + [str(arg) for arg in args]) + "\n"
+
+
+def write_xtimer_suite(directory, samples, seed=0):
+    """Writes a robot suite recording properties like the xtimer benchmarks.
+
+    Run with --name tests_xtimer_benchmarks, the output converts to a
+    xunit.xml which plot_timer_benchmarks.py accepts.
+    """
+    rng = np.random.default_rng(seed)
+
+    def values(base):
+        return (base + rng.random(samples) * 1e-6).round(9).tolist()
+
+    suites = {
+        "Timer Version": {"Save Timer Version": [("timer-version", "xtimer")]},
+        "Timer Overhead": {
+            "Measure GPIO": [("overhead-00-gpio", values(1e-6))],
+            "Measure Overhead TIMER_NOW": [("overhead-01-timer-now", values(1e-6))],
+            "Measure Overhead Set List": [
+                ("00-overhead-{}-set".format(i), values(3e-6 * i)) for i in range(1, 26)],
+            "Measure Overhead Remove List": [
+                ("00-overhead-{}-remove".format(i), values(2e-6 * i)) for i in range(1, 26)],
+        },
+        "Sleep Accuracy": {
+            "Measure {} Accuracy".format(function): [
+                ("accuracy-{}-{}-philip".format(function, d), values(d * 1e-6)) for d in range(1, 101)]
+            for function in ("TIMER_SET", "TIMER_SLEEP")
+        },
+        "Sleep Jitter": {"Measure Sleep Jitter With Increasing Timers": [
+            prop for count in range(1, 11) for prop in (
+                ("timer-interval", 100),
+                ("dut-{}-start-time".format(count), 12345),
+                ("dut-{}-wakeup-time".format(count), list(range(samples))),
+                ("hil-{}-start-time".format(count), round(float(rng.random()), 9)),
+                ("hil-{}-wakeup-time".format(count), sorted(values(0.5 * count))),
+            )
+        ]},
+    }
+
+    tests = 0
+    for i, (suite, testcases) in enumerate(suites.items()):
+        path = Path(directory) / "{:02d}__{}.robot".format(i, suite.lower().replace(" ", "_"))
+        with open(path, "w") as f:
+            f.write("*** Settings ***\n")
+            f.write("Resource    {}\n\n".format(RF_RES / "util.keywords.txt"))
+            f.write("*** Test Cases ***\n")
+            for testcase, props in testcases.items():
+                f.write(testcase + "\n")
+                for name, value in props:
+                    f.write(_robot_line("Record Property", name, value))
+                tests += 1
+    return tests
+
+
+def bench_xunit(workdir, samples, repeat):
+    """Measures the output.xml to xunit.xml conversion."""
+    import output_to_xunit
+
+    suite_dir = Path(workdir) / XTIMER_SUITE
+    suite_dir.mkdir()
+    tests = write_xtimer_suite(suite_dir, samples)
+    output = Path(workdir) / "output.xml"
+    subprocess.run([sys.executable, "-m", "robot", "--name", XTIMER_SUITE, "-P", str(RF_LIB),
+                    "-l", "NONE", "-r", "NONE", "--output", str(output), "--console", "none",
+                    str(suite_dir)], check=True)
+    size = output.stat().st_size / 1e6
+
+    results = dict(tests=tests, output_mb=round(size, 2))
+    xunit = Path(workdir) / "xunit.xml"
+    for name, convert in (("convert", output_to_xunit.convert),
+                          ("streaming", output_to_xunit.convert_streaming)):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            convert(str(output), str(xunit))
+            durations.append(time.perf_counter() - start)
+        duration = statistics.median(durations)
+        results["{}_s".format(name)] = round(duration, 4)
+        results["{}_tests_per_s".format(name)] = _rate(tests, duration)
+        results["{}_mb_per_s".format(name)] = _rate(size, duration)
+    return results, xunit
+
+
+def bench_plot(workdir, xunit, boards, jobs):
+    """Measures plotting the xtimer results of several boards."""
+    from plot_timer_benchmarks import plot_aggregated
+    from static_report import StaticReport
+
+    results_dir = Path(workdir) / "results"
+    for i in range(boards):
+        suite_dir = results_dir / "sim-board-{}".format(i) / XTIMER_SUITE
+        suite_dir.mkdir(parents=True)
+        shutil.copy(str(xunit), str(suite_dir / "xunit.xml"))
+
+    results = dict(boards=boards)
+    for name, make_report in (("html", lambda outdir: None), ("report", StaticReport)):
+        outdir = Path(workdir) / "plots-{}".format(name)
+        outdir.mkdir()
+        start = time.perf_counter()
+        plot_aggregated(str(results_dir), str(outdir), False, jobs, make_report(str(outdir)))
+        results["{}_s".format(name)] = round(time.perf_counter() - start, 3)
+        results["{}_mb".format(name)] = round(
+            sum(f.stat().st_size for f in outdir.rglob("*") if f.is_file()) / 1e6, 2)
+    return results
+
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__.splitlines()[0],
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+PARSER.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                    help="Stages to run, plot requires xunit")
+PARSER.add_argument("--commands", type=int, default=1000,
+                    help="Number of DUT commands per mode")
+PARSER.add_argument("--trace-runs", type=int, default=20,
+                    help="Number of benchmark traces read from the PHiLIP")
+PARSER.add_argument("--trace-events", type=int, default=100000,
+                    help="Number of events of the synthetic trace")
+PARSER.add_argument("--samples", type=int, default=50,
+                    help="Number of samples per recorded property")
+PARSER.add_argument("--repeat", type=int, default=3,
+                    help="Number of conversions, the median is reported")
+PARSER.add_argument("--boards", type=int, default=8,
+                    help="Number of boards in the plotted results")
+PARSER.add_argument("--jobs", "-j", type=int, default=None,
+                    help="Number of worker processes of the plot stage")
+PARSER.add_argument("--response-delay", type=float, default=0.0,
+                    help="Mean command execution time of the simulated DUT in seconds")
+PARSER.add_argument("--keep", default=None, metavar="DIR",
+                    help="Keep generated files in DIR instead of a temporary directory")
+PARSER.add_argument("--output", default=None, help="Write the JSON summary to a file")
+PARSER.add_argument("--loglevel", choices=LOG_LEVELS, default="info",
+                    help="Python logger log level")
+
+
+def main(args):
+    loglevel = logging.getLevelName(args.loglevel.upper())
+    logging.basicConfig(level=loglevel)
+
+    if "plot" in args.stages and "xunit" not in args.stages:
+        PARSER.error("the plot stage requires the xunit stage")
+
+    summary = dict(
+        host=dict(python=platform.python_version(), machine=platform.machine(),
+                  cpus=os.cpu_count()),
+        stages={},
+    )
+
+    if "commands" in args.stages or "trace" in args.stages:
+        proc, ports = start_simulator("--response-delay", str(args.response_delay))
+        try:
+            if "commands" in args.stages:
+                summary["stages"]["commands"] = bench_commands(ports, args.commands)
+                LOG.info("commands: {}".format(summary["stages"]["commands"]))
+            if "trace" in args.stages:
+                summary["stages"]["trace"] = bench_trace(ports, args.trace_runs, args.trace_events)
+                LOG.info("trace: {}".format(summary["stages"]["trace"]))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    workdir = args.keep or tempfile.mkdtemp(prefix="bench_host-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        if "xunit" in args.stages:
+            summary["stages"]["xunit"], xunit = bench_xunit(workdir, args.samples, args.repeat)
+            LOG.info("xunit: {}".format(summary["stages"]["xunit"]))
+        if "plot" in args.stages:
+            summary["stages"]["plot"] = bench_plot(workdir, xunit, args.boards, args.jobs)
+            LOG.info("plot: {}".format(summary["stages"]["plot"]))
+    finally:
+        if args.keep is None:
+            shutil.rmtree(workdir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(PARSER.parse_args()))
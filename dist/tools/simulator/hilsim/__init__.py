@@ -0,0 +1,12 @@
+"""Hardware-free DUT and PHiLIP simulator.
+
+The simulated devices serve their serial protocols on pseudo terminals, so
+riot_pal, philip_pal and the robot libraries use them like real hardware.
+"""
+from .dut import FakeDut
+from .models import LatencyModel
+from .philip import FakePhilip
+from .pty_device import PtyDevice
+from .simulator import Simulator
+
+__all__ = ['FakeDut', 'FakePhilip', 'LatencyModel', 'PtyDevice', 'Simulator']
@@ -0,0 +1,61 @@
+"""Serves a simulated DUT and PHiLIP until terminated.
+
+Prints the ports as a JSON line {"dut": <port>, "philip": <port>} once the
+devices are ready.
+"""
+import argparse
+import json
+import logging
+import signal
+import sys
+import threading
+
+from .models import LatencyModel
+from .simulator import Simulator
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
+
+PARSER = argparse.ArgumentParser(
+    prog="python3 -m hilsim",
+    description=__doc__.splitlines()[0],
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+PARSER.add_argument("--dut-link", default=None,
+                    help="Create a symlink to the DUT port, e.g. for DUT_PORT")
+PARSER.add_argument("--philip-link", default=None,
+                    help="Create a symlink to the PHiLIP port, e.g. for PHILIP_PORT")
+PARSER.add_argument("--board", default="sim-board", help="Board reported by get_metadata")
+PARSER.add_argument("--application", default="tests_periph_timer_benchmarks",
+                    help="Application reported by get_metadata, the APPLICATION of the suite")
+PARSER.add_argument("--response-delay", type=float, default=0.0,
+                    help="Mean command execution time of the DUT in seconds")
+PARSER.add_argument("--response-jitter", type=float, default=0.0,
+                    help="Standard deviation of the command execution time in seconds")
+PARSER.add_argument("--jitter", type=float, default=0.02,
+                    help="Relative standard deviation of the benchmark pulse widths")
+PARSER.add_argument("--outlier-rate", type=float, default=0.01,
+                    help="Probability of a benchmark pulse being interrupted")
+PARSER.add_argument("--seed", type=int, default=0, help="Seed of the random models")
+PARSER.add_argument("--loglevel", choices=LOG_LEVELS, default="warning",
+                    help="Python logger log level")
+
+
+def main(args):
+    loglevel = logging.getLevelName(args.loglevel.upper())
+    logging.basicConfig(level=loglevel)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    delay = LatencyModel(args.response_delay, args.response_jitter)
+    with Simulator(dut_link=args.dut_link, philip_link=args.philip_link, board=args.board,
+                   application=args.application, response_delay=delay,
+                   jitter=args.jitter, outlier_rate=args.outlier_rate, seed=args.seed) as sim:
+        print(json.dumps(sim.ports), flush=True)
+        stop.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(PARSER.parse_args()))
@@ -0,0 +1,176 @@
+"""Fake DUT shell speaking the JSON protocol of utils/test_helpers."""
+import json
+import logging
+import time
+
+import numpy as np
+
+from .models import LatencyModel, pulse_edges
+from .pty_device import PtyDevice
+
+LOG = logging.getLogger(__name__)
+
+RESULT_SUCCESS = 'Success'
+RESULT_ERROR = 'Error'
+RESULT_SKIPPED = 'Skipped'
+
+# DEFAULT_BENCH_REPEAT_COUNT of the benchmark firmware
+BENCH_REPEAT_COUNT = 50
+
+# Pulse widths in seconds of the benchmarks of tests/periph_timer_benchmarks,
+# roughly ten timer calls on a 72 MHz Cortex-M3
+BENCH_PULSES = {
+    'bench_timer_read': 2.1e-6,
+    'bench_timer_write': 3.4e-6,
+    'bench_timer_set': 4.8e-6,
+    'bench_timer_clear': 2.9e-6,
+}
+
+# Latency from a timer match to the callback clearing DUT_IC
+CALLBACK_LATENCY = 1.6e-6
+
+
+def format_reply(cmd, data=None, result=RESULT_SUCCESS):
+    """Formats a reply line like print_cmd(), print_data_*() and print_result().
+
+    :param data:    List of strings, integers or {key: value} dicts
+    """
+    reply = {'cmd': cmd}
+    if data:
+        reply['data'] = data
+    reply['result'] = result
+    return json.dumps(reply, separators=(',', ':')) + '\n'
+
+
+class FakeDut(PtyDevice):
+    """DUT running a RIOT shell with the JSON parser of test_helpers.
+
+    Commands are looked up in a registry of handlers, see register(). The
+    benchmark commands of tests/periph_timer_benchmarks toggle the DUT_IC
+    line of the linked FakePhilip, their pulse widths follow LatencyModels.
+    Timeout benchmarks block for the duration of their pulse like the
+    firmware does.
+
+    :param philip:          FakePhilip recording the GPIO edges, or None
+    :param board:           Board name reported by get_metadata
+    :param application:     Application name reported by get_metadata, the
+                            APPLICATION checked by the test suites
+    :param response_delay:  LatencyModel of the command execution time
+    :param jitter:          Relative standard deviation of the pulse widths
+    :param outlier_rate:    Probability of a pulse being stretched by an
+                            interrupt
+    :param seed:            Seed of all random models
+    :param timer_channels:  Number of timer channels, bench_parallel_callbacks
+                            with more channels is skipped
+    """
+
+    def __init__(self, philip=None, board='sim-board', application='tests_periph_timer_benchmarks',
+                 response_delay=None, jitter=0.02, outlier_rate=0.01, seed=0, timer_channels=4):
+        super().__init__()
+        self.philip = philip
+        self.board = board
+        self.application = application
+        self.version = '2021.10-sim'
+        self.rng = np.random.default_rng(seed)
+        self.response_delay = response_delay or LatencyModel(0.0)
+        self.pulses = {name: LatencyModel(width, width * jitter, outlier_rate, rng=self.rng)
+                       for name, width in BENCH_PULSES.items()}
+        self.gap = LatencyModel(20e-6, 2e-6, rng=self.rng)
+        self.callback = LatencyModel(CALLBACK_LATENCY, CALLBACK_LATENCY * jitter, outlier_rate,
+                                     rng=self.rng)
+        self.timer_channels = int(timer_channels)
+        self.commands = 0
+        self._handlers = {}
+
+        self.register('get_metadata', self._get_metadata)
+        self.register('spin_timeout_ms', self._spin_timeout_ms)
+        self.register('bench_gpio_latency', self._bench_gpio_latency)
+        self.register('bench_absolute_timeout', self._bench_absolute_timeout)
+        self.register('bench_periodic_timeout', self._bench_periodic_timeout)
+        self.register('bench_parallel_callbacks', self._bench_parallel_callbacks)
+        for name in BENCH_PULSES:
+            for suffix in ('', '_uapi', '_hapi'):
+                self.register(name + suffix, self._bench(name))
+        if philip is not None:
+            philip.on_dut_reset = self.reset
+
+    def register(self, name, handler):
+        """Adds a shell command.
+
+        :param handler: Callable taking the command arguments as strings,
+                        returns a tuple (data, result)
+        """
+        self._handlers[name] = handler
+
+    def reset(self):
+        """Prints the boot message like a RIOT board after a reset."""
+        self.write("main(): This is RIOT! (Version: {})\n".format(self.version))
+
+    def handle_line(self, line):
+        args = line.split()
+        if not args:
+            return None
+        self.commands += 1
+        handler = self._handlers.get(args[0])
+        if handler is None:
+            # No JSON reply, clients run into their read timeout
+            return "shell: command not found: {}\n".format(args[0])
+
+        delay = self.response_delay.sample()
+        if delay:
+            time.sleep(delay)
+        try:
+            data, result = handler(*args[1:])
+        except (TypeError, ValueError):
+            data, result = None, RESULT_ERROR
+        return format_reply(args[0], data, result)
+
+    def toggle(self, widths, gap=None):
+        """Adds consecutive pulses on DUT_IC to the trace of the PHiLIP."""
+        if self.philip is None:
+            return
+        times, values = pulse_edges(widths, self.gap if gap is None else gap,
+                                    start=self.philip.now())
+        self.philip.add_edges(times, values)
+
+    def block(self, width):
+        """Adds a single pulse on DUT_IC and waits until it ends."""
+        self.toggle([width])
+        time.sleep(width)
+
+    def _get_metadata(self):
+        return [self.board, self.version, time.strftime('%a %b %d %H:%M:%S %Y'),
+                self.application, 72000000, 1, 0, 1000000], RESULT_SUCCESS
+
+    def _bench(self, name):
+        def bench():
+            self.toggle(self.pulses[name].sample(BENCH_REPEAT_COUNT))
+            return None, RESULT_SUCCESS
+        return bench
+
+    def _bench_gpio_latency(self, timeout_us='1'):
+        timeout = float(timeout_us) * 1e-6
+        latency = LatencyModel(timeout + 0.3e-6, 0.02e-6, rng=self.rng)
+        self.toggle(latency.sample(BENCH_REPEAT_COUNT))
+        return None, RESULT_SUCCESS
+
+    def _bench_absolute_timeout(self, freq, ticks):
+        self.block(int(ticks) / int(freq) + self.callback.sample())
+        return None, RESULT_SUCCESS
+
+    def _bench_periodic_timeout(self, freq, ticks, cycles):
+        # The timer resets on match, only the last callback adds to the pulse
+        self.block(int(ticks) * int(cycles) / int(freq) + self.callback.sample())
+        return None, RESULT_SUCCESS
+
+    def _bench_parallel_callbacks(self, freq, ticks, channels):
+        channels = int(channels)
+        if channels > self.timer_channels:
+            return None, RESULT_SKIPPED
+        # Callbacks of simultaneous matches run one after another
+        self.block(int(ticks) / int(freq) + float(np.sum(self.callback.sample(channels))))
+        return None, RESULT_SUCCESS
+
+    def _spin_timeout_ms(self, timeout_ms):
+        self.block(float(timeout_ms) * 1e-3 * (1 + 1e-4 * self.rng.normal()))
+        return None, RESULT_SUCCESS
@@ -0,0 +1,55 @@
+"""Latency and jitter models of simulated hardware."""
+import numpy as np
+
+
+class LatencyModel:
+    """Random durations with a fixed base, normal jitter and rare outliers.
+
+    :param base:            Mean duration in seconds
+    :param jitter:          Standard deviation of the jitter in seconds
+    :param outlier_rate:    Probability of a sample being an outlier
+    :param outlier_scale:   Outliers take outlier_scale times as long
+    :param rng:             numpy Generator, seeded per model if None
+    """
+
+    def __init__(self, base, jitter=0.0, outlier_rate=0.0, outlier_scale=10.0, rng=None):
+        self.base = float(base)
+        self.jitter = float(jitter)
+        self.outlier_rate = float(outlier_rate)
+        self.outlier_scale = float(outlier_scale)
+        self.rng = rng if rng is not None else np.random.default_rng(0)
+
+    def sample(self, count=None):
+        """Returns a duration, or an array of count durations."""
+        size = 1 if count is None else int(count)
+        durations = np.full(size, self.base)
+        if self.jitter:
+            durations += self.rng.normal(0.0, self.jitter, size)
+        if self.outlier_rate:
+            outliers = self.rng.random(size) < self.outlier_rate
+            durations[outliers] *= self.outlier_scale
+        durations = np.maximum(durations, 0.0)
+        return float(durations[0]) if count is None else durations
+
+    def to_dict(self):
+        return dict(base=self.base, jitter=self.jitter, outlier_rate=self.outlier_rate,
+                    outlier_scale=self.outlier_scale)
+
+
+def pulse_edges(widths, gap, start=0.0):
+    """Returns the edge times of consecutive pulses.
+
+    :param widths:  Array of pulse widths (rising to falling edge)
+    :param gap:     LatencyModel of the time between pulses, or a constant
+
+    :return: Tuple (times, values), values 1 for rising and 0 for falling
+    """
+    widths = np.asarray(widths, dtype=np.float64)
+    count = len(widths)
+    gaps = gap.sample(count) if isinstance(gap, LatencyModel) else np.full(count, float(gap))
+    rising = start + np.concatenate(([0.0], np.cumsum(widths + gaps)[:-1]))
+    times = np.empty(2 * count)
+    times[0::2] = rising
+    times[1::2] = rising + widths
+    values = np.tile([1, 0], count)
+    return times, values
@@ -0,0 +1,158 @@
+"""Fake PHiLIP speaking the philip_pal serial protocol."""
+import csv
+import errno
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import philip_pal
+
+from .pty_device import PtyDevice
+
+LOG = logging.getLogger(__name__)
+
+VERSION = "1.2.0"
+SYS_CLK = 72000000
+
+# Codes of trace.source and trace.value, see PhilipExtIf.read_trace()
+TRACE_SOURCES = {'DEBUG0': 1, 'DEBUG1': 2, 'DEBUG2': 3, 'DUT_IC': 4}
+
+_TYPES = {1: '<u1', 2: '<u2', 4: '<u4', 8: '<u8'}
+
+# Largest read replied without overflowing the output buffer of PHiLIP, the
+# 48 entries of trace.tick Phil.read_trace() reads at once
+MAX_READ_SIZE = 4 * (32 + 16)
+
+
+def load_mem_map(version=VERSION):
+    """Returns the memory map shipped with philip_pal as {name: record}."""
+    path = (Path(philip_pal.__file__).parent / "mem_map" /
+            "PHiLIP_map_t_{}.csv".format(version.replace('.', '_')))
+    with open(path) as csvfile:
+        return {row['name']: row for row in csv.DictReader(csvfile, quotechar="'")}
+
+
+class FakePhilip(PtyDevice):
+    """PHiLIP with a register map and an edge trace ring buffer.
+
+    Only the registers used by the tests are emulated: the user registers,
+    the system registers and the trace of DUT_IC/DEBUG edges. Edges are
+    added by add_edges(), usually by a FakeDut toggling its benchmark GPIO.
+    Writing sys.mode.dut_rst and executing the changes calls on_dut_reset.
+
+    :param version:     Memory map version reported to philip_pal
+    :param sys_clk:     System clock in Hz, the resolution of the trace
+    """
+
+    def __init__(self, version=VERSION, sys_clk=SYS_CLK):
+        super().__init__()
+        self.version = version
+        self.sys_clk = int(sys_clk)
+        self.mem_map = load_mem_map(version)
+        self.on_dut_reset = None
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._records = list(self.mem_map.values())
+        self._size = max(int(r['offset']) + int(r['total_size'] or r['type_size'])
+                         for r in self._records)
+        self._dut_in_reset = False
+        self.reset()
+
+    def _view(self, name):
+        """Returns a numpy view on a register of the memory."""
+        record = self.mem_map[name]
+        offset = int(record['offset'])
+        count = int(record['array_size'] or 1)
+        return np.frombuffer(self.memory, dtype=_TYPES[int(record['type_size'])],
+                             count=count, offset=offset)
+
+    def reset(self):
+        """Restores the registers after a reset, clears the trace."""
+        with self._lock:
+            self.memory = bytearray(self._size)
+            self._view('user_reg')[:] = np.arange(256)
+            self._view('sys.fw_rev')[:3] = [int(v) for v in self.version.split('.')]
+            self._view('sys.if_rev')[:3] = [int(v) for v in self.version.split('.')]
+            self._view('sys.sys_clk')[0] = self.sys_clk
+            self._start = time.monotonic()
+            self._ring = self._view('trace.tick').size
+
+    def now(self):
+        """Returns the trace time in seconds, zero at the last reset."""
+        return time.monotonic() - self._start
+
+    def add_edges(self, times, values, source='DUT_IC'):
+        """Adds edges to the trace ring buffer.
+
+        :param times:   Times of the edges in seconds since the reset
+        :param values:  1 for rising, 0 for falling edges
+        :param source:  Trace source, see TRACE_SOURCES
+        """
+        ticks = np.round(np.asarray(times, dtype=np.float64) * self.sys_clk).astype(np.uint64)
+        # The tick register is 32 bit, shift longer times by tick_div
+        divs = np.zeros(len(ticks), dtype=np.uint8)
+        while np.any(ticks >> divs.astype(np.uint64) > 0xFFFFFFFF):
+            divs[ticks >> divs.astype(np.uint64) > 0xFFFFFFFF] += 1
+        ticks = ticks >> divs.astype(np.uint64)
+
+        with self._lock:
+            index = self._view('trace.index')
+            slots = (int(index[0]) + np.arange(len(ticks))) % self._ring
+            self._view('trace.tick')[slots] = ticks
+            self._view('trace.tick_div')[slots] = divs
+            self._view('trace.source')[slots] = TRACE_SOURCES[source]
+            self._view('trace.value')[slots] = values
+            index[0] = (int(index[0]) + len(ticks)) % self._ring
+
+    def handle_line(self, line):
+        args = line.split()
+        if not args:
+            return None
+        self.commands += 1
+        handler = getattr(self, "_cmd_{}".format(args[0]), None)
+        try:
+            reply = handler(*args[1:]) if handler else {'result': errno.EPROTONOSUPPORT}
+        except (TypeError, ValueError, IndexError):
+            reply = {'result': errno.EINVAL}
+        return json.dumps(reply, separators=(',', ':')) + '\n'
+
+    def _cmd_version(self):
+        return {'version': self.version, 'result': 0}
+
+    def _cmd_rr(self, index, size=1):
+        index, size = int(index), int(size)
+        if index < 0 or size < 1 or index + size > self._size or size > MAX_READ_SIZE:
+            return {'result': errno.EOVERFLOW}
+        with self._lock:
+            return {'data': list(self.memory[index:index + size]), 'result': 0}
+
+    def _cmd_wr(self, index, *data):
+        index = int(index)
+        if index < 0 or index + len(data) > self._size:
+            return {'result': errno.EOVERFLOW}
+        with self._lock:
+            self.memory[index:index + len(data)] = bytes(int(b) for b in data)
+        return {'result': 0}
+
+    def _cmd_ex(self):
+        record = self.mem_map['sys.mode.dut_rst']
+        in_reset = bool(self.memory[int(record['offset'])] >> int(record['bit_offset']) & 1)
+        if self._dut_in_reset and not in_reset and self.on_dut_reset:
+            self.on_dut_reset()
+        self._dut_in_reset = in_reset
+        return {'result': 0}
+
+    def _cmd_mcu_rst(self):
+        self.reset()
+        return {'result': 0}
+
+    def _cmd_mm_size(self):
+        return {'data': len(self._records), 'result': 0}
+
+    def _cmd_mm(self, index):
+        record = {key: value for key, value in self._records[int(index)].items() if value}
+        return dict(record, result=0)
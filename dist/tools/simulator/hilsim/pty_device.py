@@ -0,0 +1,99 @@
+"""Line based fake serial device on a pseudo terminal."""
+import logging
+import os
+import select
+import threading
+import tty
+
+LOG = logging.getLogger(__name__)
+
+
+class PtyDevice:
+    """Serves a line based protocol on the slave side of a pseudo terminal.
+
+    Clients open `port` like a serial port (e.g. with pyserial). Every line
+    they write is passed to handle_line(), its return value (if any) is
+    written back. Subclasses may also write unsolicited output with write().
+    """
+
+    def __init__(self):
+        self._master, self._slave = os.openpty()
+        # No echo and no newline translation, like a USB CDC ACM port
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._links = []
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """Starts serving the port from a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="{}-{}".format(type(self).__name__, self.port))
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stops serving and closes the pseudo terminal."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for link in self._links:
+            if os.path.islink(link):
+                os.unlink(link)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def link(self, path):
+        """Creates a symlink to the port, e.g. to use a fixed DUT_PORT."""
+        if os.path.islink(path):
+            os.unlink(path)
+        os.symlink(self.port, path)
+        self._links.append(path)
+        return path
+
+    def write(self, text):
+        """Writes text to the client."""
+        data = text.encode('utf-8')
+        with self._write_lock:
+            while data:
+                data = data[os.write(self._master, data):]
+
+    def handle_line(self, line):
+        """Handles a line received from the client, returns the reply."""
+        raise NotImplementedError()
+
+    def _run(self):
+        pending = b''
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                # The client closed the port, wait for it to reopen
+                continue
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                line = line.decode('utf-8', errors='replace').strip('\r\0')
+                try:
+                    reply = self.handle_line(line)
+                except Exception:  # Keep serving, a real device would too
+                    LOG.exception("%s: failed to handle %r", self.port, line)
+                    continue
+                if reply:
+                    self.write(reply)
@@ -0,0 +1,39 @@
+"""A fake DUT wired to a fake PHiLIP."""
+from .dut import FakeDut
+from .philip import FakePhilip
+
+
+class Simulator:
+    """Serves a FakeDut and a FakePhilip sharing the DUT_IC line.
+
+    Keyword arguments are passed to FakeDut. Use it as context manager or
+    call start() and close().
+    """
+
+    def __init__(self, dut_link=None, philip_link=None, **dut_kwargs):
+        self.philip = FakePhilip()
+        self.dut = FakeDut(self.philip, **dut_kwargs)
+        if dut_link:
+            self.dut.link(dut_link)
+        if philip_link:
+            self.philip.link(philip_link)
+
+    @property
+    def ports(self):
+        """Ports of the devices as {'dut': port, 'philip': port}."""
+        return {'dut': self.dut.port, 'philip': self.philip.port}
+
+    def start(self):
+        self.philip.start()
+        self.dut.start()
+        return self
+
+    def close(self):
+        self.dut.close()
+        self.philip.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
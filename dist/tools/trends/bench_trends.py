@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Keeps the benchmark results of all nights in a SQLite database.
+
+`ingest` loads a results directory with the layout
+<dir>/<board>/<testsuite>/xunit.xml and the metadata.xml written by
+env_parser.py. Every run is keyed by the RIOT and RobotFW-Tests commits found
+in the metadata, ingesting the same run again replaces it.
+
+Every benchmark property (lists of samples or recorded statistics dicts) is
+stored as the summary of BenchStats, including its quantile sketch, so several
+runs of the same commit are merged when querying. Scalar properties of a
+testcase (e.g. timer-count) are stored as the parameters of its benchmarks.
+
+`query` prints a statistic of the benchmarks matching a board and metric over
+the last commits, e.g. the median ztimer set accuracy on nucleo-f767zi:
+
+    bench_trends.py query --board nucleo-f767zi \
+        --suite tests_ztimer_benchmarks --metric 'accuracy-TIMER_SET-*' --stat p50
+
+The same is available as TrendDB.history() for other tools.
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import xml.etree.ElementTree as ET
+from ast import literal_eval
+from pathlib import Path
+
+import numpy as np
+
+# The statistics and trace encoding are shared with the RobotFramework libraries
+sys.path.append(str(Path(__file__).resolve().parents[2] / "robotframework" / "lib"))
+from bench_stats import BenchStats, merge_stats  # noqa: E402
+from trace_encoding import is_encoded_trace  # noqa: E402
+
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'fatal', 'critical')
+
+XUNIT_FILE = "xunit.xml"
+METADATA_FILE = "metadata.xml"
+TESTSUITE_PATTERN = r"^tests_.*_benchmarks$"
+IGNORED_PROPERTIES = ('trace', 'adaptive_ci')
+# Command round trip times of the test setup, see CommandTimings
+IGNORED_PROPERTY_PREFIXES = ('cmd-timing-',)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    riot_commit TEXT NOT NULL,
+    riot_commit_timestamp TEXT,
+    riot_branch TEXT,
+    rf_commit TEXT NOT NULL,
+    ingested TEXT NOT NULL,
+    UNIQUE (name, riot_commit, rf_commit)
+);
+CREATE INDEX IF NOT EXISTS runs_commit ON runs (riot_commit);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (riot_commit_timestamp);
+CREATE TABLE IF NOT EXISTS benchmarks (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    board TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    testcase TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    params TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    mean REAL,
+    stdev REAL,
+    min REAL,
+    max REAL,
+    p50 REAL,
+    p99 REAL,
+    stats TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS benchmarks_metric
+    ON benchmarks (board, metric, suite, testcase);
+CREATE INDEX IF NOT EXISTS benchmarks_run ON benchmarks (run_id);
+"""
+
+
+def _parse_value(value):
+    try:
+        return json.loads(value.replace("'", "\""))
+    except ValueError:
+        try:
+            return literal_eval(value)
+        except (ValueError, TypeError, SyntaxError, MemoryError):
+            return value
+
+
+def parse_property(value):
+    """Classifies a recorded property value.
+
+    :return: BenchStats for samples and statistics dicts, the value for
+             scalars (parameters), None for anything else
+    """
+    if is_encoded_trace(value):
+        return None
+    parsed = _parse_value(value)
+    if isinstance(parsed, dict):
+        if 'sketch' in parsed:
+            return BenchStats.from_dict(parsed)
+        if 'values' in parsed:
+            parsed = parsed['values']
+        else:
+            return None
+    if isinstance(parsed, (str, int, float, bool)):
+        return parsed
+    try:
+        samples = np.asarray(parsed, dtype=np.float64).ravel()
+    except (ValueError, TypeError):
+        return None
+    samples = samples[np.isfinite(samples)]
+    return BenchStats.from_values(samples) if len(samples) else None
+
+
+def read_metadata(path):
+    """Returns the commits of a metadata.xml written by env_parser.py.
+
+    Both the nested (<RIOT><commit_id>) and the flattened (<RIOT_commit_id>)
+    format are supported.
+    """
+    root = ET.parse(path).getroot()
+
+    def value(repo, key):
+        elem = root.find("{}/{}".format(repo, key))
+        if elem is None:
+            elem = root.find("{}_{}".format(repo, key))
+        return elem.text if elem is not None else None
+
+    return {
+        'riot_commit': value('RIOT', 'commit_id'),
+        'riot_commit_timestamp': value('RIOT', 'commit_timestamp'),
+        'riot_branch': value('RIOT', 'branch_name'),
+        'rf_commit': value('RobotFW-Tests', 'commit_id'),
+    }
+
+
+def read_benchmarks(xunit_file, testsuite_pattern=TESTSUITE_PATTERN):
+    """Yields the benchmarks of a xunit file.
+
+    The file is parsed testcase by testcase, so large properties of finished
+    testcases are released early.
+
+    :return: Iterator of (suite, testcase, metric, params, BenchStats)
+    """
+    suite = None
+    for event, elem in ET.iterparse(xunit_file, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'testsuite' and suite is None:
+                suite = elem.get('name') or ''
+            continue
+        if elem.tag != 'testcase':
+            continue
+        if not re.match(testsuite_pattern, suite) \
+                or elem.find('skipped') is not None:
+            elem.clear()
+            continue
+
+        params = {}
+        metrics = {}
+        for prop in elem.iter('property'):
+            name = prop.get('name')
+            if name is None or name in IGNORED_PROPERTIES \
+                    or name.startswith(IGNORED_PROPERTY_PREFIXES):
+                continue
+            parsed = parse_property(prop.get('value', ''))
+            if isinstance(parsed, BenchStats):
+                # Repeated properties (e.g. of benchmark repeats) are merged
+                metrics.setdefault(name, BenchStats(parsed.sketch.alpha)).merge(parsed)
+            elif parsed is not None:
+                params[name] = parsed
+        for name, stats in metrics.items():
+            yield suite, elem.get('name'), name, params, stats
+        elem.clear()
+
+
+class TrendDB:
+    """SQLite database of benchmark results over RIOT commits."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def ingest(self, directory, name=None, metadata=None,
+               testsuite_pattern=TESTSUITE_PATTERN):
+        """Adds the results of a directory, replacing an earlier ingest.
+
+        :param name:        Name of the run, defaults to the directory name
+        :param metadata:    Commits overriding the ones in metadata.xml, see
+                            read_metadata()
+
+        :return: Number of benchmarks added
+        """
+        directory = Path(directory)
+        meta_file = directory / METADATA_FILE
+        meta = read_metadata(meta_file) if meta_file.is_file() else {}
+        meta.update({k: v for k, v in (metadata or {}).items() if v})
+        if not meta.get('riot_commit'):
+            raise ValueError("No RIOT commit for {}, pass it explicitly".format(directory))
+        meta['rf_commit'] = meta.get('rf_commit') or ''
+        name = name or directory.resolve().name
+
+        count = 0
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM runs WHERE name = ? AND riot_commit = ? AND rf_commit = ?",
+                (name, meta['riot_commit'], meta['rf_commit']))
+            run_id = self.conn.execute(
+                "INSERT INTO runs (name, riot_commit, riot_commit_timestamp, riot_branch, "
+                "rf_commit, ingested) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, meta['riot_commit'], meta.get('riot_commit_timestamp'),
+                 meta.get('riot_branch'), meta['rf_commit'],
+                 datetime.datetime.now().isoformat(timespec='seconds'))).lastrowid
+
+            for xunit in sorted(directory.glob("*/*/" + XUNIT_FILE)):
+                board = xunit.parent.parent.name
+                rows = []
+                for suite, testcase, metric, params, stats in read_benchmarks(
+                        xunit, testsuite_pattern):
+                    rows.append((run_id, board, suite, testcase, metric,
+                                 json.dumps(params, sort_keys=True), stats.count,
+                                 stats.mean, stats.stdev, stats.min, stats.max,
+                                 stats.percentile(50), stats.percentile(99),
+                                 json.dumps(stats.to_dict())))
+                self.conn.executemany(
+                    "INSERT INTO benchmarks VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                logging.debug("%s: %d benchmarks", xunit, len(rows))
+                count += len(rows)
+        return count
+
+    def commits(self, last=None):
+        """Returns the RIOT commits in the database, oldest first."""
+        query = ("SELECT riot_commit, MIN(riot_commit_timestamp) AS timestamp "
+                 "FROM runs GROUP BY riot_commit "
+                 "ORDER BY timestamp DESC, MAX(id) DESC")
+        args = ()
+        if last:
+            query += " LIMIT ?"
+            args = (int(last),)
+        return [row['riot_commit'] for row in self.conn.execute(query, args)][::-1]
+
+    def history(self, board, metric, suite=None, testcase=None, last=None,
+                statistic='mean'):
+        """Returns a statistic of matching benchmarks over the last commits.
+
+        All runs of a commit are merged. Metric, suite and testcase are glob
+        patterns.
+
+        :param last:        Number of commits, None for all
+        :param statistic:   'mean', 'stdev', 'min', 'max', 'samples' or a
+                            percentile like 'p99'
+
+        :return: List of dicts with commit, timestamp, suite, testcase,
+                 metric, params, runs, samples and value, oldest first
+        """
+        commits = self.commits(last)
+        if not commits:
+            return []
+
+        query = ("SELECT r.riot_commit, MIN(r.riot_commit_timestamp) AS timestamp, "
+                 "b.suite, b.testcase, b.metric, b.params, "
+                 "COUNT(*) AS runs, GROUP_CONCAT(b.stats, char(10)) AS stats "
+                 "FROM benchmarks b JOIN runs r ON r.id = b.run_id "
+                 "WHERE b.board = ? AND b.metric GLOB ? "
+                 "AND r.riot_commit IN ({})".format(", ".join("?" * len(commits))))
+        args = [board, metric] + commits
+        for column, pattern in (('suite', suite), ('testcase', testcase)):
+            if pattern:
+                query += " AND b.{} GLOB ?".format(column)
+                args.append(pattern)
+        query += " GROUP BY r.riot_commit, b.suite, b.testcase, b.metric, b.params"
+
+        order = {commit: i for i, commit in enumerate(commits)}
+        history = []
+        for row in self.conn.execute(query, args):
+            stats = merge_stats(json.loads(s) for s in row['stats'].split("\n"))
+            history.append({
+                'commit': row['riot_commit'],
+                'timestamp': row['timestamp'],
+                'suite': row['suite'],
+                'testcase': row['testcase'],
+                'metric': row['metric'],
+                'params': json.loads(row['params']),
+                'runs': row['runs'],
+                'samples': stats.count,
+                'value': statistic_value(stats, statistic),
+            })
+        history.sort(key=lambda h: (order[h['commit']], h['suite'], h['testcase'],
+                                    h['metric'], json.dumps(h['params'])))
+        return history
+
+
+def statistic_value(stats, statistic):
+    """Returns a statistic of a BenchStats instance by name."""
+    if statistic in ('mean', 'avg'):
+        return stats.mean
+    if statistic in ('stdev', 'min', 'max'):
+        return getattr(stats, statistic)
+    if statistic == 'samples':
+        return stats.count
+    if re.match(r"^p\d+(\.\d+)?$", statistic):
+        return stats.percentile(float(statistic[1:]))
+    raise ValueError("Unknown statistic {!r}".format(statistic))
+
+
+def _print_history(history, fmt, out=sys.stdout):
+    columns = ('commit', 'timestamp', 'suite', 'testcase', 'metric', 'params',
+               'runs', 'samples', 'value')
+    if fmt == 'json':
+        json.dump(history, out, indent=2)
+        out.write("\n")
+        return
+    rows = [[json.dumps(entry['params'], sort_keys=True) if c == 'params' else entry[c]
+             for c in columns] for entry in history]
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        return
+    for row in [columns] + rows:
+        out.write("\t".join(str(c) for c in row) + "\n")
+
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__.splitlines()[0],
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+PARSER.add_argument('--db', default='bench_trends.sqlite',
+                    help='Path of the SQLite database')
+PARSER.add_argument('--loglevel', choices=LOG_LEVELS, default='info',
+                    help='Python logger log level')
+SUBPARSERS = PARSER.add_subparsers(dest='command', required=True)
+
+INGEST_PARSER = SUBPARSERS.add_parser('ingest', help='Add results directories')
+INGEST_PARSER.add_argument('results', nargs='+', help='Results directories')
+INGEST_PARSER.add_argument('--name', default=None,
+                           help='Name of the run, defaults to the directory name')
+INGEST_PARSER.add_argument('--riot-commit', default=None,
+                           help='RIOT commit, overrides metadata.xml')
+INGEST_PARSER.add_argument('--riot-commit-timestamp', default=None,
+                           help='RIOT commit timestamp, overrides metadata.xml')
+INGEST_PARSER.add_argument('--rf-commit', default=None,
+                           help='RobotFW-Tests commit, overrides metadata.xml')
+INGEST_PARSER.add_argument('--testsuites', default=TESTSUITE_PATTERN,
+                           help='Regex selecting the testsuites to ingest')
+
+QUERY_PARSER = SUBPARSERS.add_parser('query', help='Print the history of a metric')
+QUERY_PARSER.add_argument('--board', required=True, help='Board name')
+QUERY_PARSER.add_argument('--metric', required=True,
+                          help='Glob pattern of the benchmark property')
+QUERY_PARSER.add_argument('--suite', default=None, help='Glob pattern of the testsuite')
+QUERY_PARSER.add_argument('--testcase', default=None, help='Glob pattern of the testcase')
+QUERY_PARSER.add_argument('--last', type=int, default=None,
+                          help='Number of most recent commits')
+QUERY_PARSER.add_argument('--stat', default='mean',
+                          help="'mean', 'stdev', 'min', 'max', 'samples' or a percentile "
+                               "like 'p99'")
+QUERY_PARSER.add_argument('--format', choices=('table', 'csv', 'json'), default='table',
+                          help='Output format')
+
+
+def main(args):
+    """Ingest results or query the database, returns the exit status."""
+    if args.loglevel:
+        loglevel = logging.getLevelName(args.loglevel.upper())
+        logging.basicConfig(level=loglevel)
+
+    db = TrendDB(args.db)
+    try:
+        if args.command == 'ingest':
+            meta = {'riot_commit': args.riot_commit,
+                    'riot_commit_timestamp': args.riot_commit_timestamp,
+                    'rf_commit': args.rf_commit}
+            for results in args.results:
+                if not os.path.isdir(results):
+                    logging.error("%s is not a directory", results)
+                    return 1
+                count = db.ingest(results, args.name, meta, args.testsuites)
+                logging.info("Ingested %d benchmarks from %s", count, results)
+        else:
+            history = db.history(args.board, args.metric, args.suite, args.testcase,
+                                 args.last, args.stat)
+            if not history:
+                logging.error("No matching benchmarks")
+                return 1
+            _print_history(history, args.format)
+    except ValueError as exc:
+        logging.error("%s", exc)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(PARSER.parse_args()))
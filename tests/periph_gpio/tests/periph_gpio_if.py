@@ -6,10 +6,10 @@
 """@package PyToAPI
 This module handles parsing of information from RIOT periph_gpio test.
 """
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 
 
-class PeriphGpioIf(DutShell):
+class PeriphGpioIf(PipelinedDutShell):
     """Interface to the a node with periph_i2c firmware."""
 
     FW_ID = 'periph_gpio'
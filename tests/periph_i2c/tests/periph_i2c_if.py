@@ -8,10 +8,10 @@ This module handles parsing of information from RIOT periph_i2c test.
 """
 import logging
 
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 
 
-class PeriphI2cIf(DutShell):
+class PeriphI2cIf(PipelinedDutShell):
     """Interface to the a node with periph_i2c firmware."""
 
     FW_ID = 'periph_i2c'
@@ -8,10 +8,10 @@ This module handles parsing of information from RIOT periph_spi test.
 """
 import logging
 
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 
 
-class PeriphSpiIf(DutShell):
+class PeriphSpiIf(PipelinedDutShell):
     """Interface to the a node with periph_spi firmware."""
 
     def spi_init(self, dev):
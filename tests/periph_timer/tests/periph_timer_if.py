@@ -8,10 +8,10 @@ This module handles parsing of information from RIOT periph_timer_cli test.
 """
 import logging
 
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 
 
-class PeriphTimerIf(DutShell):
+class PeriphTimerIf(PipelinedDutShell):
     """Interface to the a node with periph_timer_cli firmware."""
 
     FW_ID = 'periph_timer_cli'
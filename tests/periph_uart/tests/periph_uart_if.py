@@ -8,10 +8,10 @@ This module handles parsing of information from RIOT periph_uart test.
 """
 import logging
 
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 
 
-class PeriphUartIf(DutShell):
+class PeriphUartIf(PipelinedDutShell):
     """Interface to the node with periph_uart firmware."""
 
     FW_ID = 'periph_uart'
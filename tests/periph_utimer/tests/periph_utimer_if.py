@@ -9,10 +9,10 @@ This module handles parsing of information from RIOT periph_utimer_cli test.
 """
 import logging
 
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 
 
-class PeriphUTimerIf(DutShell):
+class PeriphUTimerIf(PipelinedDutShell):
     """Interface to the a node with periph_utimer_cli firmware."""
 
     FW_ID = 'periph_utimer'
@@ -6,13 +6,13 @@
 """@package PyToAPI
 This module handles parsing of information from RIOT periph_gpio test.
 """
-from riot_pal import DutShell
+from dut_pipeline import PipelinedDutShell
 from robot.api import logger
 from robot.version import get_version
 from ast import literal_eval
 
 
-class DutDeviceIf(DutShell):
+class DutDeviceIf(PipelinedDutShell):
     """Interface to the node."""
 
     ROBOT_LIBRARY_SCOPE = "TEST"
@@ -60,11 +60,11 @@ class DutDeviceIf(DutShell):
 
     def sleep_jitter(self, timer_count):
         """Run the sleep jitter benchmark"""
-        return self.cmd_extended_timeout("sleep_jitter {}".format(timer_count), 10)
+        return self.send_cmd("sleep_jitter {}".format(timer_count), timeout=10)
 
     def drift(self, duration):
         """Run the drift simple benchmark"""
-        return self.cmd_extended_timeout("drift {}".format(duration), 75)
+        return self.send_cmd("drift {}".format(duration), timeout=75)
 
     def list_operation(self, count):
         """Set N timers"""
@@ -72,13 +72,6 @@ class DutDeviceIf(DutShell):
 
     ## HELPER FUNCTIONS
 
-    def cmd_extended_timeout(self, command, timeout):
-        old_timeout = self.dev._driver._dev.timeout
-        self.dev._driver._dev.timeout = timeout
-        res = self.send_cmd(command)
-        self.dev._driver._dev.timeout = old_timeout
-        return res
-
     def get_dict_data(self, data, key):
         """Get data from dict"""
         assert isinstance(data, list)